@@ -0,0 +1,360 @@
+"""In-memory stand-in for the Firestore client used by FirestoreService.
+
+It implements the subset of the google-cloud-firestore API that FirestoreService
+calls, so benchmarks exercise the real service code (validation, caching,
+batching, pagination) without a network. Every round-trip sleeps for a
+configurable latency to model Firestore's network cost.
+"""
+import functools
+import random
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional
+
+from google.api_core import exceptions as google_exceptions
+
+DOCUMENT_ID = '__name__'
+
+
+class FakeSnapshot:
+    def __init__(self, reference: "FakeDocumentReference", data: Optional[Dict[str, Any]]):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self) -> Optional[Dict[str, Any]]:
+        return dict(self._data) if self._data is not None else None
+
+
+class FakeDocumentReference:
+    def __init__(self, client: "FakeFirestoreClient", collection_path: str, doc_id: str):
+        self._client = client
+        self._collection_path = collection_path
+        self.id = doc_id
+        self.path = f"{collection_path}/{doc_id}"
+
+    def collection(self, name: str) -> "FakeCollectionReference":
+        return FakeCollectionReference(self._client, f"{self.path}/{name}")
+
+    def get(self, field_paths: Optional[Iterable[str]] = None,
+            transaction: Optional["FakeTransaction"] = None) -> FakeSnapshot:
+        self._client._round_trip()
+        if transaction is not None:
+            transaction._read(self)
+        return self._client._snapshot(self, field_paths)
+
+    def set(self, data: Dict[str, Any], merge: bool = False) -> None:
+        self._client._round_trip()
+        self._client._write(self, data, merge)
+
+    def update(self, data: Dict[str, Any]) -> None:
+        self._client._round_trip()
+        self._client._write(self, data, True)
+
+    def create(self, data: Dict[str, Any]) -> None:
+        self._client._round_trip()
+        self._client._create(self, data)
+
+    def on_snapshot(self, callback):
+        # No realtime updates offline; callers fall back to TTL-based caching
+        raise NotImplementedError("Snapshot listeners are not supported by the in-memory client")
+
+
+class FakeQuery:
+    def __init__(self, client: "FakeFirestoreClient", collection_path: str):
+        self._client = client
+        self._collection_path = collection_path
+        self._filters = []
+        self._orders = []
+        self._limit = None
+        self._start_after = None
+        self._fields = None
+
+    def _copy(self) -> "FakeQuery":
+        query = FakeQuery(self._client, self._collection_path)
+        query.__dict__.update({key: value for key, value in self.__dict__.items()})
+        query._filters = list(self._filters)
+        query._orders = list(self._orders)
+        return query
+
+    def where(self, filter=None) -> "FakeQuery":
+        query = self._copy()
+        query._filters.append((filter.field_path, filter.op_string, filter.value))
+        return query
+
+    def order_by(self, field_path, direction: str = 'ASCENDING') -> "FakeQuery":
+        query = self._copy()
+        query._orders.append((str(field_path), direction == 'DESCENDING'))
+        return query
+
+    def limit(self, count: int) -> "FakeQuery":
+        query = self._copy()
+        query._limit = count
+        return query
+
+    def start_after(self, values: Dict[str, Any]) -> "FakeQuery":
+        query = self._copy()
+        query._start_after = values
+        return query
+
+    def select(self, field_paths: Iterable[str]) -> "FakeQuery":
+        query = self._copy()
+        query._fields = list(field_paths)
+        return query
+
+    def _matches(self, doc_id: str, data: Dict[str, Any]) -> bool:
+        for field, op, value in self._filters:
+            actual = doc_id if field == DOCUMENT_ID else data.get(field)
+            if op == '==' and actual != value:
+                return False
+            if op == 'in' and actual not in value:
+                return False
+        return True
+
+    def _order_fields(self):
+        orders = list(self._orders)
+        if not any(field == DOCUMENT_ID for field, _ in orders):
+            # Firestore breaks ties by document ID in the direction of the last ordering
+            orders.append((DOCUMENT_ID, orders[-1][1] if orders else False))
+        return orders
+
+    @staticmethod
+    def _value(doc_id: str, data: Dict[str, Any], field: str):
+        return doc_id if field == DOCUMENT_ID else data.get(field)
+
+    def _compare(self, a, b) -> int:
+        for field, descending in self._order_fields():
+            left, right = self._value(*a, field), self._value(*b, field)
+            if left == right:
+                continue
+            result = -1 if left < right else 1
+            return -result if descending else result
+        return 0
+
+    def stream(self) -> Iterable[FakeSnapshot]:
+        self._client._round_trip()
+        with self._client._lock:
+            items = list(self._client._collections.get(self._collection_path, {}).items())
+        items = [item for item in items if self._matches(*item)]
+        # Like Firestore, documents without an ordered field are left out
+        items = [item for item in items
+                 if all(field == DOCUMENT_ID or field in item[1] for field, _ in self._orders)]
+        items.sort(key=functools.cmp_to_key(self._compare))
+        if self._start_after is not None:
+            cursor = self._start_after
+            cursor_data = {field: value for field, value in cursor.items() if field != DOCUMENT_ID}
+            cursor_item = (cursor.get(DOCUMENT_ID), cursor_data)
+            items = [item for item in items if self._compare(item, cursor_item) > 0]
+        if self._limit is not None:
+            items = items[:self._limit]
+        for doc_id, data in items:
+            ref = FakeDocumentReference(self._client, self._collection_path, doc_id)
+            yield FakeSnapshot(ref, _project(data, self._fields))
+
+    def get(self) -> List[FakeSnapshot]:
+        return list(self.stream())
+
+
+class FakeCollectionReference(FakeQuery):
+    def document(self, doc_id: Optional[str] = None) -> FakeDocumentReference:
+        if doc_id is None:
+            doc_id = '%020x' % random.getrandbits(80)
+        return FakeDocumentReference(self._client, self._collection_path, doc_id)
+
+    def add(self, data: Dict[str, Any]):
+        ref = self.document()
+        ref.set(data)
+        return None, ref
+
+
+class FakeWriteBatch:
+    def __init__(self, client: "FakeFirestoreClient"):
+        self._client = client
+        self._writes = []
+
+    def set(self, ref: FakeDocumentReference, data: Dict[str, Any], merge: bool = False) -> None:
+        self._writes.append((ref, data, merge))
+
+    def delete(self, ref: FakeDocumentReference) -> None:
+        self._writes.append((ref, None, False))
+
+    def commit(self) -> None:
+        self._client._round_trip()
+        for ref, data, merge in self._writes:
+            if data is None:
+                self._client._delete(ref)
+            else:
+                self._client._write(ref, data, merge)
+        self._writes = []
+
+
+class FakeTransaction(FakeWriteBatch):
+    """Optimistic transaction: commit aborts if a document read in it changed since.
+
+    Implements the private hooks that firestore.transactional drives, so the
+    real decorator retries aborted attempts against this client.
+    """
+
+    _read_only = False
+    _max_attempts = 5
+
+    def __init__(self, client: "FakeFirestoreClient"):
+        super().__init__(client)
+        self._id = None
+        self._reads: Dict[str, int] = {}
+
+    def _begin(self, retry_id=None) -> None:
+        self._id = '%016x' % random.getrandbits(64)
+
+    def _clean_up(self) -> None:
+        self._id = None
+        self._reads = {}
+        self._writes = []
+
+    def _rollback(self) -> None:
+        self._clean_up()
+
+    def _read(self, ref: FakeDocumentReference) -> None:
+        with self._client._lock:
+            self._reads.setdefault(ref.path, self._client._versions.get(ref.path, 0))
+
+    def _commit(self) -> None:
+        self._client._round_trip()
+        with self._client._lock:
+            changed = [path for path, version in self._reads.items() if self._client._versions.get(path, 0) != version]
+            if changed:
+                raise google_exceptions.Aborted(f"Documents changed during the transaction: {changed}")
+            # The client lock is re-entrant, so the writes apply atomically with the check
+            for ref, data, merge in self._writes:
+                if data is None:
+                    self._client._delete(ref)
+                else:
+                    self._client._write(ref, data, merge)
+        self._clean_up()
+
+
+class FakeFirestoreClient:
+    """Thread-safe in-memory document store with simulated round-trip latency."""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, seed: Optional[int] = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.round_trips = 0
+        self._random = random.Random(seed)
+        self._collections: Dict[str, "OrderedDict[str, Dict[str, Any]]"] = {}
+        # Write count per document path, checked by transactions at commit
+        self._versions: Dict[str, int] = {}
+        self._lock = threading.RLock()
+
+    def collection(self, name: str) -> FakeCollectionReference:
+        return FakeCollectionReference(self, name)
+
+    def batch(self) -> FakeWriteBatch:
+        return FakeWriteBatch(self)
+
+    def transaction(self) -> FakeTransaction:
+        return FakeTransaction(self)
+
+    def get_all(self, references: Iterable[FakeDocumentReference],
+                field_paths: Optional[Iterable[str]] = None) -> Iterable[FakeSnapshot]:
+        self._round_trip()
+        return [self._snapshot(ref, field_paths) for ref in references]
+
+    def _round_trip(self) -> None:
+        with self._lock:
+            self.round_trips += 1
+            delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay > 0:
+            time.sleep(delay)
+
+    def _snapshot(self, ref: FakeDocumentReference, field_paths: Optional[Iterable[str]] = None) -> FakeSnapshot:
+        with self._lock:
+            data = self._collections.get(ref._collection_path, {}).get(ref.id)
+            return FakeSnapshot(ref, _project(data, field_paths))
+
+    def _write(self, ref: FakeDocumentReference, data: Dict[str, Any], merge: bool) -> None:
+        stored = _stored(data)
+        with self._lock:
+            collection = self._collections.setdefault(ref._collection_path, OrderedDict())
+            if merge and ref.id in collection:
+                collection[ref.id] = {**collection[ref.id], **stored}
+            else:
+                collection[ref.id] = stored
+            self._bump(ref.path)
+
+    def _create(self, ref: FakeDocumentReference, data: Dict[str, Any]) -> None:
+        with self._lock:
+            if ref.id in self._collections.get(ref._collection_path, {}):
+                raise google_exceptions.AlreadyExists(f"Document already exists: {ref.path}")
+            self._collections.setdefault(ref._collection_path, OrderedDict())[ref.id] = _stored(data)
+            self._bump(ref.path)
+
+    def _delete(self, ref: FakeDocumentReference) -> None:
+        with self._lock:
+            self._collections.get(ref._collection_path, {}).pop(ref.id, None)
+            self._bump(ref.path)
+
+    def _bump(self, path: str) -> None:
+        self._versions[path] = self._versions.get(path, 0) + 1
+
+    def seed(self, path: str, data: Dict[str, Any]) -> None:
+        """Store a document directly, without simulated latency."""
+        collection_path, doc_id = path.rsplit('/', 1)
+        with self._lock:
+            self._collections.setdefault(collection_path, OrderedDict())[doc_id] = dict(data)
+            self._bump(path)
+
+
+def _project(data: Optional[Dict[str, Any]], field_paths: Optional[Iterable[str]]) -> Optional[Dict[str, Any]]:
+    if data is None or field_paths is None:
+        return data
+    return {field: data[field] for field in field_paths if field in data}
+
+
+def _stored(data: Dict[str, Any]) -> Dict[str, Any]:
+    return {key: (time.time() if _is_server_timestamp(value) else value) for key, value in data.items()}
+
+
+def _is_server_timestamp(value: Any) -> bool:
+    return type(value).__name__ == 'Sentinel'
+
+
+def seed_positions(client: FakeFirestoreClient, positions: int = 5, applications_per_position: int = 100,
+                   questions_per_position: int = 5, answer_chars: int = 600, seed: int = 0) -> List[str]:
+    """Fill the client with synthetic active positions and applications; returns the position IDs."""
+    rng = random.Random(seed)
+    words = ("python react firestore leadership design testing community events workshop cloud "
+             "mentoring backend frontend api data team project volunteer organize students").split()
+
+    def text(chars: int) -> str:
+        parts = []
+        length = 0
+        while length < chars:
+            word = rng.choice(words)
+            parts.append(word)
+            length += len(word) + 1
+        return ' '.join(parts)
+
+    position_ids = []
+    for p in range(positions):
+        position_id = f"position-{p:03d}"
+        questions = [{'label': f"Question {q + 1}", 'type': 'textarea', 'required': True}
+                     for q in range(questions_per_position)]
+        client.seed(f"positions/{position_id}", {
+            'name': f"Synthetic Role {p}",
+            'description': text(800),
+            'tags': rng.sample(words, 3),
+            'status': 'active',
+            'questions': questions
+        })
+        for a in range(applications_per_position):
+            client.seed(f"positions/{position_id}/applications/app-{a:05d}", {
+                'name': f"Applicant {a}",
+                'email': f"applicant{a}@example.com",
+                'questions': {question['label']: text(answer_chars) for question in questions},
+                'status': 'pending'
+            })
+        position_ids.append(position_id)
+    return position_ids
@@ -0,0 +1,95 @@
+"""Offline stand-in for the Gemini model used by GeminiService.
+
+FakeGenerativeModel answers generate_content_async with well-formed review JSON
+after a lognormal delay, so benchmarks exercise the real prompt building,
+caching, packing, retry and parsing code without network calls or API cost.
+"""
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import re
+from typing import Optional
+
+from google.api_core import exceptions as google_exceptions
+
+from prompt_builder import estimate_tokens
+
+_PACKED_ID_PATTERN = re.compile(r'^Application ID: (\S+)$', re.MULTILINE)
+
+# z-score of the 99th percentile of a standard normal distribution
+_Z99 = 2.326
+
+
+class FakeUsage:
+    def __init__(self, prompt_tokens: int, response_tokens: int):
+        self.prompt_token_count = prompt_tokens
+        self.candidates_token_count = response_tokens
+        self.cached_content_token_count = 0
+
+
+class FakeResponse:
+    def __init__(self, text: str, prompt_tokens: int):
+        self.text = text
+        self.usage_metadata = FakeUsage(prompt_tokens, estimate_tokens(text))
+
+
+class FakeGenerativeModel:
+    """Answers review prompts with deterministic ratings after a simulated delay.
+
+    Latency is lognormal with the given median and 99th percentile (seconds).
+    A failure_rate fraction of calls raises a retryable Gemini error instead.
+    """
+
+    def __init__(self, median_latency: float = 0.8, p99_latency: float = 4.0,
+                 failure_rate: float = 0.0, seed: Optional[int] = None):
+        self.median_latency = median_latency
+        self.sigma = max(0.0, math.log(p99_latency / median_latency) / _Z99) if median_latency > 0 else 0.0
+        self.failure_rate = failure_rate
+        self.calls = 0
+        self.failures = 0
+        self._random = random.Random(seed)
+
+    def _latency(self) -> float:
+        if self.median_latency <= 0:
+            return 0.0
+        return self._random.lognormvariate(math.log(self.median_latency), self.sigma)
+
+    async def generate_content_async(self, prompt, generation_config=None) -> FakeResponse:
+        self.calls += 1
+        await asyncio.sleep(self._latency())
+        if self._random.random() < self.failure_rate:
+            self.failures += 1
+            error = self._random.choice((google_exceptions.ServiceUnavailable, google_exceptions.ResourceExhausted))
+            raise error("Simulated Gemini failure")
+
+        prompt = str(prompt)
+        packed_ids = _PACKED_ID_PATTERN.findall(prompt)
+        if packed_ids:
+            text = json.dumps([{'id': app_id, **_review(f"{app_id}:{prompt}")} for app_id in packed_ids])
+        else:
+            text = json.dumps(_review(prompt))
+        return FakeResponse(text, estimate_tokens(prompt))
+
+
+def _review(seed_text: str) -> dict:
+    """Deterministic rating derived from the prompt, so cached and fresh reviews agree."""
+    digest = hashlib.sha256(seed_text.encode('utf-8')).digest()
+    rating = digest[0] % 10 + 1
+    return {
+        'rating': rating,
+        'comment': f"Synthetic review: the application rates {rating}/10 against the position requirements.",
+        'confidence': round(digest[1] / 255, 2)
+    }
+
+
+def make_gemini_service(model: FakeGenerativeModel):
+    """Build a real GeminiService whose models (every tier) are replaced by the fake."""
+    os.environ.setdefault("GEMINI_API_KEY", "offline-benchmark")
+    from llm_service import GeminiService
+
+    service = GeminiService()
+    service.models = {name: model for name in service.tiers}
+    return service
@@ -0,0 +1,209 @@
+"""Offline load test for the review service.
+
+Runs the real FastAPI app in-process against an in-memory Firestore and a fake
+Gemini model, drives /review-applications and /health at several concurrency
+levels, and reports throughput and p50/p95/p99 latency. Results are written to
+bench/results/ and compared against bench/baseline.json so regressions show up
+before deploy.
+
+Usage (from api-service/):
+    pip install -r requirements.txt -r bench/requirements.txt
+    python -m bench.loadtest                      # run and compare with the baseline
+    python -m bench.loadtest --update-baseline    # run and record a new baseline
+    python -m bench.loadtest --concurrency 1 8 32 --requests 400 --llm-median 0.2 --llm-p99 2 --failure-rate 0.02
+
+Exits with status 1 when any scenario regresses by more than --tolerance.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+os.environ.setdefault("REVIEW_SERVICE_OFFLINE", "1")
+# Listeners need a live Firestore; the in-memory client only supports TTL caching
+os.environ.setdefault("POSITION_CACHE_LISTENERS", "false")
+
+import httpx
+
+BENCH_DIR = Path(__file__).resolve().parent
+BASELINE_PATH = BENCH_DIR / 'baseline.json'
+RESULTS_DIR = BENCH_DIR / 'results'
+
+# Metrics compared against the baseline and whether higher is better
+COMPARED_METRICS = {'throughput_rps': True, 'p50_ms': False, 'p95_ms': False, 'p99_ms': False}
+
+
+def percentile(samples: List[float], p: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> Dict[str, float]:
+    return {
+        'requests': len(latencies) + errors,
+        'errors': errors,
+        'throughput_rps': round(len(latencies) / elapsed, 2) if elapsed > 0 else 0.0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+async def run_scenario(client: httpx.AsyncClient, make_request, concurrency: int, total: int) -> Dict[str, float]:
+    """Issue total requests from concurrency workers and summarize their latencies."""
+    latencies: List[float] = []
+    errors = 0
+    remaining = total
+
+    async def worker():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            started = time.perf_counter()
+            try:
+                response = await make_request(client)
+                ok = response.status_code == 200
+            except httpx.HTTPError:
+                ok = False
+            if ok:
+                latencies.append(time.perf_counter() - started)
+            else:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+def build_app(args):
+    """Import the app offline and wire it to the in-memory Firestore and fake Gemini."""
+    from bench.fake_firestore import FakeFirestoreClient, seed_positions
+    from bench.fake_gemini import FakeGenerativeModel, make_gemini_service
+
+    db = FakeFirestoreClient(latency=args.firestore_latency, jitter=args.firestore_latency / 2, seed=args.seed)
+    position_ids = seed_positions(
+        db, positions=args.positions, applications_per_position=args.applications,
+        questions_per_position=args.questions, answer_chars=args.answer_chars, seed=args.seed
+    )
+    model = FakeGenerativeModel(args.llm_median, args.llm_p99, args.failure_rate, seed=args.seed)
+
+    import main
+    from firebase import FirestoreService
+
+    main.init_services(FirestoreService(db), make_gemini_service(model))
+    return main.app, position_ids, db, model
+
+
+async def run_benchmark(args) -> Dict[str, Any]:
+    app, position_ids, db, model = build_app(args)
+    rng = random.Random(args.seed)
+    application_ids = [f"app-{a:05d}" for a in range(args.applications)]
+
+    async def review_request(client):
+        return await client.post('/review-applications', json={
+            'positionid': rng.choice(position_ids),
+            'application_ids': rng.sample(application_ids, min(args.batch, len(application_ids))),
+            'bypass_cache': not args.cache,
+            'packed': args.packed,
+        })
+
+    async def health_request(client):
+        return await client.get('/health')
+
+    scenarios = {'review-applications': review_request, 'health': health_request}
+    results: Dict[str, Dict[str, Any]] = {name: {} for name in scenarios}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench', timeout=None) as client:
+        for name, make_request in scenarios.items():
+            for concurrency in args.concurrency:
+                total = args.requests if name == 'review-applications' else args.requests * 10
+                calls_before, trips_before = model.calls, db.round_trips
+                summary = await run_scenario(client, make_request, concurrency, total)
+                summary['llm_calls'] = model.calls - calls_before
+                summary['firestore_round_trips'] = db.round_trips - trips_before
+                results[name][str(concurrency)] = summary
+                print(f"{name:<20} c={concurrency:<4} {summary['throughput_rps']:>9.1f} req/s  "
+                      f"p50={summary['p50_ms']:.1f}ms p95={summary['p95_ms']:.1f}ms p99={summary['p99_ms']:.1f}ms  "
+                      f"errors={summary['errors']}")
+
+    return {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'config': {key: value for key, value in vars(args).items() if key not in ('update_baseline', 'tolerance')},
+        'results': results,
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Return a description of every metric that is worse than the baseline by more than tolerance."""
+    if current['config'] != baseline.get('config'):
+        print("Warning: benchmark configuration differs from the baseline; comparison may be meaningless")
+    regressions = []
+    for name, levels in current['results'].items():
+        for concurrency, summary in levels.items():
+            reference = baseline.get('results', {}).get(name, {}).get(concurrency)
+            if not reference:
+                continue
+            for metric, higher_is_better in COMPARED_METRICS.items():
+                old, new = reference.get(metric), summary.get(metric)
+                if not old or new is None:
+                    continue
+                change = (new - old) / old
+                if (higher_is_better and change < -tolerance) or (not higher_is_better and change > tolerance):
+                    regressions.append(f"{name} c={concurrency} {metric}: {old} -> {new} ({change:+.0%})")
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline load test for the review service")
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16, 64])
+    parser.add_argument('--requests', type=int, default=200, help="Review requests per concurrency level")
+    parser.add_argument('--batch', type=int, default=10, help="Applications per review request")
+    parser.add_argument('--positions', type=int, default=5)
+    parser.add_argument('--applications', type=int, default=200, help="Applications per position")
+    parser.add_argument('--questions', type=int, default=5, help="Questions per position")
+    parser.add_argument('--answer-chars', type=int, default=600, help="Characters per answer")
+    parser.add_argument('--firestore-latency', type=float, default=0.01, help="Seconds per Firestore round-trip")
+    parser.add_argument('--llm-median', type=float, default=0.5, help="Median fake Gemini latency in seconds")
+    parser.add_argument('--llm-p99', type=float, default=2.5, help="99th percentile fake Gemini latency in seconds")
+    parser.add_argument('--failure-rate', type=float, default=0.0, help="Fraction of Gemini calls that fail")
+    parser.add_argument('--cache', action='store_true', help="Serve repeated applications from the review cache")
+    parser.add_argument('--packed', action='store_true', help="Review several applications per LLM call")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--tolerance', type=float, default=0.15, help="Allowed relative regression")
+    parser.add_argument('--update-baseline', action='store_true', help="Record this run as the new baseline")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    current = asyncio.run(run_benchmark(args))
+
+    RESULTS_DIR.mkdir(exist_ok=True)
+    result_path = RESULTS_DIR / f"{time.strftime('%Y%m%d-%H%M%S')}.json"
+    result_path.write_text(json.dumps(current, indent=2))
+    print(f"Results written to {result_path}")
+
+    if args.update_baseline:
+        BASELINE_PATH.write_text(json.dumps(current, indent=2))
+        print(f"Baseline updated at {BASELINE_PATH}")
+        return 0
+    if not BASELINE_PATH.exists():
+        print("No baseline recorded yet; run with --update-baseline to create one")
+        return 0
+
+    regressions = compare(current, json.loads(BASELINE_PATH.read_text()), args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,386 @@
+import asyncio
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+from xml.etree import ElementTree
+
+import requests
+
+from metrics import STAGE_LATENCY
+
+logger = logging.getLogger(__name__)
+
+# Extract the text of file answers (resumes) and include it in reviews
+FILE_EXTRACTION = os.getenv("FILE_EXTRACTION", "true").lower() in ("1", "true", "yes")
+# Worker processes that parse PDF and DOCX files
+FILE_EXTRACTION_WORKERS = max(1, int(os.getenv("FILE_EXTRACTION_WORKERS", "2")))
+# Files downloaded at the same time
+FILE_DOWNLOAD_CONCURRENCY = max(1, int(os.getenv("FILE_DOWNLOAD_CONCURRENCY", "8")))
+# Largest file downloaded, in bytes
+FILE_MAX_BYTES = int(os.getenv("FILE_MAX_BYTES", str(10 * 1024 * 1024)))
+# Seconds allowed for downloading one file, and for parsing it
+FILE_DOWNLOAD_TIMEOUT = float(os.getenv("FILE_DOWNLOAD_TIMEOUT", "20"))
+FILE_EXTRACTION_TIMEOUT = float(os.getenv("FILE_EXTRACTION_TIMEOUT", "30"))
+# Longest text kept from one file, in characters
+FILE_MAX_TEXT_CHARS = int(os.getenv("FILE_MAX_TEXT_CHARS", "100000"))
+# Directory of extracted text, keyed by a hash of the file contents
+FILE_CACHE_DIR = os.getenv("FILE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "review-file-cache"))
+# Hosts files may be downloaded from; answers are applicant-controlled, so nothing else is fetched
+FILE_ALLOWED_HOSTS = [
+    host.strip() for host in
+    os.getenv("FILE_ALLOWED_HOSTS", "firebasestorage.googleapis.com,storage.googleapis.com,.firebasestorage.app").split(",")
+    if host.strip()
+]
+
+# Bump when extraction output changes so stale cache entries are ignored
+EXTRACTOR_VERSION = 1
+# Largest uncompressed document.xml read from a DOCX, guarding against zip bombs
+MAX_DOCX_XML_BYTES = 50 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+
+_WORD_NAMESPACE = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+
+
+class ExtractionError(Exception):
+    """Raised when a file can't be downloaded or turned into text."""
+
+
+class _NotModified(Exception):
+    """A conditional download found the file unchanged."""
+
+
+def detect_kind(path: str) -> str:
+    """Classify a file as pdf, docx or text from its leading bytes."""
+    with open(path, 'rb') as file:
+        head = file.read(8)
+    if head.startswith(b'%PDF'):
+        return 'pdf'
+    if head.startswith(b'PK\x03\x04'):
+        return 'docx'
+    return 'text'
+
+
+def extract_file(path: str, kind: str, max_chars: int = FILE_MAX_TEXT_CHARS) -> str:
+    """Extract up to max_chars of text from a downloaded file. Runs in a worker process."""
+    if kind == 'pdf':
+        return _extract_pdf(path, max_chars)
+    if kind == 'docx':
+        return _extract_docx(path, max_chars)
+    return _extract_text(path, max_chars)
+
+
+def _extract_pdf(path: str, max_chars: int) -> str:
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        raise ExtractionError("PDF support requires the pypdf package")
+    parts = []
+    length = 0
+    try:
+        for page in PdfReader(path).pages:
+            text = page.extract_text() or ''
+            parts.append(text)
+            length += len(text)
+            if length >= max_chars:
+                break
+    except Exception as e:
+        raise ExtractionError(f"Unsupported or corrupt PDF file: {e}")
+    return '\n'.join(parts)[:max_chars]
+
+
+def _extract_docx(path: str, max_chars: int) -> str:
+    try:
+        with zipfile.ZipFile(path) as archive:
+            info = archive.getinfo('word/document.xml')
+            if info.file_size > MAX_DOCX_XML_BYTES:
+                raise ExtractionError("DOCX document is too large")
+            paragraphs = []
+            current = []
+            length = 0
+            # Stream the XML so large documents are never fully built in memory
+            with archive.open(info) as document:
+                for event, element in ElementTree.iterparse(document, events=('end',)):
+                    if element.tag == f'{_WORD_NAMESPACE}t' and element.text:
+                        current.append(element.text)
+                        length += len(element.text)
+                    elif element.tag == f'{_WORD_NAMESPACE}tab':
+                        current.append('\t')
+                    elif element.tag == f'{_WORD_NAMESPACE}p':
+                        paragraphs.append(''.join(current))
+                        current = []
+                        element.clear()
+                        if length >= max_chars:
+                            break
+            paragraphs.append(''.join(current))
+    except (KeyError, zipfile.BadZipFile, ElementTree.ParseError) as e:
+        raise ExtractionError(f"Unsupported or corrupt DOCX file: {e}")
+    return '\n'.join(paragraph for paragraph in paragraphs if paragraph)[:max_chars]
+
+
+def _extract_text(path: str, max_chars: int) -> str:
+    with open(path, 'rb') as file:
+        # UTF-8 needs at most 4 bytes per character
+        data = file.read(max_chars * 4)
+    if b'\x00' in data[:CHUNK_SIZE]:
+        raise ExtractionError("Unsupported binary file")
+    return data.decode('utf-8', errors='replace')[:max_chars]
+
+
+class DocumentExtractor:
+    """Turns the files referenced by file answers into text for reviews.
+
+    Downloads are streamed to a temporary file while hashing, within size and
+    time limits. Extracted text is cached on disk under the content hash, so a
+    resume is parsed once however many times it is reviewed. Each URL's ETag
+    and content hash are remembered too, so later reviews send a conditional
+    request and only download files that changed. PDF and DOCX parsing runs in
+    a process pool so it never holds the event loop or the GIL.
+    """
+
+    def __init__(self, workers: int = FILE_EXTRACTION_WORKERS, cache_dir: str = FILE_CACHE_DIR,
+                 max_bytes: int = FILE_MAX_BYTES, download_timeout: float = FILE_DOWNLOAD_TIMEOUT,
+                 extraction_timeout: float = FILE_EXTRACTION_TIMEOUT,
+                 allowed_hosts: List[str] = FILE_ALLOWED_HOSTS):
+        self.workers = workers
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.download_timeout = download_timeout
+        self.extraction_timeout = extraction_timeout
+        self.allowed_hosts = allowed_hosts
+        self.stats: Dict[str, int] = {
+            'extracted': 0, 'cache_hits': 0, 'not_modified': 0, 'failures': 0, 'too_large': 0, 'timeouts': 0
+        }
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+        self._downloads = asyncio.Semaphore(FILE_DOWNLOAD_CONCURRENCY)
+        os.makedirs(cache_dir, exist_ok=True)
+
+    async def resolve(self, applications: List[Dict]) -> None:
+        """Replace the URL answer of every file question with the file's text, in place.
+
+        Uses the pre-extracted <label>_text file when the application has one.
+        Files that can't be read become empty answers and are marked extracted
+        either way, so the review goes ahead without them.
+        """
+        questions = [
+            question
+            for application in applications
+            for question in application['questions']
+            if question['type'] == 'file' and not question.get('extracted')
+        ]
+        urls = list(dict.fromkeys(
+            question.get('text_url') or question['answer'] for question in questions
+            if question.get('text_url') or question['answer']
+        ))
+        texts = dict(zip(urls, await asyncio.gather(*(self.extract_url(url) for url in urls))))
+        for question in questions:
+            question['answer'] = texts.get(question.get('text_url') or question['answer'], '')
+            question['extracted'] = True
+
+    async def extract_url(self, url: str) -> str:
+        """Text of the file at url, or '' when it can't be extracted."""
+        path = None
+        try:
+            known = await asyncio.to_thread(self._read_index, url)
+            if known is not None:
+                # Only download the file again if the storage server says it changed
+                path, digest, etag = await self._fetch(url, known['etag'])
+                if path is None:
+                    cached = await asyncio.to_thread(self._read_cache, known['digest'])
+                    if cached is not None:
+                        self.stats['not_modified'] += 1
+                        return cached
+            if path is None:
+                path, digest, etag = await self._fetch(url)
+
+            text = await asyncio.to_thread(self._read_cache, digest)
+            if text is not None:
+                self.stats['cache_hits'] += 1
+            else:
+                with STAGE_LATENCY.time(stage='file_extract'):
+                    text = await self._extract(path)
+                await asyncio.to_thread(self._write_cache, digest, text)
+                self.stats['extracted'] += 1
+            if etag:
+                await asyncio.to_thread(self._write_index, url, etag, digest)
+            return text
+        except asyncio.TimeoutError:
+            self.stats['timeouts'] += 1
+            logger.warning(f"Extracting {_redact(url)} timed out")
+        except ExtractionError as e:
+            self.stats['failures'] += 1
+            logger.warning(f"Could not extract {_redact(url)}: {e}")
+        except Exception as e:
+            self.stats['failures'] += 1
+            logger.error(f"Unexpected error extracting {_redact(url)}: {e}")
+        finally:
+            if path is not None:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        return ''
+
+    def _check_url(self, url: str) -> None:
+        parsed = urlparse(url)
+        host = (parsed.hostname or '').lower()
+        allowed = any(
+            host == allowed_host or (allowed_host.startswith('.') and host.endswith(allowed_host))
+            for allowed_host in self.allowed_hosts
+        )
+        if parsed.scheme != 'https' or not allowed:
+            raise ExtractionError("File URL is not an allowed storage location")
+
+    async def _fetch(self, url: str, etag: Optional[str] = None):
+        async with self._downloads:
+            with STAGE_LATENCY.time(stage='file_download'):
+                return await asyncio.to_thread(self._download, url, etag)
+
+    def _download(self, url: str, etag: Optional[str] = None):
+        """Stream url to a temporary file, hashing as it goes. Returns (path, sha256 hex digest, ETag).
+
+        With etag, the request is conditional; (None, None, etag) means the file is unchanged.
+        """
+        self._check_url(url)
+        headers = {'If-None-Match': etag} if etag else {}
+        deadline = time.monotonic() + self.download_timeout
+        digest = hashlib.sha256()
+        size = 0
+        handle, path = tempfile.mkstemp(dir=self.cache_dir, suffix='.download')
+        try:
+            with os.fdopen(handle, 'wb') as file, requests.get(
+                url, stream=True, allow_redirects=False, timeout=(5, self.download_timeout), headers=headers
+            ) as response:
+                if etag and response.status_code == 304:
+                    raise _NotModified()
+                if response.status_code != 200:
+                    raise ExtractionError(f"Download failed with HTTP {response.status_code}")
+                declared = int(response.headers.get('Content-Length') or 0)
+                if declared > self.max_bytes:
+                    self.stats['too_large'] += 1
+                    raise ExtractionError(f"File is larger than {self.max_bytes} bytes")
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        self.stats['too_large'] += 1
+                        raise ExtractionError(f"File is larger than {self.max_bytes} bytes")
+                    if time.monotonic() > deadline:
+                        raise asyncio.TimeoutError()
+                    digest.update(chunk)
+                    file.write(chunk)
+                etag = response.headers.get('ETag')
+        except _NotModified:
+            os.remove(path)
+            return None, None, etag
+        except BaseException:
+            os.remove(path)
+            raise
+        return path, digest.hexdigest(), etag
+
+    async def _extract(self, path: str) -> str:
+        kind = detect_kind(path)
+        if kind == 'text':
+            # Plain text needs no parser, so skip the process hop
+            return await asyncio.to_thread(extract_file, path, kind)
+        loop = asyncio.get_running_loop()
+        pool = self._get_pool()
+        try:
+            return await asyncio.wait_for(
+                loop.run_in_executor(pool, extract_file, path, kind), self.extraction_timeout
+            )
+        except asyncio.TimeoutError:
+            # A stuck parser would hold its worker forever, so replace the pool
+            self._reset_pool(pool)
+            raise
+        except BrokenProcessPool as e:
+            self._reset_pool(pool)
+            raise ExtractionError(f"Extraction worker crashed: {e}")
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                # spawn rather than fork: the parent holds gRPC and HTTP client threads
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context('spawn')
+                )
+            return self._pool
+
+    def _reset_pool(self, pool: ProcessPoolExecutor) -> None:
+        with self._pool_lock:
+            if self._pool is not pool:
+                return
+            self._pool = None
+        for process in list(getattr(pool, '_processes', {}).values()):
+            process.terminate()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def _cache_path(self, digest: str) -> str:
+        return os.path.join(self.cache_dir, digest[:2], f"{digest}-v{EXTRACTOR_VERSION}.txt")
+
+    def _read_cache(self, digest: str) -> Optional[str]:
+        try:
+            with open(self._cache_path(digest), 'r', encoding='utf-8') as file:
+                return file.read()
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.warning(f"File text cache read failed: {e}")
+            return None
+
+    def _write_cache(self, digest: str, text: str) -> None:
+        path = self._cache_path(digest)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = f"{path}.{os.getpid()}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as file:
+                file.write(text)
+            os.replace(temp_path, path)
+        except OSError as e:
+            logger.warning(f"File text cache write failed: {e}")
+
+    def _index_path(self, url: str) -> str:
+        # Hashed because the URL carries the storage download token
+        return os.path.join(self.cache_dir, 'urls', f"{hashlib.sha256(url.encode('utf-8')).hexdigest()}.json")
+
+    def _read_index(self, url: str) -> Optional[Dict[str, str]]:
+        """The ETag and content hash recorded for url when it was last downloaded."""
+        try:
+            with open(self._index_path(url), 'r', encoding='utf-8') as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"File URL index read failed: {e}")
+            return None
+
+    def _write_index(self, url: str, etag: str, digest: str) -> None:
+        path = self._index_path(url)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = f"{path}.{os.getpid()}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as file:
+                json.dump({'etag': etag, 'digest': digest}, file)
+            os.replace(temp_path, path)
+        except OSError as e:
+            logger.warning(f"File URL index write failed: {e}")
+
+    def shutdown(self) -> None:
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _redact(url: str) -> str:
+    """Drop the query string, which holds the storage download token."""
+    return url.split('?', 1)[0]
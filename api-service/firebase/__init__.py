@@ -1,7 +1,19 @@
-from .firebase_config import initialize_firebase
-from .firestore_service import FirestoreService
+import importlib
 
-__all__ = [
-    'initialize_firebase',
-    'FirestoreService'
-]
+# Exports are resolved on first access, so importing a light submodule such as
+# auth_utils doesn't pull in the Firestore client and gRPC at startup
+_EXPORTS = {
+    'initialize_firebase': '.firebase_config',
+    'FirestoreService': '.firestore_service',
+    'AsyncFirestoreService': '.async_firestore_service',
+    'PositionCache': '.position_cache'
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(importlib.import_module(module, __name__), name)
@@ -0,0 +1,155 @@
+import asyncio
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Dict, List, Optional, Tuple
+
+from metrics import STAGE_LATENCY
+from models import Position, ReviewApplication
+from .firestore_service import FirestoreService
+
+logger = logging.getLogger(__name__)
+
+# Number of threads available for blocking Firestore calls
+FIRESTORE_POOL_SIZE = max(1, int(os.getenv("FIRESTORE_POOL_SIZE", "16")))
+# Seconds to wait for a single Firestore operation before giving up
+FIRESTORE_TIMEOUT = float(os.getenv("FIRESTORE_TIMEOUT", "15"))
+
+# Latency stage reported for each FirestoreService call
+STAGES = {
+    '_get_position': 'firestore_position',
+    '_get_applications': 'firestore_applications',
+    '_get_applications_by_ids': 'firestore_applications',
+    '_get_application_page': 'firestore_applications',
+    '_get_reviews_by_ids': 'firestore_reviews',
+    '_get_latest_review_time': 'firestore_reviews',
+    '_get_review_page': 'firestore_reviews',
+    'save_application_review': 'review_save',
+    'save_application_reviews': 'review_save',
+}
+
+
+class AsyncFirestoreService:
+    """Awaitable wrapper around FirestoreService.
+
+    Each call runs the synchronous Firestore client on a dedicated thread pool so
+    the event loop keeps serving other requests during Firestore round-trips.
+    """
+
+    def __init__(self, service: FirestoreService, pool_size: int = FIRESTORE_POOL_SIZE,
+                 timeout: Optional[float] = FIRESTORE_TIMEOUT):
+        self.service = service
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="firestore")
+
+    async def _run(self, func, *args, **kwargs):
+        """Run a blocking FirestoreService call on the pool, bounded by the timeout."""
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._executor, partial(func, *args, **kwargs))
+        try:
+            with STAGE_LATENCY.time(stage=STAGES.get(func.__name__, 'firestore_other')):
+                return await asyncio.wait_for(future, timeout=self.timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"Firestore call {func.__name__} timed out after {self.timeout}s")
+            raise
+
+    async def get_position(self, position_id: str) -> Optional[Position]:
+        return await self._run(self.service._get_position, position_id)
+
+    async def get_applications(self, position_id: str) -> List[ReviewApplication]:
+        return await self._run(self.service._get_applications, position_id)
+
+    async def get_position_with_applications(self, position_id: str) -> tuple[Optional[Position], List[ReviewApplication]]:
+        """Get a position and all its applications, reading both in parallel."""
+        position, applications = await asyncio.gather(
+            self.get_position(position_id),
+            self.get_applications(position_id)
+        )
+        if not position:
+            return None, []
+        return position, applications
+
+    async def get_applications_by_ids(self, position_id: str, application_ids: List[str]) -> Tuple[List[ReviewApplication], List[str]]:
+        return await self._run(self.service._get_applications_by_ids, position_id, application_ids)
+
+    async def get_position_with_selected_applications(
+        self, position_id: str, application_ids: List[str]
+    ) -> Tuple[Optional[Position], List[ReviewApplication], List[str]]:
+        """Get a position and only the requested applications, reading both in parallel.
+
+        Returns the position, the found applications in request order and the missing IDs.
+        """
+        position, (applications, missing_ids) = await asyncio.gather(
+            self.get_position(position_id),
+            self.get_applications_by_ids(position_id, application_ids)
+        )
+        if not position:
+            return None, [], []
+        return position, applications, missing_ids
+
+    async def get_application_page(self, position_id: str, page_size: int, start_after: Optional[str] = None,
+                                   statuses: Optional[List[str]] = None) -> Tuple[List[ReviewApplication], Optional[str], List[str]]:
+        return await self._run(self.service._get_application_page, position_id, page_size, start_after, statuses)
+
+    async def get_reviews_by_ids(self, position_id: str, application_ids: List[str]) -> Dict[str, Dict]:
+        return await self._run(self.service._get_reviews_by_ids, position_id, application_ids)
+
+    async def get_latest_review_time(self, position_id: str):
+        return await self._run(self.service._get_latest_review_time, position_id)
+
+    async def get_review_page(self, position_id: str, order_field: str, descending: bool, page_size: int,
+                              start_after: Optional[Tuple] = None) -> Tuple[List[Dict], Optional[Tuple]]:
+        return await self._run(
+            self.service._get_review_page, position_id, order_field, descending, page_size, start_after
+        )
+
+    async def save_application_review(self, position_id: str, application_id: str, rating: int, comment: str,
+                                      position: Optional[Position] = None) -> str:
+        return await self._run(
+            self.service.save_application_review,
+            position_id=position_id,
+            application_id=application_id,
+            rating=rating,
+            comment=comment,
+            position=position
+        )
+
+    async def save_application_reviews(self, position_id: str, reviews: List[Dict],
+                                       position: Optional[Position] = None) -> Tuple[Dict[str, str], Dict[str, str]]:
+        return await self._run(
+            self.service.save_application_reviews,
+            position_id=position_id,
+            reviews=reviews,
+            position=position
+        )
+
+    async def create_review_job(self, data: Dict) -> str:
+        return await self._run(self.service.create_review_job, data)
+
+    async def update_review_job(self, job_id: str, data: Dict, outcomes: Optional[Dict[str, Dict]] = None) -> None:
+        await self._run(self.service.update_review_job, job_id, data, outcomes)
+
+    async def claim_review_job(self, job_id: str, owner: str, lease_seconds: float) -> Optional[Dict]:
+        return await self._run(self.service.claim_review_job, job_id, owner, lease_seconds)
+
+    async def renew_review_job_lease(self, job_id: str, owner: str, lease_seconds: float) -> bool:
+        return await self._run(self.service.renew_review_job_lease, job_id, owner, lease_seconds)
+
+    async def get_review_job(self, job_id: str) -> Optional[Dict]:
+        return await self._run(self.service._get_review_job, job_id)
+
+    async def get_review_job_outcomes(self, job_id: str, page_size: int,
+                                      start_after: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+        return await self._run(self.service._get_review_job_outcomes, job_id, page_size, start_after)
+
+    async def get_unfinished_review_jobs(self) -> List[Dict]:
+        return await self._run(self.service._get_unfinished_review_jobs)
+
+    def convert_firestore_to_llm_format(self, position: Position, applications: List[ReviewApplication]):
+        """Pure in-memory conversion, no I/O to offload."""
+        return self.service.convert_firestore_to_llm_format(position, applications)
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Release the worker threads."""
+        self._executor.shutdown(wait=wait)
@@ -1,5 +1,119 @@
 from fastapi import Request, HTTPException, status, Depends
-from firebase_admin import auth
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of verified ID tokens kept in memory
+ID_TOKEN_CACHE_SIZE = int(os.getenv("ID_TOKEN_CACHE_SIZE", "1024"))
+# Seconds between revocation checks of a cached token (0 disables revocation checks)
+ID_TOKEN_REVOCATION_INTERVAL = float(os.getenv("ID_TOKEN_REVOCATION_INTERVAL", "0"))
+
+
+class TokenVerifierCache:
+    """LRU cache of decoded ID tokens keyed by the token's SHA-256, evicted at the token's exp.
+
+    Raw tokens are never stored. With a revocation interval set, a cached token
+    is re-verified against revocation once the interval has passed.
+    """
+
+    def __init__(self, max_entries: int = ID_TOKEN_CACHE_SIZE,
+                 revocation_interval: float = ID_TOKEN_REVOCATION_INTERVAL):
+        self.max_entries = max_entries
+        self.revocation_interval = revocation_interval
+        self.hits = 0
+        self.misses = 0
+        # key -> (exp, checked_at, decoded token)
+        self._entries: "OrderedDict[str, Tuple[float, float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(id_token: str) -> str:
+        return hashlib.sha256(id_token.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the decoded token, or None when absent, expired or due for a revocation check."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, checked_at, decoded = entry
+                if expires_at <= now:
+                    del self._entries[key]
+                elif self.revocation_interval <= 0 or now - checked_at < self.revocation_interval:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return decoded
+            self.misses += 1
+            return None
+
+    def put(self, key: str, decoded: Dict[str, Any]) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (float(decoded.get('exp', 0)), time.time(), decoded)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'size': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+token_cache = TokenVerifierCache()
+
+
+def prefetch_certificates(app=None) -> bool:
+    """Fetch the ID-token signing certificates ahead of the first admin request.
+
+    Goes through the Admin SDK's own verifier session, whose HTTP cache then
+    serves later verifications. Relies on SDK internals, so any mismatch just
+    skips the prefetch.
+    """
+    try:
+        from firebase_admin import auth, _token_gen
+
+        verifier = getattr(auth._get_client(app), '_token_verifier', None)
+        request = getattr(verifier, 'request', None)
+        cert_url = getattr(_token_gen, 'ID_TOKEN_CERT_URI', None)
+        if request is None or cert_url is None:
+            return False
+        request(cert_url, method='GET')
+        return True
+    except Exception as e:
+        logger.warning(f"Could not prefetch ID token certificates: {e}")
+        return False
+
+
+async def verify_token(id_token: str) -> Dict[str, Any]:
+    """Verify an ID token off the event loop, reusing earlier verifications of the same token."""
+    from firebase_admin import auth
+
+    key = TokenVerifierCache.key(id_token)
+    decoded = token_cache.get(key)
+    if decoded is not None:
+        return decoded
+    try:
+        decoded = await asyncio.to_thread(
+            auth.verify_id_token, id_token, check_revoked=token_cache.revocation_interval > 0
+        )
+    except Exception:
+        token_cache.invalidate(key)
+        raise
+    token_cache.put(key, decoded)
+    return decoded
+
 
 def get_bearer_token(request: Request):
     auth_header = request.headers.get("Authorization")
@@ -8,13 +122,15 @@ def get_bearer_token(request: Request):
     return auth_header.split("Bearer ", 1)[1]
 
 async def admin_required(request: Request):
+    from firebase_admin import auth
+
     id_token = get_bearer_token(request)
     try:
-        decoded_token = auth.verify_id_token(id_token)
-        if not decoded_token.get("admin"):
-            raise HTTPException(status_code=403, detail="Admin privileges required")
-        return decoded_token
+        decoded_token = await verify_token(id_token)
     except auth.InvalidIdTokenError:
         raise HTTPException(status_code=401, detail="Invalid ID token")
     except Exception:
         raise HTTPException(status_code=401, detail="Could not validate credentials")
+    if not decoded_token.get("admin"):
+        raise HTTPException(status_code=403, detail="Admin privileges required")
+    return decoded_token
@@ -1,10 +1,12 @@
-import firebase_admin
-from firebase_admin import credentials, firestore
 import os
 
 
 def initialize_firebase():
     """Initialize Firebase Admin SDK and return Firestore client."""
+    # The Admin SDK pulls in gRPC and the Firestore client, so it is imported on first use
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+
     try:
         # Check if Firebase app is already initialized
         if not firebase_admin._apps:
@@ -1,8 +1,13 @@
+import datetime
 import logging
 from typing import List, Dict, Optional, Tuple
 from firebase_admin import firestore
+from google.api_core.exceptions import AlreadyExists
+from google.cloud.firestore_v1.field_path import FieldPath
+from google.cloud.firestore_v1.base_query import FieldFilter
 from pydantic import ValidationError
-from models import Position, Application
+from models import Position, ReviewApplication
+from .position_cache import PositionCache, MISS
 
 logging.basicConfig(
     level=logging.INFO,
@@ -14,13 +19,38 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
+# Firestore rejects write batches with more than 500 operations
+MAX_BATCH_WRITES = 500
+
+def file_question(app: ReviewApplication, label: str) -> Dict:
+    """A file question keeps the file's URL as its answer, plus the URL of its pre-extracted text if any."""
+    return {
+        'label': label,
+        'answer': app.questions.get(label, ''),
+        'type': 'file',
+        'text_url': app.questions.get(f'{label}_text', '')
+    }
+
+def _created_at_key(value) -> float:
+    """Sort key for a stored createdAt, with missing or unknown values oldest."""
+    if isinstance(value, datetime.datetime):
+        return value.timestamp()
+    if isinstance(value, (int, float)):
+        return float(value)
+    return float('-inf')
+
+def _lease_active(expires_at, now: datetime.datetime) -> bool:
+    """Whether a stored leaseExpiresAt lies after now."""
+    return isinstance(expires_at, datetime.datetime) and expires_at > now
+
 class FirestoreService:
     """Service class for Firestore operations."""
 
-    def __init__(self, db: firestore.Client):
+    def __init__(self, db: firestore.Client, position_cache: Optional[PositionCache] = None):
         self.db = db
+        self.position_cache = position_cache or PositionCache(parse=self._position_from_snapshot)
 
-    def get_position_with_applications(self, position_id: str) -> tuple[Optional[Position], List[Application]]:
+    def get_position_with_applications(self, position_id: str) -> tuple[Optional[Position], List[ReviewApplication]]:
         """Get a position and all its applications."""
         try:
             # Get position
@@ -37,44 +67,50 @@ class FirestoreService:
             raise
 
     def _get_position(self, position_id: str) -> Optional[Position]:
-        """Get a position by ID from Firestore."""
+        """Get a position by ID, served from the position cache when possible."""
         try:
             if not position_id or not self.db:
                 return None
 
-            doc_ref = self.db.collection('positions').document(position_id)
-            doc = doc_ref.get()
+            cached = self.position_cache.get(position_id)
+            if cached is not MISS:
+                return cached
 
-            if doc.exists:
-                data = doc.to_dict()
-                data['id'] = doc.id
-                return Position(**data)
-            else:
-                return None
+            doc_ref = self.db.collection('positions').document(position_id)
+            position = self._position_from_snapshot(doc_ref.get())
+            self.position_cache.put(position_id, position, doc_ref)
+            return position
 
-        except ValidationError as e:
-            logger.error(f"Position {position_id} validation failed: {e}")
-            return None
         except Exception as e:
             logger.error(f"Error fetching position {position_id}: {e}")
             raise
 
-    def _get_applications(self, position_id: str) -> List[Application]:
+    def _position_from_snapshot(self, doc) -> Optional[Position]:
+        """Validate a position document snapshot into a Position model."""
+        if not doc.exists:
+            return None
+        try:
+            data = doc.to_dict()
+            data['id'] = doc.id
+            return Position(**data)
+        except ValidationError as e:
+            logger.error(f"Position {doc.id} validation failed: {e}")
+            return None
+
+    def _get_applications(self, position_id: str) -> List[ReviewApplication]:
         """Get all applications for a position from Firestore."""
         try:
             if not position_id or not self.db:
                 return []
 
             applications_ref = self.db.collection('positions').document(position_id).collection('applications')
-            docs = applications_ref.stream()
+            docs = applications_ref.select(ReviewApplication.FIELD_MASK).stream()
 
             applications = []
             for doc in docs:
                 try:
-                    data = doc.to_dict()
-                    data['id'] = doc.id
-                    applications.append(Application(**data))
-                except ValidationError as e:
+                    applications.append(ReviewApplication.from_firestore(doc.id, doc.to_dict()))
+                except ValueError as e:
                     logger.warning(f"Application {doc.id} validation failed: {e}")
                     continue
 
@@ -84,33 +120,166 @@ class FirestoreService:
             logger.error(f"Error fetching applications for position {position_id}: {e}")
             raise
 
-    def convert_firestore_to_llm_format(self, position: Position, applications: List[Application]) -> Dict:
-        """Convert Firestore data to the format expected by the LLM service."""
+    def _get_applications_by_ids(self, position_id: str, application_ids: List[str]) -> Tuple[List[ReviewApplication], List[str]]:
+        """Get only the requested applications in a single batched read.
+
+        Returns the applications in request order and the IDs that were not found
+        or failed validation.
+        """
         try:
-            llm_applications = []
+            if not position_id or not self.db or not application_ids:
+                return [], list(application_ids or [])
 
-            for app in applications:
-                questions = []
+            # Drop duplicates while keeping request order
+            unique_ids = list(dict.fromkeys(application_ids))
 
-                for i, position_question in enumerate(position.questions):
-                    question_label = position_question.get('label', f'Question {i+1}')
-                    position_question_type = position_question.get('type', 'text')
+            applications_ref = self.db.collection('positions').document(position_id).collection('applications')
+            refs = [applications_ref.document(application_id) for application_id in unique_ids]
+
+            found = {}
+            for doc in self.db.get_all(refs, field_paths=ReviewApplication.FIELD_MASK):
+                if not doc.exists:
+                    continue
+                try:
+                    found[doc.id] = ReviewApplication.from_firestore(doc.id, doc.to_dict())
+                except ValueError as e:
+                    logger.warning(f"Application {doc.id} validation failed: {e}")
+                    continue
+
+            applications = [found[application_id] for application_id in unique_ids if application_id in found]
+            missing_ids = [application_id for application_id in unique_ids if application_id not in found]
+            return applications, missing_ids
+
+        except Exception as e:
+            logger.error(f"Error fetching applications {application_ids} for position {position_id}: {e}")
+            raise
+
+    def _get_application_page(self, position_id: str, page_size: int, start_after: Optional[str] = None,
+                              statuses: Optional[List[str]] = None) -> Tuple[List[ReviewApplication], Optional[str], List[str]]:
+        """Get one page of a position's applications in document ID order.
+
+        Returns the valid applications, the cursor to pass as start_after for the
+        next page (None once the subcollection is exhausted) and the IDs that
+        failed validation.
+        """
+        try:
+            if not position_id or not self.db:
+                return [], None, []
+
+            query = self.db.collection('positions').document(position_id).collection('applications')
+            if statuses:
+                query = query.where(filter=FieldFilter('status', 'in', statuses))
+            query = query.select(ReviewApplication.FIELD_MASK).order_by(FieldPath.document_id()).limit(page_size)
+            if start_after:
+                query = query.start_after({FieldPath.document_id(): start_after})
+
+            applications = []
+            invalid_ids = []
+            last_id = None
+            count = 0
+            for doc in query.stream():
+                count += 1
+                last_id = doc.id
+                try:
+                    applications.append(ReviewApplication.from_firestore(doc.id, doc.to_dict()))
+                except ValueError as e:
+                    logger.warning(f"Application {doc.id} validation failed: {e}")
+                    invalid_ids.append(doc.id)
+
+            next_cursor = last_id if count == page_size else None
+            return applications, next_cursor, invalid_ids
+
+        except Exception as e:
+            logger.error(f"Error fetching application page for position {position_id}: {e}")
+            raise
+
+    def _get_reviews_by_ids(self, position_id: str, application_ids: List[str]) -> Dict[str, Dict]:
+        """Get the stored reviews of the given applications in a single batched read."""
+        try:
+            if not position_id or not self.db or not application_ids:
+                return {}
+
+            reviews_ref = self.db.collection('positions').document(position_id).collection('reviews')
+            refs = [reviews_ref.document(application_id) for application_id in dict.fromkeys(application_ids)]
+            return {doc.id: doc.to_dict() for doc in self.db.get_all(refs) if doc.exists}
+
+        except Exception as e:
+            logger.error(f"Error fetching reviews {application_ids} for position {position_id}: {e}")
+            raise
+
+    def _get_latest_review_time(self, position_id: str):
+        """createdAt of the most recently written review of a position, or None if it has none."""
+        try:
+            if not position_id or not self.db:
+                return None
+
+            query = (
+                self.db.collection('positions').document(position_id).collection('reviews')
+                .select(['createdAt'])
+                .order_by('createdAt', direction=firestore.Query.DESCENDING)
+                .limit(1)
+            )
+            for doc in query.stream():
+                return doc.to_dict().get('createdAt')
+            return None
+
+        except Exception as e:
+            logger.error(f"Error fetching latest review time for position {position_id}: {e}")
+            raise
+
+    def _get_review_page(self, position_id: str, order_field: str, descending: bool, page_size: int,
+                         start_after: Optional[Tuple] = None) -> Tuple[List[Dict], Optional[Tuple]]:
+        """Get one page of a position's stored reviews ordered by order_field, then document ID.
+
+        start_after is the (order value, document ID) cursor returned with the
+        previous page; the returned cursor is None once there are no more reviews.
+        """
+        try:
+            if not position_id or not self.db:
+                return [], None
+
+            direction = firestore.Query.DESCENDING if descending else firestore.Query.ASCENDING
+            query = (
+                self.db.collection('positions').document(position_id).collection('reviews')
+                .select(['applicationId', 'rating', 'comment', 'createdAt', 'tier'])
+                .order_by(order_field, direction=direction)
+                .order_by(FieldPath.document_id(), direction=direction)
+                .limit(page_size)
+            )
+            if start_after:
+                query = query.start_after({order_field: start_after[0], FieldPath.document_id(): start_after[1]})
+
+            reviews = []
+            last = None
+            for doc in query.stream():
+                data = doc.to_dict()
+                data['id'] = doc.id
+                reviews.append(data)
+                last = (data.get(order_field), doc.id)
 
-                    # Skip file questions for now
-                    if position_question_type == 'file':
-                        continue
+            next_cursor = last if len(reviews) == page_size else None
+            return reviews, next_cursor
 
-                    answer = app.questions.get(question_label, '')
+        except Exception as e:
+            logger.error(f"Error fetching review page for position {position_id}: {e}")
+            raise
 
-                    questions.append({
-                        'label': question_label,
-                        'answer': answer,
-                        'type': position_question_type
-                    })
-                llm_applications.append({
+    def convert_firestore_to_llm_format(self, position: Position, applications: List[ReviewApplication]) -> Dict:
+        """Convert Firestore data to the format expected by the LLM service."""
+        try:
+            # Labels and types come from the position's precompiled schema, not re-derived per application
+            schema = position.question_schema
+            llm_applications = [
+                {
                     'id': app.id,
-                    'questions': questions
-                })
+                    'questions': [
+                        file_question(app, label) if question_type == 'file' else
+                        {'label': label, 'answer': app.questions.get(label, ''), 'type': question_type}
+                        for label, question_type in schema
+                    ]
+                }
+                for app in applications
+            ]
 
             return {
                 'job_name': position.name,
@@ -123,47 +292,266 @@ class FirestoreService:
             logger.error(f"Error converting Firestore data to LLM format: {e}")
             raise
 
-    def save_application_review(self, position_id: str, application_id: str, rating: int, comment: str) -> str:
-        """Save a review to the reviews subcollection of a position. Replace existing review if it exists."""
+    def save_application_review(self, position_id: str, application_id: str, rating: int, comment: str,
+                                position: Optional[Position] = None) -> str:
+        """Save a review to the reviews subcollection of a position. Replace existing review if it exists.
+
+        Pass the already-validated position to skip re-reading it.
+        """
+        saved, failed = self.save_application_reviews(
+            position_id=position_id,
+            reviews=[{'application_id': application_id, 'rating': rating, 'comment': comment}],
+            position=position
+        )
+        if application_id in failed:
+            raise ValueError(failed[application_id])
+        return saved[application_id]
+
+    def save_application_reviews(self, position_id: str, reviews: List[Dict],
+                                 position: Optional[Position] = None) -> Tuple[Dict[str, str], Dict[str, str]]:
+        """Save a batch of reviews in as few commits as possible.
+
+        Each review is a dict with application_id, rating and comment. Review documents
+        are keyed by application ID, so an existing review is overwritten without a lookup
+        query. Returns the saved application_id -> review_id map and the failed
+        application_id -> error map.
+        """
         try:
-            if not position_id or not application_id or not self.db:
+            if not position_id or not self.db:
                 raise ValueError("Invalid input parameters")
 
-            # Check if position exists and is active
-            position = self._get_position(position_id)
+            # Check if position exists and is active, reusing the caller's copy when given
+            if position is None:
+                position = self._get_position(position_id)
             if not position:
                 raise ValueError(f"Position with ID {position_id} not found")
 
             if position.status != 'active':
                 raise ValueError(f"Position {position_id} is not active")
 
-            # Create review document
-            review_data = {
-                'rating': rating,
-                'comment': comment,
-                'applicationId': application_id,
-                'createdAt': firestore.SERVER_TIMESTAMP
-            }
+            reviews_ref = self.db.collection('positions').document(position_id).collection('reviews')
+            saved: Dict[str, str] = {}
+            failed: Dict[str, str] = {}
+
+            # Validate each review on its own so one bad item doesn't sink the batch
+            valid_reviews = []
+            for review in reviews:
+                application_id = review.get('application_id')
+                rating = review.get('rating')
+                if not application_id:
+                    logger.warning(f"Skipping review without application ID for position {position_id}")
+                    continue
+                if not isinstance(rating, int) or rating < 1 or rating > 10:
+                    failed[application_id] = f"Invalid rating: {rating}"
+                    continue
+                valid_reviews.append(review)
+
+            for start in range(0, len(valid_reviews), MAX_BATCH_WRITES):
+                chunk = valid_reviews[start:start + MAX_BATCH_WRITES]
+                batch = self.db.batch()
+                for review in chunk:
+                    review_data = {
+                        'rating': review['rating'],
+                        'comment': str(review.get('comment', '')),
+                        'applicationId': review['application_id'],
+                        'createdAt': firestore.SERVER_TIMESTAMP
+                    }
+                    if review.get('fingerprint'):
+                        review_data['fingerprint'] = review['fingerprint']
+                    if review.get('tier'):
+                        review_data['tier'] = review['tier']
+                    batch.set(reviews_ref.document(review['application_id']), review_data)
+                try:
+                    batch.commit()
+                    for review in chunk:
+                        saved[review['application_id']] = review['application_id']
+                except Exception as e:
+                    logger.error(f"Failed to commit {len(chunk)} reviews for position {position_id}: {e}")
+                    for review in chunk:
+                        failed[review['application_id']] = str(e)
+
+            return saved, failed
 
-            # Check if a review already exists for this application
+        except Exception as e:
+            logger.error(f"Error saving reviews for position {position_id}: {e}")
+            raise
+
+    def migrate_legacy_reviews(self, position_id: str) -> int:
+        """Re-key a position's auto-ID review documents by application ID.
+
+        Reviews used to be added with auto-generated IDs. For each application with
+        such documents, the newest is copied to reviews/{application_id} unless that
+        document already exists, and every auto-ID document is deleted. The copy is
+        a create, so a review saved concurrently is never overwritten. Returns the
+        number of documents deleted. Run by firebase/migrate_reviews.py.
+        """
+        try:
             reviews_ref = self.db.collection('positions').document(position_id).collection('reviews')
-            from google.cloud.firestore_v1.base_query import FieldFilter
-            existing_reviews = reviews_ref.where(
-                filter=FieldFilter("applicationId", "==", application_id)
-            ).get()
+            keyed = set()
+            legacy: Dict[str, List] = {}
+            for doc in reviews_ref.stream():
+                application_id = (doc.to_dict() or {}).get('applicationId')
+                if not application_id or doc.id == application_id:
+                    keyed.add(doc.id)
+                else:
+                    legacy.setdefault(application_id, []).append(doc)
+
+            stale = []
+            for application_id, docs in legacy.items():
+                if application_id not in keyed:
+                    newest = max(docs, key=lambda doc: _created_at_key(doc.to_dict().get('createdAt')))
+                    try:
+                        reviews_ref.document(application_id).create(newest.to_dict())
+                    except AlreadyExists:
+                        # Reviewed again since the stream above; the fresh review wins
+                        pass
+                stale.extend(doc.reference for doc in docs)
+
+            for start in range(0, len(stale), MAX_BATCH_WRITES):
+                batch = self.db.batch()
+                for ref in stale[start:start + MAX_BATCH_WRITES]:
+                    batch.delete(ref)
+                batch.commit()
+
+            if stale:
+                logger.info(f"Migrated {len(legacy)} legacy reviews of position {position_id} ({len(stale)} documents removed)")
+            return len(stale)
+
+        except Exception as e:
+            logger.error(f"Error migrating legacy reviews of position {position_id}: {e}")
+            raise
 
-            existing_review_doc = None
-            for doc in existing_reviews:
-                existing_review_doc = doc
-                break
+    def create_review_job(self, data: Dict) -> str:
+        """Create a review job document and return its ID."""
+        try:
+            doc_ref = self.db.collection('reviewJobs').document()
+            doc_ref.set({**data, 'createdAt': firestore.SERVER_TIMESTAMP, 'updatedAt': firestore.SERVER_TIMESTAMP})
+            return doc_ref.id
+        except Exception as e:
+            logger.error(f"Error creating review job: {e}")
+            raise
 
-            if existing_review_doc:
-                existing_review_doc.reference.update(review_data)
-                return existing_review_doc.id
-            else:
-                doc_ref = reviews_ref.add(review_data)[1]
-                return doc_ref.id
+    def update_review_job(self, job_id: str, data: Dict, outcomes: Optional[Dict[str, Dict]] = None) -> None:
+        """Checkpoint a review job's progress.
 
+        outcomes maps application ID to its outcome, stored in the job's outcomes
+        subcollection. The job document is written in the last batch, so its cursor
+        and counters never run ahead of the outcomes they count.
+        """
+        try:
+            job_ref = self.db.collection('reviewJobs').document(job_id)
+            job_data = {**data, 'updatedAt': firestore.SERVER_TIMESTAMP}
+            if not outcomes:
+                job_ref.set(job_data, merge=True)
+                return
+
+            items = list(outcomes.items())
+            # One slot of the last batch is kept for the job document
+            for start in range(0, len(items), MAX_BATCH_WRITES - 1):
+                batch = self.db.batch()
+                for application_id, outcome in items[start:start + MAX_BATCH_WRITES - 1]:
+                    batch.set(job_ref.collection('outcomes').document(application_id), outcome)
+                if start + MAX_BATCH_WRITES - 1 >= len(items):
+                    batch.set(job_ref, job_data, merge=True)
+                batch.commit()
+        except Exception as e:
+            logger.error(f"Error updating review job {job_id}: {e}")
+            raise
+
+    def claim_review_job(self, job_id: str, owner: str, lease_seconds: float) -> Optional[Dict]:
+        """Take the lease on an unfinished review job in a transaction and return the job.
+
+        Returns None when the job is missing, finished, or leased by another owner
+        whose lease has not expired yet.
+        """
+        return self._lease_review_job(job_id, owner, lease_seconds, renew=False)
+
+    def renew_review_job_lease(self, job_id: str, owner: str, lease_seconds: float) -> bool:
+        """Extend owner's lease on a review job; False if the lease was lost or the job finished."""
+        return self._lease_review_job(job_id, owner, lease_seconds, renew=True) is not None
+
+    def _lease_review_job(self, job_id: str, owner: str, lease_seconds: float, renew: bool) -> Optional[Dict]:
+        try:
+            doc_ref = self.db.collection('reviewJobs').document(job_id)
+
+            @firestore.transactional
+            def lease(transaction) -> Optional[Dict]:
+                doc = doc_ref.get(transaction=transaction)
+                if not doc.exists:
+                    return None
+                data = doc.to_dict()
+                if data.get('status') in ('completed', 'failed'):
+                    return None
+                now = datetime.datetime.now(datetime.timezone.utc)
+                held_by = data.get('leaseOwner')
+                if renew and held_by != owner:
+                    return None
+                if held_by not in (None, owner) and _lease_active(data.get('leaseExpiresAt'), now):
+                    return None
+                changes = {'leaseOwner': owner, 'leaseExpiresAt': now + datetime.timedelta(seconds=lease_seconds)}
+                transaction.set(doc_ref, {**changes, 'updatedAt': firestore.SERVER_TIMESTAMP}, merge=True)
+                data.update(changes)
+                data['id'] = doc.id
+                return data
+
+            return lease(self.db.transaction())
+        except Exception as e:
+            logger.error(f"Error leasing review job {job_id}: {e}")
+            raise
+
+    def _get_review_job(self, job_id: str) -> Optional[Dict]:
+        """Get a review job by ID."""
+        try:
+            doc = self.db.collection('reviewJobs').document(job_id).get()
+            if not doc.exists:
+                return None
+            data = doc.to_dict()
+            data['id'] = doc.id
+            return data
+        except Exception as e:
+            logger.error(f"Error fetching review job {job_id}: {e}")
+            raise
+
+    def _get_review_job_outcomes(self, job_id: str, page_size: int,
+                                 start_after: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+        """Get one page of a review job's per-application outcomes, ordered by application ID.
+
+        start_after is the application ID returned as the previous page's cursor; the
+        returned cursor is None once there are no more outcomes.
+        """
+        try:
+            query = (
+                self.db.collection('reviewJobs').document(job_id).collection('outcomes')
+                .order_by(FieldPath.document_id())
+                .limit(page_size)
+            )
+            if start_after:
+                query = query.start_after({FieldPath.document_id(): start_after})
+
+            outcomes = []
+            for doc in query.stream():
+                data = doc.to_dict()
+                data['applicationId'] = doc.id
+                outcomes.append(data)
+
+            next_cursor = outcomes[-1]['applicationId'] if len(outcomes) == page_size else None
+            return outcomes, next_cursor
+        except Exception as e:
+            logger.error(f"Error fetching outcomes of review job {job_id}: {e}")
+            raise
+
+    def _get_unfinished_review_jobs(self) -> List[Dict]:
+        """Get review jobs that were queued or running when the service stopped."""
+        try:
+            docs = self.db.collection('reviewJobs').where(
+                filter=FieldFilter('status', 'in', ['queued', 'running'])
+            ).stream()
+            jobs = []
+            for doc in docs:
+                data = doc.to_dict()
+                data['id'] = doc.id
+                jobs.append(data)
+            return jobs
         except Exception as e:
-            logger.error(f"Error saving review for application {application_id}: {e}")
+            logger.error(f"Error fetching unfinished review jobs: {e}")
             raise
@@ -0,0 +1,26 @@
+"""One-off migration of review documents written with auto-generated IDs.
+
+Run from api-service with `python -m firebase.migrate_reviews` once after
+deploying application-ID review keys. Until then, applications reviewed both
+before and after the switch list two reviews.
+"""
+import logging
+
+from .firebase_config import initialize_firebase
+from .firestore_service import FirestoreService
+
+logger = logging.getLogger(__name__)
+
+
+def migrate_all_positions() -> int:
+    service = FirestoreService(initialize_firebase())
+    deleted = 0
+    for doc in service.db.collection('positions').select([]).stream():
+        deleted += service.migrate_legacy_reviews(doc.id)
+    logger.info(f"Replaced {deleted} legacy review documents")
+    return deleted
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    migrate_all_positions()
@@ -0,0 +1,163 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+from models import Position
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of positions kept in the cache
+POSITION_CACHE_SIZE = int(os.getenv("POSITION_CACHE_SIZE", "256"))
+# Seconds a position stays valid when it is not kept fresh by a listener
+POSITION_CACHE_TTL = float(os.getenv("POSITION_CACHE_TTL", "10"))
+# Seconds a listened position may go unused before its listener is dropped
+POSITION_CACHE_IDLE = float(os.getenv("POSITION_CACHE_IDLE", "600"))
+# Keep cached positions fresh with Firestore snapshot listeners
+POSITION_CACHE_LISTENERS = os.getenv("POSITION_CACHE_LISTENERS", "true").lower() in ("1", "true", "yes")
+
+# Sentinel returned by get() when the position is not cached
+MISS = object()
+
+
+class _Entry:
+    __slots__ = ('position', 'loaded_at', 'accessed_at', 'watch')
+
+    def __init__(self, position: Optional[Position], watch: Any = None):
+        now = time.monotonic()
+        self.position = position
+        self.loaded_at = now
+        self.accessed_at = now
+        self.watch = watch
+
+
+class PositionCache:
+    """Process-wide cache of validated positions.
+
+    Entries are kept fresh by a Firestore on_snapshot listener when available and
+    otherwise expire after the TTL. None is cached too, so missing or invalid
+    positions don't cost a read on every request.
+    """
+
+    def __init__(self, parse: Callable[[Any], Optional[Position]], max_entries: int = POSITION_CACHE_SIZE,
+                 ttl: float = POSITION_CACHE_TTL, idle_timeout: float = POSITION_CACHE_IDLE,
+                 use_listeners: bool = POSITION_CACHE_LISTENERS):
+        self.parse = parse
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.idle_timeout = idle_timeout
+        self.use_listeners = use_listeners
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, position_id: str):
+        """Return the cached position (possibly None), or MISS when it must be read."""
+        now = time.monotonic()
+        stale = []
+        with self._lock:
+            entry = self._entries.get(position_id)
+            if entry is not None and self._is_fresh(entry, now):
+                entry.accessed_at = now
+                self._entries.move_to_end(position_id)
+                self.hits += 1
+                return entry.position
+            if entry is not None:
+                stale.append(self._pop(position_id))
+            self.misses += 1
+        self._stop(stale)
+        return MISS
+
+    def put(self, position_id: str, position: Optional[Position], doc_ref: Any = None) -> None:
+        """Cache a freshly read position and start listening for changes to it."""
+        if self.max_entries <= 0:
+            return
+        watch = self._listen(position_id, doc_ref) if doc_ref is not None else None
+        evicted = []
+        with self._lock:
+            if position_id in self._entries:
+                evicted.append(self._pop(position_id))
+            self._entries[position_id] = _Entry(position, watch)
+            while len(self._entries) > self.max_entries:
+                evicted.append(self._pop(next(iter(self._entries))))
+        self._stop(evicted)
+
+    def invalidate(self, position_id: str) -> None:
+        with self._lock:
+            entry = self._pop(position_id)
+        self._stop([entry])
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            listeners = sum(1 for entry in self._entries.values() if entry.watch is not None)
+            return {
+                'size': len(self._entries),
+                'listeners': listeners,
+                'hits': self.hits,
+                'misses': self.misses,
+                'refreshes': self.refreshes
+            }
+
+    def close(self) -> None:
+        """Drop every entry and stop all listeners."""
+        with self._lock:
+            entries = [self._pop(position_id) for position_id in list(self._entries)]
+        self._stop(entries)
+
+    def _is_fresh(self, entry: _Entry, now: float) -> bool:
+        if entry.watch is not None and getattr(entry.watch, 'is_active', True):
+            return now - entry.accessed_at < self.idle_timeout
+        # No listener, or the listener died: fall back to TTL-only mode
+        return now - entry.loaded_at < self.ttl
+
+    def _listen(self, position_id: str, doc_ref: Any):
+        if not self.use_listeners:
+            return None
+
+        def on_snapshot(doc_snapshots, changes, read_time):
+            for doc in doc_snapshots:
+                self._refresh(position_id, doc)
+
+        try:
+            return doc_ref.on_snapshot(on_snapshot)
+        except Exception as e:
+            logger.warning(f"Position {position_id} listener unavailable, using TTL only: {e}")
+            return None
+
+    def _refresh(self, position_id: str, doc: Any) -> None:
+        """Listener callback: replace the cached position with the latest snapshot."""
+        try:
+            position = self.parse(doc) if doc.exists else None
+        except Exception as e:
+            logger.warning(f"Could not refresh cached position {position_id}: {e}")
+            position = MISS
+        with self._lock:
+            entry = self._entries.get(position_id)
+            if entry is None:
+                return
+            if position is MISS:
+                # Mark the entry stale; the next get() evicts it from a request thread
+                entry.accessed_at = float('-inf')
+                return
+            entry.position = position
+            entry.loaded_at = time.monotonic()
+            self.refreshes += 1
+
+    def _pop(self, position_id: str) -> Optional[_Entry]:
+        """Remove an entry. Caller must hold the lock."""
+        return self._entries.pop(position_id, None)
+
+    def _stop(self, entries) -> None:
+        """Stop the listeners of removed entries, outside the lock so a listener
+        callback waiting on it can't deadlock the unsubscribe."""
+        for entry in entries:
+            if entry is None or entry.watch is None:
+                continue
+            try:
+                entry.watch.unsubscribe()
+            except Exception as e:
+                logger.warning(f"Failed to stop position listener: {e}")
@@ -0,0 +1,237 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from google.api_core import exceptions as google_exceptions
+
+logger = logging.getLogger(__name__)
+
+# Seconds before a single Gemini attempt is abandoned
+GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", "60"))
+# Retries after the first attempt for transient errors
+GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "3"))
+# Base and maximum backoff in seconds (full jitter is applied)
+GEMINI_RETRY_BASE_DELAY = float(os.getenv("GEMINI_RETRY_BASE_DELAY", "1"))
+GEMINI_RETRY_MAX_DELAY = float(os.getenv("GEMINI_RETRY_MAX_DELAY", "20"))
+# Send a duplicate request once an attempt runs longer than this latency percentile (0 disables hedging)
+GEMINI_HEDGE_PERCENTILE = float(os.getenv("GEMINI_HEDGE_PERCENTILE", "0"))
+# Latency samples required before hedging kicks in
+GEMINI_HEDGE_MIN_SAMPLES = int(os.getenv("GEMINI_HEDGE_MIN_SAMPLES", "20"))
+# Consecutive failed calls that open the circuit, and seconds it stays open
+GEMINI_BREAKER_THRESHOLD = int(os.getenv("GEMINI_BREAKER_THRESHOLD", "5"))
+GEMINI_BREAKER_RESET = float(os.getenv("GEMINI_BREAKER_RESET", "30"))
+
+# Errors worth retrying: throttling, overload and timeouts
+RETRYABLE_EXCEPTIONS = (
+    google_exceptions.ResourceExhausted,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.DeadlineExceeded,
+    google_exceptions.InternalServerError,
+    google_exceptions.TooManyRequests,
+    asyncio.TimeoutError,
+    ConnectionError,
+)
+
+# Errors meaning the quota is exhausted
+RATE_LIMIT_EXCEPTIONS = (
+    google_exceptions.ResourceExhausted,
+    google_exceptions.TooManyRequests,
+)
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling Gemini while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """Opens after consecutive failures, then lets a single trial call through after the reset timeout."""
+
+    def __init__(self, failure_threshold: int = GEMINI_BREAKER_THRESHOLD, reset_timeout: float = GEMINI_BREAKER_RESET):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+
+    def allow(self) -> bool:
+        if self.failure_threshold <= 0 or self.state == 'closed':
+            return True
+        if self.state == 'open' and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = 'half_open'
+        if self.state == 'half_open' and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return True
+        return False
+
+    def release_trial(self) -> None:
+        """Forget a half-open trial that ended without an outcome (e.g. cancelled), so another call can try."""
+        self._trial_in_flight = False
+
+    def record_success(self) -> None:
+        self.state = 'closed'
+        self.consecutive_failures = 0
+        self._trial_in_flight = False
+
+    def record_failure(self) -> bool:
+        """Record a failed call; returns True when this failure opened the circuit."""
+        self.consecutive_failures += 1
+        self._trial_in_flight = False
+        if self.state == 'half_open' or (
+            self.failure_threshold > 0 and self.state == 'closed'
+            and self.consecutive_failures >= self.failure_threshold
+        ):
+            self.state = 'open'
+            self.opened_at = time.monotonic()
+            return True
+        return False
+
+
+class LatencyTracker:
+    """Rolling window of successful call latencies."""
+
+    def __init__(self, window: int = 200):
+        self._samples = deque(maxlen=window)
+
+    def record(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, p: float) -> float:
+        ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered))) - 1))
+        return ordered[index]
+
+
+class ResilientCaller:
+    """Wraps Gemini calls with timeouts, jittered retries, hedging and a circuit breaker.
+
+    Every decision is counted in self.stats.
+    """
+
+    def __init__(self, timeout: float = GEMINI_TIMEOUT, max_retries: int = GEMINI_MAX_RETRIES,
+                 base_delay: float = GEMINI_RETRY_BASE_DELAY, max_delay: float = GEMINI_RETRY_MAX_DELAY,
+                 hedge_percentile: float = GEMINI_HEDGE_PERCENTILE,
+                 hedge_min_samples: int = GEMINI_HEDGE_MIN_SAMPLES,
+                 breaker: CircuitBreaker = None):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.breaker = breaker or CircuitBreaker()
+        self.latencies = LatencyTracker()
+        self.stats: Dict[str, int] = {
+            'calls': 0,
+            'successes': 0,
+            'failures': 0,
+            'timeouts': 0,
+            'retries': 0,
+            'hedges': 0,
+            'hedge_wins': 0,
+            'hedges_skipped': 0,
+            'circuit_rejections': 0,
+            'circuit_opens': 0,
+        }
+
+    async def call(self, make_call: Callable[[], Awaitable[Any]],
+                   admit: Optional[Callable[[], Awaitable[None]]] = None,
+                   admit_now: Optional[Callable[[], bool]] = None) -> Any:
+        """Run make_call (a factory returning a fresh coroutine per attempt) resiliently.
+
+        admit, when given, is awaited before every attempt (e.g. to wait for quota);
+        time spent there does not count against the attempt timeout. admit_now
+        admits a hedged duplicate only if that needs no waiting, returning False otherwise.
+        """
+        self.stats['calls'] += 1
+        if not self.breaker.allow():
+            self.stats['circuit_rejections'] += 1
+            raise CircuitOpenError("Gemini circuit breaker is open")
+        trial = self.breaker.state == 'half_open'
+
+        attempt = 0
+        try:
+            while True:
+                try:
+                    if admit is not None:
+                        await admit()
+                    result = await self._attempt(make_call, admit_now)
+                    self.stats['successes'] += 1
+                    self.breaker.record_success()
+                    return result
+                except RETRYABLE_EXCEPTIONS as e:
+                    if isinstance(e, asyncio.TimeoutError):
+                        self.stats['timeouts'] += 1
+                    if attempt >= self.max_retries:
+                        self._record_failure()
+                        raise
+                    attempt += 1
+                    self.stats['retries'] += 1
+                    delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+                    logger.warning(f"Retryable Gemini error ({type(e).__name__}), retry {attempt} in {delay:.1f}s")
+                    await asyncio.sleep(delay)
+                except Exception:
+                    self._record_failure()
+                    raise
+        except asyncio.CancelledError:
+            # A cancelled trial says nothing about Gemini; without this the breaker would stay half-open forever
+            if trial:
+                self.breaker.release_trial()
+            raise
+
+    def _record_failure(self) -> None:
+        self.stats['failures'] += 1
+        if self.breaker.record_failure():
+            self.stats['circuit_opens'] += 1
+            logger.error(f"Gemini circuit breaker opened after {self.breaker.consecutive_failures} failures")
+
+    def _hedge_delay(self):
+        if self.hedge_percentile <= 0 or len(self.latencies) < self.hedge_min_samples:
+            return None
+        return self.latencies.percentile(self.hedge_percentile)
+
+    async def _attempt(self, make_call: Callable[[], Awaitable[Any]],
+                       admit_now: Optional[Callable[[], bool]] = None) -> Any:
+        """One attempt, bounded by the timeout, possibly raced against a hedged duplicate."""
+        started = time.monotonic()
+        primary = asyncio.ensure_future(asyncio.wait_for(make_call(), self.timeout))
+        hedge_delay = self._hedge_delay()
+        if hedge_delay is None:
+            result = await primary
+            self.latencies.record(time.monotonic() - started)
+            return result
+
+        tasks = {primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=hedge_delay)
+            if not done:
+                # A hedge is only worth sending if it doesn't have to queue for quota
+                if admit_now is None or admit_now():
+                    self.stats['hedges'] += 1
+                    hedge = asyncio.ensure_future(asyncio.wait_for(make_call(), self.timeout))
+                    tasks.add(hedge)
+                else:
+                    self.stats['hedges_skipped'] += 1
+            while True:
+                done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                winner = next((task for task in done if task.exception() is None), None)
+                if winner is not None:
+                    if winner is not primary:
+                        self.stats['hedge_wins'] += 1
+                    self.latencies.record(time.monotonic() - started)
+                    return winner.result()
+                if not pending:
+                    # Every attempt failed; surface the primary's error when it has one
+                    failed = primary if primary in done else next(iter(done))
+                    raise failed.exception()
+                tasks = pending
+        finally:
+            for task in tasks:
+                task.cancel()
@@ -1,18 +1,63 @@
-import google.generativeai as genai
+import asyncio
+import datetime
 import json
+import logging
 import os
-from typing import Dict, Any
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Hashable, List, Optional, Tuple
 from dotenv import load_dotenv
 
 load_dotenv()
 
+from prompt_builder import PositionPrompt, estimate_tokens
+from review_cache import ReviewCache, make_review_cache_key
+from llm_resilience import ResilientCaller, CircuitOpenError, RATE_LIMIT_EXCEPTIONS
+from quota_scheduler import QuotaScheduler
+from metrics import STAGE_LATENCY, LLM_TOKENS, IN_FLIGHT, REVIEW_TIERS, REVIEW_ESCALATIONS
+from models import EscalationPolicy
+from review_parsing import (
+    REVIEW_SCHEMA, PACKED_REVIEW_SCHEMA, parse_json_response, salvage_review, validate_review
+)
+
+logger = logging.getLogger(__name__)
+
+MODEL_NAME = 'gemini-2.5-flash'
+SYSTEM_PROMPT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'system_prompt.txt')
+
+# Register each position's shared prompt prefix as Gemini cached content
+GEMINI_CONTEXT_CACHE = os.getenv("GEMINI_CONTEXT_CACHE", "false").lower() in ("1", "true", "yes")
+# Gemini refuses to cache prefixes shorter than this many tokens
+GEMINI_CONTEXT_CACHE_MIN_TOKENS = int(os.getenv("GEMINI_CONTEXT_CACHE_MIN_TOKENS", "1024"))
+# Lifetime of a cached prefix in seconds
+GEMINI_CONTEXT_CACHE_TTL = int(os.getenv("GEMINI_CONTEXT_CACHE_TTL", "900"))
+# Ask Gemini for schema-constrained JSON instead of free text
+GEMINI_STRUCTURED_OUTPUT = os.getenv("GEMINI_STRUCTURED_OUTPUT", "true").lower() in ("1", "true", "yes")
+# Output token cap per review (0 = model default); thinking tokens count against it
+REVIEW_MAX_OUTPUT_TOKENS = int(os.getenv("REVIEW_MAX_OUTPUT_TOKENS", "0"))
+# Maximum applications reviewed by one packed LLM call
+REVIEW_PACK_SIZE = max(1, int(os.getenv("REVIEW_PACK_SIZE", "5")))
+# Maximum estimated application tokens in one packed LLM call
+REVIEW_PACK_TOKEN_BUDGET = int(os.getenv("REVIEW_PACK_TOKEN_BUDGET", "8000"))
+# Number of position prompts kept for reuse across requests
+POSITION_PROMPT_CACHE_SIZE = 64
+# Models tried in order, cheapest first; a review moves to the next tier when it is
+# borderline, low-confidence or unusable. A single model disables the cascade.
+GEMINI_MODEL_TIERS = [
+    name.strip() for name in os.getenv("GEMINI_MODEL_TIERS", MODEL_NAME).split(",") if name.strip()
+] or [MODEL_NAME]
+# Default escalation thresholds; a position's "escalation" map overrides them
+REVIEW_ESCALATE_MIN_RATING = int(os.getenv("REVIEW_ESCALATE_MIN_RATING", "4"))
+REVIEW_ESCALATE_MAX_RATING = int(os.getenv("REVIEW_ESCALATE_MAX_RATING", "7"))
+REVIEW_ESCALATE_MIN_CONFIDENCE = float(os.getenv("REVIEW_ESCALATE_MIN_CONFIDENCE", "0.6"))
+
 def load_system_prompt() -> str:
     """Load the system prompt from the text file."""
     try:
-        with open('system_prompt.txt', 'r', encoding='utf-8') as file:
+        with open(SYSTEM_PROMPT_PATH, 'r', encoding='utf-8') as file:
             return file.read().strip()
     except FileNotFoundError:
-        raise FileNotFoundError("system_prompt.txt not found.")
+        raise FileNotFoundError(f"{SYSTEM_PROMPT_PATH} not found.")
 
 class GeminiService:
     def __init__(self):
@@ -21,71 +66,380 @@ class GeminiService:
         if not api_key:
             raise ValueError("GEMINI_API_KEY environment variable not set")
 
+        # Imported here rather than at module level: the SDK is slow to import and only needed once warmed
+        import google.generativeai as genai
+
         genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel('gemini-2.5-flash')
+        self.tiers = list(GEMINI_MODEL_TIERS)
+        self.models = {name: genai.GenerativeModel(name) for name in self.tiers}
         self.system_prompt = load_system_prompt()
+        self.cache = ReviewCache()
+        # Each tier gets its own breaker so a failing model doesn't block the others
+        self.callers = {name: ResilientCaller() for name in self.tiers}
+        self.scheduler = QuotaScheduler()
+        self.parse_stats: Dict[str, int] = {'responses': 0, 'parse_failures': 0, 'salvaged': 0}
+        self.cascade_stats: Dict[str, int] = {'reviews': 0, 'escalations': 0, 'kept_lower_tier': 0}
+        self._prompts: "OrderedDict[tuple, PositionPrompt]" = OrderedDict()
 
-    async def review_application(self, job_name: str, job_description: str, application_info: str, tags: list = None) -> Dict[str, Any]:
-        try:
-            # Format tags for display
-            tags_text = ""
-            if tags and len(tags) > 0:
-                tags_text = f"\nJob Tags: {', '.join(tags)}"
+    def prepare_position(self, job_name: str, job_description: str, tags: list = None) -> PositionPrompt:
+        """Get the shared prompt for a position, building it once and reusing it across requests."""
+        key = (job_name, job_description, tuple(tags or []))
+        position_prompt = self._prompts.get(key)
+        if position_prompt is None:
+            position_prompt = PositionPrompt(self.system_prompt, job_name, job_description, tags)
+            self._prompts[key] = position_prompt
+            while len(self._prompts) > POSITION_PROMPT_CACHE_SIZE:
+                self._prompts.popitem(last=False)
+        else:
+            self._prompts.move_to_end(key)
+        return position_prompt
+
+    async def review_application(self, position_prompt: PositionPrompt, application_info: str,
+                                 use_cache: bool = True, priority: str = 'interactive',
+                                 flow: Hashable = None, escalation: Optional[EscalationPolicy] = None,
+                                 start_tier: int = 0, previous: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Review one application, serving unchanged applications from the review cache.
+
+        With use_cache=False the cache is not consulted but the fresh review still refreshes it.
+        priority and flow place the LLM calls in the quota scheduler's queues. The review
+        starts at the model tier start_tier and escalates as the position's policy says.
+        When a stronger tier gives no usable review, the last usable one from a cheaper
+        tier (starting with previous, already tagged with its tier) is returned instead.
+        """
+        policy = self.escalation_policy(escalation)
+        cache_key = self._cache_key(position_prompt, application_info, policy)
+        if use_cache:
+            cached = await self.cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+        usable = previous
+        last = len(self.tiers) - 1
+        for tier_index in range(min(start_tier, last), last + 1):
+            tier = self.tiers[tier_index]
+            review, problem = await self._generate_review(position_prompt, application_info, tier, priority, flow)
+            if review['rating'] > 0:
+                usable = {**review, 'tier': tier}
+            reason = problem or self._escalation_reason(review, policy)
+            if reason is None or tier_index == last:
+                break
+            self._record_escalation(tier, reason)
 
-            user_prompt = f"""
-            Please review this job application:
+        if review['rating'] <= 0 and usable is not None:
+            # The stronger tier failed; a cheaper tier's review beats none. It isn't cached,
+            # so the next request tries the stronger tier again.
+            self.cascade_stats['kept_lower_tier'] += 1
+            self._record_tier(usable, usable['tier'])
+            return usable
+        self._record_tier(review, tier)
+        # Errors and formatting failures are not cached so they get retried
+        if review['rating'] > 0:
+            self.cache.set(cache_key, review)
+        return review
 
-            Job Position: {job_name}
+    def resilience_stats(self) -> Dict[str, int]:
+        """Resilience decisions summed over every tier's caller."""
+        totals: Dict[str, int] = {}
+        for caller in self.callers.values():
+            for key, value in caller.stats.items():
+                totals[key] = totals.get(key, 0) + value
+        return totals
 
-            Job Description:
-            {job_description}
+    def escalation_policy(self, escalation: Optional[EscalationPolicy] = None) -> Tuple[int, int, float]:
+        """(min_rating, max_rating, min_confidence), with the position's overrides applied."""
+        min_rating = REVIEW_ESCALATE_MIN_RATING
+        max_rating = REVIEW_ESCALATE_MAX_RATING
+        min_confidence = REVIEW_ESCALATE_MIN_CONFIDENCE
+        if escalation is not None:
+            if escalation.min_rating is not None:
+                min_rating = escalation.min_rating
+            if escalation.max_rating is not None:
+                max_rating = escalation.max_rating
+            if escalation.min_confidence is not None:
+                min_confidence = escalation.min_confidence
+        return min_rating, max_rating, min_confidence
 
-            Job Tags:
-            {tags_text}
+    @staticmethod
+    def _escalation_reason(review: Dict[str, Any], policy: Tuple[int, int, float]) -> Optional[str]:
+        min_rating, max_rating, min_confidence = policy
+        if min_rating <= review['rating'] <= max_rating:
+            return 'borderline'
+        if review.get('confidence') is not None and review['confidence'] < min_confidence:
+            return 'low_confidence'
+        return None
 
-            Application Information:
-            {application_info}
-            """
+    def _record_escalation(self, tier: str, reason: str) -> None:
+        self.cascade_stats['escalations'] += 1
+        REVIEW_ESCALATIONS.inc(tier=tier, reason=reason)
 
-            # Create the prompt then send to Gemini
-            prompt = f"{self.system_prompt}\n\nUser Input:\n{user_prompt}"
-            response = self.model.generate_content(prompt)
-            response_text = response.text.strip()
+    def _record_tier(self, review: Dict[str, Any], tier: str) -> None:
+        review['tier'] = tier
+        self.cascade_stats['reviews'] += 1
+        REVIEW_TIERS.inc(tier=tier)
 
-            # Try to extract JSON from the response
+    def _cache_key(self, position_prompt: PositionPrompt, application_info: str,
+                   policy: Tuple[int, int, float]) -> str:
+        # With several tiers the final review also depends on the escalation thresholds
+        models = self.tiers[0] if len(self.tiers) == 1 else f"{'>'.join(self.tiers)}@{policy}"
+        return make_review_cache_key(
+            self.system_prompt, models, position_prompt.job_name,
+            position_prompt.job_description, position_prompt.tags, application_info
+        )
+
+    async def _get_cached_model(self, position_prompt: PositionPrompt, tier: str):
+        """Return the tier's model bound to the position's cached prefix, creating it if needed.
+
+        Returns None when context caching is disabled, the prefix is too short to
+        cache, or the cache could not be created.
+        """
+        if not GEMINI_CONTEXT_CACHE or position_prompt.prefix_tokens < GEMINI_CONTEXT_CACHE_MIN_TOKENS:
+            return None
+
+        import google.generativeai as genai
+
+        async with position_prompt.cache_lock:
+            cached_model = position_prompt.cached_models.get(tier)
+            expires_at = position_prompt.cache_expires_at.get(tier, 0.0)
+            # Renew a minute early so in-flight calls never hit an expired cache
+            if cached_model is not None and time.time() < expires_at - 60:
+                return cached_model
+            # Creation failed recently; don't retry on every call
+            if tier in position_prompt.cached_models and cached_model is None and time.time() < expires_at:
+                return None
             try:
-                # Remove any markdown code block formatting if present
-                if response_text.startswith('```json'):
-                    response_text = response_text[7:]
-                if response_text.startswith('```'):
-                    response_text = response_text[3:]
-                if response_text.endswith('```'):
-                    response_text = response_text[:-3]
+                cached_content = await asyncio.to_thread(
+                    genai.caching.CachedContent.create,
+                    model=f"models/{tier}",
+                    system_instruction=self.system_prompt,
+                    contents=[position_prompt.job_block],
+                    ttl=datetime.timedelta(seconds=GEMINI_CONTEXT_CACHE_TTL)
+                )
+                position_prompt.cached_models[tier] = genai.GenerativeModel.from_cached_content(
+                    cached_content=cached_content
+                )
+            except Exception as e:
+                logger.warning(f"Context caching unavailable for {position_prompt.job_name} on {tier}: {e}")
+                position_prompt.cached_models[tier] = None
+            position_prompt.cache_expires_at[tier] = time.time() + GEMINI_CONTEXT_CACHE_TTL
+            return position_prompt.cached_models[tier]
 
-                result = json.loads(response_text.strip())
+    def _generation_config(self, schema: Dict[str, Any], max_output_tokens: int = REVIEW_MAX_OUTPUT_TOKENS):
+        """Ask for JSON matching schema when structured output is enabled."""
+        config = {}
+        if GEMINI_STRUCTURED_OUTPUT:
+            config['response_mime_type'] = 'application/json'
+            config['response_schema'] = schema
+        if max_output_tokens > 0:
+            config['max_output_tokens'] = max_output_tokens
+        if not config:
+            return None
+        import google.generativeai as genai
 
-                # Validate the response structure
-                if 'rating' not in result or 'comment' not in result:
-                    raise ValueError("Invalid response structure")
+        return genai.GenerationConfig(**config)
 
-                # Ensure rating is within valid range
-                rating = int(result['rating'])
-                if rating < 1 or rating > 10:
-                    raise ValueError("Rating must be between 1 and 10")
+    async def _generate(self, position_prompt: PositionPrompt, user_block: str, generation_config=None,
+                        priority: str = 'interactive', flow: Hashable = None, tier: Optional[str] = None):
+        """Send the prompt to the tier's model (the strongest by default), recording latency and token usage."""
+        tier = tier or self.tiers[-1]
+        with IN_FLIGHT.track_inprogress(kind='llm_call'), STAGE_LATENCY.time(stage='llm_call'):
+            response = await self._send(position_prompt, user_block, generation_config, priority, flow, tier)
+        usage = getattr(response, 'usage_metadata', None)
+        if usage is not None:
+            LLM_TOKENS.inc(getattr(usage, 'prompt_token_count', 0) or 0, kind='prompt')
+            LLM_TOKENS.inc(getattr(usage, 'candidates_token_count', 0) or 0, kind='response')
+            LLM_TOKENS.inc(getattr(usage, 'cached_content_token_count', 0) or 0, kind='cached')
+        return response
 
-                return {
-                    'rating': rating,
-                    'comment': str(result['comment'])
-                }
+    async def _send(self, position_prompt: PositionPrompt, user_block: str, generation_config,
+                    priority: str, flow: Hashable, tier: str):
+        """Send the prompt, billing only the user block when the prefix is cached."""
+        cached_model = await self._get_cached_model(position_prompt, tier)
+        if cached_model is not None:
+            try:
+                return await self._call_within_quota(
+                    tier, cached_model, user_block, generation_config, priority, flow,
+                    # A cached prefix still counts towards the input-token quota
+                    tokens=position_prompt.prefix_tokens + estimate_tokens(user_block)
+                )
+            except CircuitOpenError:
+                raise
+            except Exception as e:
+                logger.warning(f"Cached-content call failed, resending full prompt: {e}")
+                position_prompt.cached_models.pop(tier, None)
+        prompt = position_prompt.prefix + user_block
+        return await self._call_within_quota(tier, self.models[tier], prompt, generation_config, priority, flow)
 
-            except (json.JSONDecodeError, ValueError) as e:
+    async def _call_within_quota(self, tier: str, model, prompt: str, generation_config, priority: str,
+                                 flow: Hashable, tokens: int = None):
+        """Call the tier's model resiliently, admitting every attempt through the quota scheduler."""
+        if tokens is None:
+            tokens = estimate_tokens(prompt)
+
+        async def attempt():
+            try:
+                return await model.generate_content_async(prompt, generation_config=generation_config)
+            except RATE_LIMIT_EXCEPTIONS:
+                self.scheduler.throttled()
+                raise
+
+        response = await self.callers[tier].call(
+            attempt,
+            admit=lambda: self.scheduler.acquire(tokens, priority, flow),
+            admit_now=lambda: self.scheduler.try_acquire(tokens)
+        )
+        usage = getattr(response, 'usage_metadata', None)
+        if usage is not None:
+            self.scheduler.settle(tokens, getattr(usage, 'prompt_token_count', 0) or 0)
+        return response
+
+    def _parse(self, response_text: str) -> Any:
+        """Parse a response, counting failures so the parse-failure rate can be monitored."""
+        self.parse_stats['responses'] += 1
+        try:
+            return parse_json_response(response_text)
+        except json.JSONDecodeError:
+            self.parse_stats['parse_failures'] += 1
+            raise
+
+    async def _generate_review(self, position_prompt: PositionPrompt, application_info: str, tier: str,
+                               priority: str = 'interactive',
+                               flow: Hashable = None) -> Tuple[Dict[str, Any], Optional[str]]:
+        """Review with one tier's model, returning (review, problem).
+
+        problem is None for a well-formed review, 'salvaged' or 'parse_failure' for
+        malformed output, 'error' for a failed call and 'unavailable' while the circuit is open.
+        """
+        try:
+            response = await self._generate(
+                position_prompt,
+                position_prompt.application_block(application_info),
+                self._generation_config(REVIEW_SCHEMA),
+                priority, flow, tier
+            )
+            response_text = response.text
+            try:
+                return validate_review(self._parse(response_text)), None
+            except (json.JSONDecodeError, ValueError, TypeError, AttributeError) as e:
+                # Recover what we can from malformed or truncated output before giving up
+                salvaged = salvage_review(response_text)
+                if salvaged is not None:
+                    self.parse_stats['salvaged'] += 1
+                    return salvaged, 'salvaged'
                 return {
                     'rating': 0,
                     'comment': "Unable to process application review due to formatting error."
-                }
+                }, 'parse_failure'
 
+        except CircuitOpenError:
+            return {
+                'rating': 0,
+                'comment': "Review service is temporarily unavailable."
+            }, 'unavailable'
         except Exception as e:
+            logger.error(f"Gemini review failed: {e}")
             return {
                 'rating': 0,
                 'comment': "Error occurred during application review."
-            }
+            }, 'error'
+
+    def plan_packs(self, applications: List[Tuple[str, str]], pack_size: int = REVIEW_PACK_SIZE,
+                   token_budget: int = REVIEW_PACK_TOKEN_BUDGET) -> List[List[Tuple[str, str]]]:
+        """Group (application_id, application_info) pairs into packs bounded by count and estimated tokens."""
+        packs: List[List[Tuple[str, str]]] = []
+        current: List[Tuple[str, str]] = []
+        current_tokens = 0
+        for app_id, application_info in applications:
+            tokens = estimate_tokens(application_info)
+            if current and (len(current) >= pack_size or current_tokens + tokens > token_budget):
+                packs.append(current)
+                current, current_tokens = [], 0
+            current.append((app_id, application_info))
+            current_tokens += tokens
+        if current:
+            packs.append(current)
+        return packs
+
+    async def review_pack(self, position_prompt: PositionPrompt, pack: List[Tuple[str, str]],
+                          use_cache: bool = True, priority: str = 'interactive', flow: Hashable = None,
+                          escalation: Optional[EscalationPolicy] = None) -> Dict[str, Dict[str, Any]]:
+        """Review several applications with a single LLM call per model tier.
+
+        Returns application_id -> review. Reviews the position's policy escalates
+        are packed again for the next tier. Applications missing from the model's
+        answer, or with a malformed entry, are reviewed on the single-application path.
+        """
+        policy = self.escalation_policy(escalation)
+        reviews: Dict[str, Dict[str, Any]] = {}
+        pending: List[Tuple[str, str, str]] = []
+        for app_id, application_info in pack:
+            cache_key = self._cache_key(position_prompt, application_info, policy)
+            cached = await self.cache.get(cache_key) if use_cache else None
+            if cached is not None:
+                reviews[app_id] = cached
+            else:
+                pending.append((app_id, application_info, cache_key))
+
+        # (application_id, application_info, tier index to start from) left for the single path
+        fallback: List[Tuple[str, str, int]] = []
+        # Application ID -> review an escalation passed over, kept in case the stronger tiers fail
+        lower_tier_reviews: Dict[str, Dict[str, Any]] = {}
+        packed_count = len(pending)
+        tier_index = 0
+        last = len(self.tiers) - 1
+        while len(pending) > 1:
+            tier = self.tiers[tier_index]
+            # Short ordinal keys keep the pack prompt compact and unambiguous
+            entries = {str(i + 1): item for i, item in enumerate(pending)}
+            escalated: List[Tuple[str, str, str]] = []
+            try:
+                response = await self._generate(
+                    position_prompt,
+                    PositionPrompt.pack_block([(key, item[1]) for key, item in entries.items()]),
+                    self._generation_config(
+                        PACKED_REVIEW_SCHEMA, REVIEW_MAX_OUTPUT_TOKENS * len(entries)
+                    ),
+                    priority, flow, tier
+                )
+                parsed = self._parse(response.text)
+                if not isinstance(parsed, list):
+                    raise ValueError("Packed response is not a JSON array")
+                for entry in parsed:
+                    try:
+                        item = entries.get(str(entry.get('id')))
+                        if item is None or item[0] in reviews or item in escalated:
+                            continue
+                        review = validate_review(entry)
+                    except (AttributeError, ValueError, TypeError):
+                        continue
+                    reason = self._escalation_reason(review, policy) if tier_index < last else None
+                    if reason is not None:
+                        self._record_escalation(tier, reason)
+                        escalated.append(item)
+                        lower_tier_reviews[item[0]] = {**review, 'tier': tier}
+                        continue
+                    self._record_tier(review, tier)
+                    reviews[item[0]] = review
+                    self.cache.set(item[2], review)
+            except Exception as e:
+                logger.warning(f"Packed review of {len(pending)} applications on {tier} failed: {e}")
+
+            # Anything this tier's pack didn't cover is reviewed on its own, from the same tier
+            fallback.extend(
+                (item[0], item[1], tier_index) for item in pending if item[0] not in reviews and item not in escalated
+            )
+            pending = escalated
+            tier_index += 1
+        fallback.extend((app_id, application_info, tier_index) for app_id, application_info, _ in pending)
+
+        if packed_count > 1 and fallback:
+            logger.info(f"Reviewing {len(fallback)} of {packed_count} packed applications on their own")
+        single_reviews = await asyncio.gather(*(
+            self.review_application(
+                position_prompt, application_info, use_cache=False, priority=priority, flow=flow,
+                escalation=escalation, start_tier=start_tier, previous=lower_tier_reviews.get(app_id)
+            )
+            for app_id, application_info, start_tier in fallback
+        ))
+        for (app_id, _, _), review in zip(fallback, single_reviews):
+            reviews[app_id] = review
+        return reviews
@@ -1,17 +1,32 @@
+import time
+
+# Reference point for the cold-start timings reported by /ready and /metrics
+IMPORT_STARTED = time.monotonic()
+
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, PlainTextResponse, JSONResponse, Response
 import logging
 import asyncio
-import time
-from typing import List
+import json
+import os
+from typing import TYPE_CHECKING, Dict, List, Optional
 from google.api_core import exceptions as google_exceptions
 
-from models import PositionReviewRequest, ReviewResponse, ReviewResult
+from models import PositionReviewRequest, ReviewResponse, ReviewResult, ReviewJobRequest, ReviewJobStatus, ReviewPage
 from llm_service import GeminiService
-from firebase import initialize_firebase, FirestoreService
-from firebase_admin import auth
-from firebase.auth_utils import admin_required
-from fastapi import Body, Depends
+from review_pipeline import ReviewPipeline
+from review_jobs import ReviewJobManager
+from document_extraction import DocumentExtractor, FILE_EXTRACTION
+from review_listing import ReviewListing, InvalidCursorError, REVIEW_LIST_MAX_PAGE_SIZE
+from metrics import REGISTRY, STARTUP_SECONDS, stats_collector
+from firebase.auth_utils import admin_required, prefetch_certificates, token_cache
+from fastapi import Body, Depends, Query, Request
+
+if TYPE_CHECKING:
+    from firebase import FirestoreService, AsyncFirestoreService
+    from pre_ranking import PreRanker
 
 logging.basicConfig(
     level=logging.INFO,
@@ -23,12 +38,196 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
+# Seconds a request arriving during warm-up waits for the services before getting a 503
+STARTUP_WAIT_TIMEOUT = float(os.getenv("STARTUP_WAIT_TIMEOUT", "30"))
+# Firestore connection attempts during warm-up; once all fail, /health fails so the instance is restarted
+STARTUP_ATTEMPTS = max(1, int(os.getenv("STARTUP_ATTEMPTS", "5")))
+# Seconds before the first warm-up retry, doubled after each failure up to a minute
+STARTUP_RETRY_DELAY = float(os.getenv("STARTUP_RETRY_DELAY", "2"))
+
+firestore_service: Optional["AsyncFirestoreService"] = None
+gemini_service: Optional[GeminiService] = None
+review_pipeline: Optional[ReviewPipeline] = None
+review_jobs: Optional[ReviewJobManager] = None
+document_extractor: Optional[DocumentExtractor] = None
+review_listing: Optional[ReviewListing] = None
+pre_ranker: Optional["PreRanker"] = None
+
+# Warm-up progress reported by /ready
+startup_task: Optional[asyncio.Task] = None
+startup_state: Dict = {'status': 'starting', 'timings': {}, 'errors': {}}
+
+def record_startup(phase: str) -> float:
+    """Record how long after import a startup phase finished."""
+    elapsed = round(time.monotonic() - IMPORT_STARTED, 3)
+    startup_state['timings'][phase] = elapsed
+    STARTUP_SECONDS.set(elapsed, phase=phase)
+    return elapsed
+
+def init_services(firestore_backend: "FirestoreService", gemini: Optional[GeminiService]) -> None:
+    """Wire the services used by the endpoints. The benchmark suite passes in-memory fakes here."""
+    global firestore_service, gemini_service, review_pipeline, review_jobs, document_extractor, review_listing, pre_ranker
+    from firebase import AsyncFirestoreService
+
+    firestore_service = AsyncFirestoreService(firestore_backend)
+    review_listing = ReviewListing(firestore_service)
+    gemini_service = gemini
+    if FILE_EXTRACTION and document_extractor is None:
+        try:
+            document_extractor = DocumentExtractor()
+            REGISTRY.register_collector(stats_collector(
+                'file_extraction', 'File answer text extraction', lambda: document_extractor.stats
+            ))
+        except OSError as e:
+            logger.warning(f"File extraction disabled: {e}")
+    if pre_ranker is None:
+        # Imported here so NumPy loads during warm-up rather than at import
+        from pre_ranking import PreRanker
+
+        pre_ranker = PreRanker()
+        REGISTRY.register_collector(stats_collector(
+            'pre_rank', 'Embedding pre-ranking', pre_ranker.index_stats,
+            gauges=('index_positions', 'index_vectors')
+        ))
+    if gemini_service is not None:
+        review_pipeline = ReviewPipeline(
+            firestore_service, gemini_service, extractor=document_extractor, on_saved=review_listing.invalidate,
+            ranker=pre_ranker
+        )
+        review_jobs = ReviewJobManager(firestore_service, review_pipeline)
+    else:
+        review_pipeline = None
+        review_jobs = None
+
+    REGISTRY.register_collector(stats_collector(
+        'review_list_cache', 'Stored review page cache', lambda: review_listing.stats
+    ))
+    REGISTRY.register_collector(stats_collector(
+        'position_cache', 'Position cache', firestore_backend.position_cache.stats,
+        gauges=('size', 'listeners')
+    ))
+    if gemini is not None:
+        REGISTRY.register_collector(stats_collector(
+            'review_cache', 'LLM review cache', gemini.cache.stats, gauges=('size',)
+        ))
+        REGISTRY.register_collector(stats_collector(
+            'gemini', 'Gemini resilience decisions', gemini.resilience_stats
+        ))
+        REGISTRY.register_collector(stats_collector(
+            'gemini_parse', 'Gemini response parsing', lambda: gemini.parse_stats
+        ))
+        REGISTRY.register_collector(stats_collector(
+            'gemini_quota', 'Gemini quota scheduling', lambda: gemini.scheduler.stats
+        ))
+        REGISTRY.register_collector(stats_collector(
+            'review_cascade', 'Model tier cascade', lambda: gemini.cascade_stats
+        ))
+    startup_state['status'] = 'ready' if gemini is not None else 'degraded'
+
+def connect_firestore() -> "FirestoreService":
+    """Initialize Firebase and open the Firestore channel with one small read."""
+    from firebase import initialize_firebase, FirestoreService
+
+    db = initialize_firebase()
+    try:
+        db.collection('positions').limit(1).get()
+    except Exception as e:
+        logger.warning(f"Firestore warm-up read failed: {e}")
+    # Admin requests then verify tokens without fetching certificates first
+    prefetch_certificates()
+    record_startup('firestore')
+    return FirestoreService(db)
+
+def create_gemini() -> GeminiService:
+    gemini = GeminiService()
+    record_startup('gemini')
+    return gemini
+
+async def connect_firestore_with_retries() -> "FirestoreService":
+    """connect_firestore with exponential backoff, raising the last error once every attempt failed."""
+    delay = STARTUP_RETRY_DELAY
+    for attempt in range(1, STARTUP_ATTEMPTS + 1):
+        try:
+            firestore_backend = await asyncio.to_thread(connect_firestore)
+            startup_state['errors'].pop('firestore', None)
+            return firestore_backend
+        except Exception as e:
+            startup_state['errors']['firestore'] = str(e)
+            if attempt == STARTUP_ATTEMPTS:
+                raise
+            logger.warning(f"Firestore warm-up attempt {attempt}/{STARTUP_ATTEMPTS} failed, retrying in {delay:.0f}s: {e}")
+            startup_state['status'] = 'retrying'
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 60.0)
+
+async def warm_services() -> None:
+    """Warm Firebase and Gemini concurrently in worker threads, then wire the endpoints."""
+    firestore_backend, gemini = await asyncio.gather(
+        connect_firestore_with_retries(),
+        asyncio.to_thread(create_gemini),
+        return_exceptions=True
+    )
+    if isinstance(gemini, BaseException):
+        logger.warning(f"Gemini service not initialized: {gemini}")
+        startup_state['errors']['gemini'] = str(gemini)
+        gemini = None
+    if isinstance(firestore_backend, BaseException):
+        logger.error(f"Failed to initialize services after {STARTUP_ATTEMPTS} attempts: {firestore_backend}")
+        startup_state['errors']['firestore'] = str(firestore_backend)
+        startup_state['status'] = 'failed'
+        return
+
+    try:
+        init_services(firestore_backend, gemini)
+        if review_jobs is not None:
+            await review_jobs.start()
+    except Exception as e:
+        logger.error(f"Failed to start services: {e}")
+        startup_state['errors']['startup'] = str(e)
+        startup_state['status'] = 'failed'
+        return
+    ready_after = record_startup('ready')
+    logger.info(f"Services ready {ready_after:.2f}s after import ({startup_state['status']})")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start warming services in the background so the port opens (and /health answers) immediately."""
+    global startup_task
+    record_startup('imports')
+    # Offline runs (the benchmark suite) call init_services themselves
+    if not os.getenv("REVIEW_SERVICE_OFFLINE"):
+        startup_task = asyncio.create_task(warm_services())
+    yield
+    if startup_task is not None and not startup_task.done():
+        startup_task.cancel()
+    if review_jobs is not None:
+        await review_jobs.stop()
+    if firestore_service is not None:
+        # Stop the position snapshot listeners and their watch threads before the pool goes away
+        firestore_service.service.position_cache.close()
+        firestore_service.shutdown(wait=False)
+    if document_extractor is not None:
+        document_extractor.shutdown()
+
+async def wait_until_ready() -> None:
+    """Hold requests that arrive during warm-up until the services are up or the wait times out."""
+    if startup_task is not None and not startup_task.done():
+        try:
+            await asyncio.wait_for(asyncio.shield(startup_task), STARTUP_WAIT_TIMEOUT)
+        except asyncio.TimeoutError:
+            pass
+
 app = FastAPI(
     title="Job Application Review Service",
     description="A FastAPI service that reviews job applications using LLM",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
+REGISTRY.register_collector(stats_collector(
+    'id_token_cache', 'ID token verifier cache', token_cache.stats, gauges=('size',)
+))
+
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -38,153 +237,148 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize services
-try:
-    db = initialize_firebase()
-    firestore_service = FirestoreService(db)
+def to_http_exception(e: Exception) -> HTTPException:
+    """Map an error raised while reviewing to the HTTP error returned to the client."""
+    if isinstance(e, HTTPException):
+        return e
+    if isinstance(e, google_exceptions.NotFound):
+        logger.error(f"Resource not found: {e}")
+        return HTTPException(status_code=404, detail=str(e))
+    if isinstance(e, google_exceptions.PermissionDenied):
+        logger.error(f"Permission denied: {e}")
+        return HTTPException(status_code=403, detail="Permission denied")
+    logger.error(f"Error processing applications: {e}")
+    return HTTPException(status_code=500, detail="Internal server error")
+
+@app.post("/review-applications", response_model=List[ReviewResult], dependencies=[Depends(wait_until_ready)])
+async def review_applications(request: PositionReviewRequest):
+    if review_pipeline is None:
+        raise HTTPException(
+            status_code=503,
+            detail="Review service is currently unavailable"
+        )
     try:
-        gemini_service = GeminiService()
+        batch = await review_pipeline.prepare(request)
+        return await review_pipeline.run(batch)
     except Exception as e:
-        logger.warning(f"Gemini service not initialized: {e}")
-        gemini_service = None
-    logger.info("Firebase services initialized successfully")
-except Exception as e:
-    logger.error(f"Failed to initialize services: {e}")
-    raise
-
-@app.post("/review-applications", response_model=List[ReviewResult])
-async def review_applications(request: PositionReviewRequest):
-    if gemini_service is None:
+        raise to_http_exception(e)
+
+@app.post("/review-applications/stream", dependencies=[Depends(wait_until_ready)])
+async def review_applications_stream(request: PositionReviewRequest):
+    """Stream each review as NDJSON as soon as it is done, followed by a summary line."""
+    if review_pipeline is None:
         raise HTTPException(
             status_code=503,
             detail="Review service is currently unavailable"
         )
+    # Validation errors surface as regular HTTP errors before the stream starts
     try:
-        logger.info(f"Processing applications for position: {request.position_id}")
+        batch = await review_pipeline.prepare(request)
+    except Exception as e:
+        raise to_http_exception(e)
 
-        # Validate application_ids if provided
-        if request.application_ids is not None:
-            if len(request.application_ids) > 10:
-                raise HTTPException(
-                    status_code=400,
-                    detail="Cannot review more than 10 applications at once"
-                )
-            logger.info(f"Filtering to specific applications: {request.application_ids}")
+    async def events():
+        try:
+            async for event in review_pipeline.stream(batch):
+                yield json.dumps(event) + "\n"
+        except Exception as e:
+            logger.error(f"Error streaming reviews for position {request.position_id}: {e}")
+            yield json.dumps({'type': 'error', 'detail': "Internal server error"}) + "\n"
 
-        # Get position and applications from Firestore
-        position, applications = firestore_service.get_position_with_applications(request.position_id)
-        logger.info(f"Retrieved position: {position is not None}, applications count: {len(applications) if applications else 0}")
+    return StreamingResponse(events(), media_type="application/x-ndjson")
 
+@app.post("/review-jobs", response_model=ReviewJobStatus, status_code=202, dependencies=[Depends(wait_until_ready)])
+async def submit_review_job(
+    request: ReviewJobRequest,
+    decoded_token: dict = Depends(admin_required)
+):
+    """Queue a background review of every application of a position (optionally filtered by status)."""
+    if review_jobs is None:
+        raise HTTPException(
+            status_code=503,
+            detail="Review service is currently unavailable"
+        )
+    try:
+        position = await firestore_service.get_position(request.position_id)
         if not position:
             raise HTTPException(status_code=404, detail="Position not found")
-
-        # Check if position is active
         if position.status != 'active':
             raise HTTPException(
                 status_code=400,
                 detail=f"Position is not active. Current status: {position.status}. Only active positions can be reviewed."
             )
+        job_id = await review_jobs.submit(request)
+        return await review_jobs.get_status(job_id)
+    except Exception as e:
+        raise to_http_exception(e)
 
-        if not applications:
-            logger.warning(f"No applications found for position {request.position_id}")
-            return []
-
-        # Filter applications if specific IDs are provided
-        if request.application_ids is not None:
-            # Create a set for faster lookup
-            requested_ids = set(request.application_ids)
-            filtered_applications = [app for app in applications if app.id in requested_ids]
-
-            # Check if all requested applications were found
-            found_ids = {app.id for app in filtered_applications}
-            missing_ids = requested_ids - found_ids
-            if missing_ids:
-                logger.warning(f"Some requested applications not found: {missing_ids}")
-
-            applications = filtered_applications
-            logger.info(f"Filtered to {len(applications)} applications out of {len(request.application_ids)} requested")
-
-        if not applications:
-            raise HTTPException(status_code=400, detail="No valid applications found for review")
-
-        # Convert Firestore data to LLM format (without names)
-        llm_data = firestore_service.convert_firestore_to_llm_format(position, applications)
-        results = []
-
-        for i, application in enumerate(llm_data['applications']):
-            app_id = application['id']
-
-            # Process all questions and extract text from answers
-            application_info_parts = []
-
-            for question in application['questions']:
-                # Skip file type questions for now
-                if question['type'] == 'file':
-                    continue
-
-                # For text questions, use the answer directly
-                answer_text = question['answer']
-                if answer_text.strip():
-                    application_info_parts.append(f"{question['label']}: {answer_text}")
-
-            # Consolidate all information
-            application_info = "\n\n".join(application_info_parts)
-
-            if not application_info.strip():
-                logger.error(f"No valid application info for application {app_id}")
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Application {app_id} has no valid information for review"
-                )
-
-            # Send to LLM for review with job name, description, and tags (without applicant name)
-            review = await gemini_service.review_application(
-                job_name=llm_data['job_name'],
-                job_description=llm_data['job_description'],
-                tags=llm_data['tags'],
-                application_info=application_info
-            )
-
-            results.append(ReviewResult(
-                name=app_id,  # Use application ID instead of name
-                rating=review['rating'],
-                comment=review['comment']
-            ))
+@app.get("/review-jobs/{job_id}", response_model=ReviewJobStatus, dependencies=[Depends(wait_until_ready)])
+async def get_review_job(
+    job_id: str,
+    limit: int = Query(100, ge=1, le=REVIEW_LIST_MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page of outcomes"),
+    decoded_token: dict = Depends(admin_required)
+):
+    """Poll the progress of a review job with one page of its per-application outcomes."""
+    if review_jobs is None:
+        raise HTTPException(
+            status_code=503,
+            detail="Review service is currently unavailable"
+        )
+    try:
+        job = await review_jobs.get_status(job_id, limit, cursor)
+    except Exception as e:
+        raise to_http_exception(e)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Review job not found")
+    return job
+
+@app.get("/positions/{position_id}/reviews", response_model=ReviewPage, dependencies=[Depends(wait_until_ready)])
+async def list_reviews(
+    position_id: str,
+    request: Request,
+    limit: int = Query(50, ge=1, le=REVIEW_LIST_MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    sort: str = Query('created', pattern='^(created|rating)$'),
+    order: str = Query('desc', pattern='^(asc|desc)$'),
+    decoded_token: dict = Depends(admin_required)
+):
+    """Page through a position's stored reviews, newest (or highest rated) first by default.
 
-            logger.info(f"Review completed for application {app_id}: rating={review['rating']}")
-
-            # Save review to Firestore if rating is greater than 0
-            if review['rating'] > 0:
-                try:
-                    review_id = firestore_service.save_application_review(
-                        position_id=request.position_id,
-                        application_id=app_id,
-                        rating=review['rating'],
-                        comment=review['comment']
-                    )
-                    logger.info(f"Review saved: {review_id}")
-                except Exception as e:
-                    logger.error(f"Failed to save review for application {app_id}: {e}")
-
-        return results
-
-    except HTTPException:
-        raise
-    except google_exceptions.NotFound as e:
-        logger.error(f"Resource not found: {e}")
-        raise HTTPException(status_code=404, detail=str(e))
-    except google_exceptions.PermissionDenied as e:
-        logger.error(f"Permission denied: {e}")
-        raise HTTPException(status_code=403, detail="Permission denied")
+    Responses carry an ETag; send it back as If-None-Match to get a 304 when nothing changed.
+    """
+    if review_listing is None:
+        raise HTTPException(
+            status_code=503,
+            detail="Review service is currently unavailable"
+        )
+    try:
+        position = await firestore_service.get_position(position_id)
+        if not position:
+            raise HTTPException(status_code=404, detail="Position not found")
+        etag, page = await review_listing.get_page(
+            position_id, sort, order == 'desc', limit, cursor, request.headers.get('if-none-match')
+        )
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        logger.error(f"Error processing applications: {e}")
-        raise HTTPException(status_code=500, detail="Internal server error")
+        raise to_http_exception(e)
+
+    headers = {'ETag': etag, 'Cache-Control': 'private, no-cache', 'Vary': 'Accept-Encoding, Authorization'}
+    if page is None:
+        return Response(status_code=304, headers=headers)
+    # Compressed here rather than by middleware, which would buffer the NDJSON review stream
+    if 'gzip' in request.headers.get('accept-encoding', '').lower():
+        return Response(page.gzipped, media_type='application/json', headers={**headers, 'Content-Encoding': 'gzip'})
+    return Response(page.body, media_type='application/json', headers=headers)
 
-@app.post("/make-admin")
+@app.post("/make-admin", dependencies=[Depends(wait_until_ready)])
 async def make_admin(
     data: dict = Body(..., example={"uid": "target_user_uid"}),
     decoded_token: dict = Depends(admin_required)
 ):
+    from firebase_admin import auth
+
     uid = data.get("uid")
     if not uid:
         raise HTTPException(status_code=400, detail="UID is required")
@@ -198,11 +392,32 @@ async def make_admin(
         logger.error(f"Failed to set admin claim for {uid}: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to set admin claim: {e}")
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus text-format metrics."""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/health")
 async def health_check():
-    """Health check endpoint."""
+    """Liveness check: up while the services warm or run, 503 once warm-up has given up so the instance is restarted."""
+    if startup_state['status'] == 'failed':
+        return JSONResponse(
+            {"status": "unhealthy", "service": "Job Application Review Service", "errors": startup_state['errors']},
+            status_code=503
+        )
     return {"status": "healthy", "service": "Job Application Review Service"}
 
+@app.get("/ready")
+async def readiness_check():
+    """Readiness check: 200 once Firestore (and ideally Gemini) are initialized, 503 before that."""
+    body = {
+        "status": startup_state['status'],
+        "startup_seconds": startup_state['timings'],
+        "errors": startup_state['errors']
+    }
+    ready = startup_state['status'] in ('ready', 'degraded')
+    return JSONResponse(body, status_code=200 if ready else 503)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8081)
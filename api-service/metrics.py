@@ -0,0 +1,278 @@
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Latency buckets in seconds, from fast Firestore reads to slow LLM calls
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+# A collector returns (name, type, help, [(labels, value), ...]) tuples at scrape time
+Sample = Tuple[Dict[str, str], float]
+CollectorResult = Iterable[Tuple[str, str, str, List[Sample]]]
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ''
+    parts = []
+    for key, value in labels.items():
+        escaped = str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+        parts.append(f'{key}="{escaped}"')
+    return '{' + ','.join(parts) + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    type_name = ''
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key: Tuple[str, ...]) -> Dict[str, str]:
+        return dict(zip(self.labelnames, key))
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    type_name = 'counter'
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            return [f"{self.name}{_format_labels(self._labels(key))} {_format_value(value)}"
+                    for key, value in self._values.items()]
+
+
+class Gauge(_Metric):
+    type_name = 'gauge'
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track_inprogress(self, **labels):
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            return [f"{self.name}{_format_labels(self._labels(key))} {_format_value(value)}"
+                    for key, value in self._values.items()]
+
+
+class Histogram(_Metric):
+    type_name = 'histogram'
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # key -> (bucket counts, sum, count)
+        self._values: Dict[Tuple[str, ...], List] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall-clock duration of the with-block, even if it raises."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self) -> List[str]:
+        lines = []
+        with self._lock:
+            for key, (bucket_counts, total, count) in self._values.items():
+                labels = self._labels(key)
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, bucket_counts):
+                    cumulative += bucket_count
+                    bucket_labels = {**labels, 'le': _format_value(bound)}
+                    lines.append(f"{self.name}_bucket{_format_labels(bucket_labels)} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(total)}")
+                lines.append(f"{self.name}_count{_format_labels(labels)} {count}")
+        return lines
+
+
+class Registry:
+    """Holds metrics and scrape-time collectors, and renders the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        # Keyed by name so registering a component again replaces its old collector
+        self._collectors: Dict[str, Callable[[], CollectorResult]] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, help_text, labelnames))
+
+    def gauge(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()) -> Gauge:
+        return self.register(Gauge(name, help_text, labelnames))
+
+    def histogram(self, name: str, help_text: str, labelnames: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help_text, labelnames, buckets))
+
+    def register_collector(self, collector: Callable[[], CollectorResult], name: Optional[str] = None) -> None:
+        """Add a callback that reports values owned elsewhere (e.g. cache stats) at scrape time.
+
+        A collector registered under the name of an earlier one replaces it, so
+        re-initializing a component never emits its metric families twice. The name
+        defaults to the collector's prefix for stats_collector callbacks.
+        """
+        name = name or getattr(collector, 'prefix', None) or f"collector-{id(collector)}"
+        with self._lock:
+            self._collectors[name] = collector
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors.values())
+
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            lines.extend(metric.render())
+        for collector in collectors:
+            for name, type_name, help_text, samples in collector():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {type_name}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+# Shared metrics recorded across the service
+STAGE_LATENCY = REGISTRY.histogram(
+    'review_stage_duration_seconds',
+    'Latency of each review pipeline stage',
+    ('stage',)
+)
+LLM_TOKENS = REGISTRY.counter(
+    'gemini_tokens_total',
+    'Tokens reported by Gemini usage metadata',
+    ('kind',)
+)
+REVIEW_OUTCOMES = REGISTRY.counter(
+    'reviews_total',
+    'Reviews produced, by outcome',
+    ('outcome',)
+)
+REVIEW_TIERS = REGISTRY.counter(
+    'review_tier_results_total',
+    'Final reviews by the model tier that produced them',
+    ('tier',)
+)
+REVIEW_ESCALATIONS = REGISTRY.counter(
+    'review_escalations_total',
+    'Reviews handed to the next model tier, by the tier escalated from and the reason',
+    ('tier', 'reason')
+)
+IN_FLIGHT = REGISTRY.gauge(
+    'in_flight',
+    'Work currently in progress, by kind',
+    ('kind',)
+)
+QUOTA_QUEUE_DEPTH = REGISTRY.gauge(
+    'gemini_quota_queue_depth',
+    'Gemini calls waiting for quota, by priority',
+    ('priority',)
+)
+QUOTA_WAIT = REGISTRY.histogram(
+    'gemini_quota_wait_seconds',
+    'Time Gemini calls waited for quota, by priority',
+    ('priority',)
+)
+COALESCED_CALLS = REGISTRY.counter(
+    'coalesced_calls_total',
+    'Duplicate in-flight work joined instead of repeated, by kind',
+    ('kind',)
+)
+STARTUP_SECONDS = REGISTRY.gauge(
+    'startup_duration_seconds',
+    'Seconds from import to each startup milestone (imports, firestore, gemini, ready)',
+    ('phase',)
+)
+
+
+def stats_collector(prefix: str, help_text: str, get_stats: Callable[[], Optional[Dict[str, float]]],
+                    gauges: Tuple[str, ...] = ()) -> Callable[[], CollectorResult]:
+    """Expose a component's stats dict as {prefix}_{key} metrics.
+
+    Keys listed in gauges are reported as gauges, the rest as counters.
+    """
+    def collect() -> CollectorResult:
+        stats = get_stats() or {}
+        for key, value in stats.items():
+            if key in gauges:
+                yield f"{prefix}_{key}", 'gauge', f"{help_text}: {key}", [({}, value)]
+            else:
+                yield f"{prefix}_{key}_total", 'counter', f"{help_text}: {key}", [({}, value)]
+    collect.prefix = prefix
+    return collect
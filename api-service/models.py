@@ -1,10 +1,16 @@
+from functools import cached_property
 from pydantic import BaseModel, Field, validator
-from typing import List, Dict, Optional, Any
+from typing import ClassVar, List, Dict, Optional, Any, Tuple
 
 # API Request/Response Models
 class PositionReviewRequest(BaseModel):
     position_id: str
     application_ids: List[str] = Field(description="List of specific application IDs to review")
+    bypass_cache: bool = Field(default=False, description="Skip cached reviews and call the LLM again")
+    packed: bool = Field(default=False, description="Review several applications per LLM call")
+    incremental: bool = Field(default=False, description="Reuse stored reviews of applications unchanged since they were reviewed")
+    shortlist_top_k: Optional[int] = Field(default=None, ge=1, description="Only send the K applications most similar to the position to the LLM")
+    shortlist_min_score: Optional[float] = Field(default=None, ge=-1, le=1, description="Only send applications at least this similar (cosine) to the position to the LLM")
 
     @validator('application_ids')
     def validate_application_ids(cls, v):
@@ -22,11 +28,70 @@ class ReviewResult(BaseModel):
     name: str
     rating: int
     comment: str
+    tier: Optional[str] = Field(default=None, description="Model that produced the review")
 
 class ReviewResponse(BaseModel):
     results: List[ReviewResult]
 
+class StoredReview(BaseModel):
+    application_id: str
+    rating: int
+    comment: str
+    created_at: Optional[str] = None
+    tier: Optional[str] = None
+
+class ReviewPage(BaseModel):
+    reviews: List[StoredReview]
+    next_cursor: Optional[str] = Field(default=None, description="Pass as cursor to get the next page; null on the last page")
+
+class ReviewJobRequest(BaseModel):
+    position_id: str
+    statuses: Optional[List[str]] = Field(default=None, description="Only review applications with these statuses")
+    bypass_cache: bool = Field(default=False, description="Skip cached reviews and call the LLM again")
+    packed: bool = Field(default=False, description="Review several applications per LLM call")
+    incremental: bool = Field(default=False, description="Reuse stored reviews of applications unchanged since they were reviewed")
+    shortlist_top_k: Optional[int] = Field(default=None, ge=1, description="Only send the K applications most similar to the position to the LLM")
+    shortlist_min_score: Optional[float] = Field(default=None, ge=-1, le=1, description="Only send applications at least this similar (cosine) to the position to the LLM")
+
+    @validator('statuses')
+    def validate_statuses(cls, v):
+        if v is None:
+            return v
+        valid_statuses = ['pending', 'accepted', 'rejected', 'reviewed']
+        invalid = [status for status in v if status not in valid_statuses]
+        if invalid or not v:
+            raise ValueError(f"Invalid statuses: {invalid}. Must be a non-empty subset of {valid_statuses}")
+        return v
+
+    class Config:
+        alias_generator = lambda string: string.replace('_', '') if string == 'position_id' else string
+        populate_by_name = True
+
+class ReviewJobStatus(BaseModel):
+    job_id: str
+    position_id: str
+    status: str
+    statuses: Optional[List[str]] = None
+    processed: int = 0
+    reviewed: int = 0
+    failed: int = 0
+    filtered_out: int = Field(default=0, description="Applications left out by the shortlist")
+    results: Dict[str, int] = Field(default_factory=dict, description="Application ID to rating for completed reviews on this page of outcomes")
+    failures: Dict[str, str] = Field(default_factory=dict, description="Application ID to error for failed reviews on this page of outcomes")
+    filtered: Dict[str, float] = Field(default_factory=dict, description="Application ID to similarity score for applications left out by the shortlist on this page of outcomes")
+    next_cursor: Optional[str] = Field(default=None, description="Pass as cursor to get the next page of outcomes; None on the last page")
+    error: Optional[str] = None
+
 # Firestore Data Models with Validation
+class EscalationPolicy(BaseModel):
+    """Per-position override of when a cheaper model's review is redone by the next model tier.
+
+    Unset fields fall back to the service defaults.
+    """
+    min_rating: Optional[int] = Field(default=None, ge=1, le=10, description="Lowest borderline rating")
+    max_rating: Optional[int] = Field(default=None, ge=1, le=10, description="Highest borderline rating")
+    min_confidence: Optional[float] = Field(default=None, ge=0, le=1, description="Escalate reviews less confident than this")
+
 class Position(BaseModel):
     id: str
     name: str = Field(..., min_length=1, description="Position name cannot be empty")
@@ -34,6 +99,7 @@ class Position(BaseModel):
     tags: List[str] = Field(default_factory=list)
     status: str = Field(..., description="Position status")
     questions: List[Dict] = Field(default_factory=list)
+    escalation: Optional[EscalationPolicy] = None
     created_at: Optional[Any] = None
     updated_at: Optional[Any] = None
 
@@ -50,6 +116,14 @@ class Position(BaseModel):
             raise ValueError("Field cannot be empty")
         return v.strip()
 
+    @cached_property
+    def question_schema(self) -> Tuple[Tuple[str, str], ...]:
+        """(label, type) of each question, built once per cached position."""
+        return tuple(
+            (question.get('label', f'Question {i+1}'), question.get('type', 'text'))
+            for i, question in enumerate(self.questions)
+        )
+
 class Application(BaseModel):
     id: str
     name: str = Field(..., min_length=1, description="Application name cannot be empty")
@@ -77,3 +151,31 @@ class Application(BaseModel):
         if v not in valid_statuses:
             raise ValueError(f"Invalid status: {v}. Must be one of {valid_statuses}")
         return v
+
+class ReviewApplication(BaseModel):
+    """The part of an application the review path reads; name and email are never fetched."""
+    id: str
+    questions: Dict[str, str]
+    status: str = "pending"
+
+    # Firestore field mask for review reads
+    FIELD_MASK: ClassVar[Tuple[str, ...]] = ('questions', 'status')
+
+    @classmethod
+    def from_firestore(cls, doc_id: str, data: Dict[str, Any]) -> "ReviewApplication":
+        """Build from a projected document without running pydantic validation.
+
+        Applies the same checks as Application's validators to the fetched
+        fields, then uses model_construct; raises ValueError on bad data.
+        """
+        questions = data.get('questions')
+        if not questions or not isinstance(questions, dict):
+            raise ValueError("Application questions must be a non-empty dictionary")
+        for label, answer in questions.items():
+            if not isinstance(label, str) or not isinstance(answer, str):
+                raise ValueError(f"Answer to {label!r} must be a string")
+        status = data.get('status', 'pending')
+        valid_statuses = ['pending', 'accepted', 'rejected', 'reviewed']
+        if status not in valid_statuses:
+            raise ValueError(f"Invalid status: {status}. Must be one of {valid_statuses}")
+        return cls.model_construct(id=doc_id, questions=questions, status=status)
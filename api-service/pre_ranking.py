@@ -0,0 +1,221 @@
+import asyncio
+import hashlib
+import importlib
+import logging
+import math
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from metrics import STAGE_LATENCY
+
+logger = logging.getLogger(__name__)
+
+# Length of the hashed feature vectors (4 bytes per dimension per application)
+PRE_RANK_DIMENSIONS = int(os.getenv("PRE_RANK_DIMENSIONS", "1024"))
+# Number of positions whose application vectors are kept in memory
+PRE_RANK_INDEX_POSITIONS = int(os.getenv("PRE_RANK_INDEX_POSITIONS", "16"))
+# Optional "module:factory" returning an embedder to use instead of the hashing default
+PRE_RANK_EMBEDDER = os.getenv("PRE_RANK_EMBEDDER", "")
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9][a-z0-9+#.]*[a-z0-9+#]|[a-z0-9]")
+
+# Words too common in applications and job posts to say anything about fit
+STOP_WORDS = frozenset("""
+a an and are as at be been but by can do for from had has have he her his i if in into is it its
+me my no not of on or our she so than that the their them then there these they this to was we
+were what when which who will with would you your
+""".split())
+
+
+class HashingEmbedder:
+    """Signed feature hashing of word unigrams and bigrams with sublinear term frequency.
+
+    Needs no model or network access. Features are hashed with blake2b rather
+    than hash() so vectors are identical across processes and restarts.
+    """
+
+    def __init__(self, dimensions: int = PRE_RANK_DIMENSIONS):
+        self.dimensions = dimensions
+        self.name = f"hashing-{dimensions}"
+        self._bucket = lru_cache(maxsize=65536)(self._hash_feature)
+
+    def _hash_feature(self, feature: str) -> Tuple[int, float]:
+        digest = int.from_bytes(hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest(), 'little')
+        return digest % self.dimensions, 1.0 if digest >> 63 else -1.0
+
+    @staticmethod
+    def features(text: str) -> Counter:
+        words = [word for word in _TOKEN_PATTERN.findall(text.lower()) if word not in STOP_WORDS]
+        features = Counter(words)
+        features.update(f"{first} {second}" for first, second in zip(words, words[1:]))
+        return features
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """Return one L2-normalized float32 row per text (all zeros for a text with no features)."""
+        matrix = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            features = self.features(text)
+            if not features:
+                continue
+            buckets = [self._bucket(feature) for feature in features]
+            indexes = np.fromiter((index for index, _ in buckets), dtype=np.int64, count=len(buckets))
+            weights = np.fromiter(
+                (sign * (1.0 + math.log(count)) for (_, sign), count in zip(buckets, features.values())),
+                dtype=np.float32, count=len(buckets)
+            )
+            # Colliding features add up in their shared bucket
+            np.add.at(matrix[row], indexes, weights)
+        return normalize_rows(matrix)
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def load_embedder(spec: str = PRE_RANK_EMBEDDER):
+    """Build the embedder named by a "module:factory" spec, or the hashing default.
+
+    An embedder needs a name (stored vectors are dropped when it changes) and
+    embed(texts) returning a float32 matrix with one L2-normalized row per text.
+    """
+    if not spec:
+        return HashingEmbedder()
+    module_name, _, factory_name = spec.partition(':')
+    factory = getattr(importlib.import_module(module_name), factory_name or 'create_embedder')
+    return factory()
+
+
+class PositionIndex:
+    """Vectors of one position's applications, stored as rows of a single float32 matrix."""
+
+    def __init__(self, embedder_name: str):
+        self.embedder_name = embedder_name
+        # Application ID -> row, and the digest of the text each row was embedded from
+        self.rows: Dict[str, int] = {}
+        self.digests: List[str] = []
+        self.matrix: Optional[np.ndarray] = None
+        self.size = 0
+        self.query_text: Optional[str] = None
+        self.query: Optional[np.ndarray] = None
+
+    def stale(self, items: List[Tuple[str, str]]) -> List[int]:
+        """Positions in items of the (application ID, digest) pairs that need embedding."""
+        return [
+            i for i, (app_id, digest) in enumerate(items)
+            if app_id not in self.rows or self.digests[self.rows[app_id]] != digest
+        ]
+
+    def put(self, items: List[Tuple[str, str]], vectors: np.ndarray) -> None:
+        if self.matrix is None:
+            self.matrix = np.zeros((max(64, len(items)), vectors.shape[1]), dtype=np.float32)
+        for (app_id, digest), vector in zip(items, vectors):
+            row = self.rows.get(app_id)
+            if row is None:
+                if self.size == len(self.matrix):
+                    # Grow geometrically so adding applications one page at a time stays cheap
+                    grown = np.zeros((2 * len(self.matrix), self.matrix.shape[1]), dtype=np.float32)
+                    grown[:self.size] = self.matrix[:self.size]
+                    self.matrix = grown
+                row = self.size
+                self.size += 1
+                self.rows[app_id] = row
+                self.digests.append(digest)
+            self.digests[row] = digest
+            self.matrix[row] = vector
+
+    def similarities(self, app_ids: List[str]) -> np.ndarray:
+        """Cosine similarity of each application to the position, in one matrix-vector product."""
+        rows = np.fromiter((self.rows[app_id] for app_id in app_ids), dtype=np.int64, count=len(app_ids))
+        return self.matrix[rows] @ self.query
+
+
+class PreRanker:
+    """Cheap first pass that shortlists the applications worth a full LLM review.
+
+    The position (name, description, tags) and every application's review text
+    are embedded into one vector space, and applications are ranked by cosine
+    similarity to the position. Application vectors are kept per position and
+    only recomputed when an application's text changes.
+    """
+
+    def __init__(self, embedder=None, max_positions: int = PRE_RANK_INDEX_POSITIONS):
+        self.embedder = embedder if embedder is not None else load_embedder()
+        self.max_positions = max_positions
+        self.stats: Dict[str, int] = {'scored': 0, 'embedded': 0, 'shortlisted': 0, 'filtered': 0}
+        self._indexes: "OrderedDict[str, PositionIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def score(self, position_id: str, position_text: str,
+                    inputs: List[Tuple[str, str]]) -> Dict[str, float]:
+        """Similarity of each (application_id, application_info) to the position."""
+        if not inputs:
+            return {}
+        with STAGE_LATENCY.time(stage='pre_rank'):
+            # Embedding is CPU-bound, so keep it off the event loop
+            return await asyncio.to_thread(self._score, position_id, position_text, inputs)
+
+    async def shortlist(self, position_id: str, position_text: str, inputs: List[Tuple[str, str]],
+                        top_k: Optional[int] = None,
+                        min_score: Optional[float] = None) -> Tuple[List[Tuple[str, str]], Dict[str, float]]:
+        """Split inputs into those worth reviewing (in input order) and application_id -> score for the rest.
+
+        Keeps applications scoring at least min_score and, of those, the top_k best.
+        """
+        if top_k is None and min_score is None:
+            return inputs, {}
+        scores = await self.score(position_id, position_text, inputs)
+        keep = [app_id for app_id, _ in inputs if min_score is None or scores[app_id] >= min_score]
+        if top_k is not None and len(keep) > top_k:
+            keep = sorted(keep, key=lambda app_id: scores[app_id], reverse=True)[:top_k]
+        keep = set(keep)
+        kept = [item for item in inputs if item[0] in keep]
+        filtered = {app_id: scores[app_id] for app_id, _ in inputs if app_id not in keep}
+        self.stats['shortlisted'] += len(kept)
+        self.stats['filtered'] += len(filtered)
+        return kept, filtered
+
+    def _score(self, position_id: str, position_text: str, inputs: List[Tuple[str, str]]) -> Dict[str, float]:
+        items = [(app_id, _digest(application_info)) for app_id, application_info in inputs]
+        with self._lock:
+            index = self._index(position_id)
+            stale = index.stale(items)
+            if stale:
+                vectors = self.embedder.embed([inputs[i][1] for i in stale])
+                index.put([items[i] for i in stale], np.asarray(vectors, dtype=np.float32))
+                self.stats['embedded'] += len(stale)
+            if index.query_text != position_text:
+                index.query = np.asarray(self.embedder.embed([position_text])[0], dtype=np.float32)
+                index.query_text = position_text
+            app_ids = [app_id for app_id, _ in items]
+            similarities = index.similarities(app_ids)
+            self.stats['scored'] += len(app_ids)
+        return {app_id: round(float(score), 4) for app_id, score in zip(app_ids, similarities)}
+
+    def _index(self, position_id: str) -> PositionIndex:
+        index = self._indexes.get(position_id)
+        if index is None or index.embedder_name != self.embedder.name:
+            index = self._indexes[position_id] = PositionIndex(self.embedder.name)
+        self._indexes.move_to_end(position_id)
+        while len(self._indexes) > self.max_positions:
+            self._indexes.popitem(last=False)
+        return index
+
+    def index_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'index_positions': len(self._indexes),
+                'index_vectors': sum(index.size for index in self._indexes.values()),
+                **self.stats
+            }
+
+
+def _digest(text: str) -> str:
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
@@ -0,0 +1,85 @@
+import asyncio
+import os
+from typing import Dict, List, Optional, Any, Tuple
+
+from review_parsing import MAX_COMMENT_CHARS
+
+# Rough characters-per-token ratio used for budgeting without a tokenizer round-trip
+CHARS_PER_TOKEN = 4
+# Maximum tokens kept from a single answer before it is truncated
+MAX_ANSWER_TOKENS = int(os.getenv("MAX_ANSWER_TOKENS", "1000"))
+# Maximum tokens kept from the extracted text of a file answer (e.g. a resume)
+MAX_FILE_ANSWER_TOKENS = int(os.getenv("MAX_FILE_ANSWER_TOKENS", "2500"))
+
+TRUNCATION_MARKER = " [truncated]"
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate for budgeting."""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def truncate_answer(text: str, max_tokens: int = MAX_ANSWER_TOKENS) -> str:
+    """Cut an answer down to roughly max_tokens, ending on a word boundary."""
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if max_tokens <= 0 or len(text) <= max_chars:
+        return text
+    cut = text[:max_chars]
+    space = cut.rfind(' ')
+    if space > max_chars // 2:
+        cut = cut[:space]
+    return cut.rstrip() + TRUNCATION_MARKER
+
+
+def position_text(job_name: str, job_description: str, tags: Optional[List[str]]) -> str:
+    """Plain text of a position, used to rank applications against it."""
+    return "\n\n".join(part for part in (job_name, job_description, ", ".join(tags or [])) if part)
+
+
+class PositionPrompt:
+    """Prompt pieces shared by every application of one position.
+
+    The job block is assembled once per position; each review only appends the
+    application block. When context caching is enabled, GeminiService stores the
+    models bound to the cached prefix on this object, one per model tier.
+    """
+
+    def __init__(self, system_prompt: str, job_name: str, job_description: str, tags: Optional[List[str]] = None):
+        self.system_prompt = system_prompt
+        self.job_name = job_name
+        self.job_description = job_description
+        self.tags = list(tags or [])
+
+        tags_text = ', '.join(self.tags) if self.tags else 'None'
+        self.job_block = (
+            "Please review this job application:\n\n"
+            f"Job Position: {job_name}\n\n"
+            f"Job Description:\n{job_description}\n\n"
+            f"Job Tags: {tags_text}\n\n"
+            f"Keep each comment under {MAX_COMMENT_CHARS} characters.\n\n"
+        )
+        self.prefix = f"{system_prompt}\n\nUser Input:\n{self.job_block}"
+        self.prefix_tokens = estimate_tokens(self.prefix)
+
+        # Context caching state, managed by GeminiService
+        # Model name -> model bound to the cached prefix (None when caching failed), and its expiry
+        self.cached_models: Dict[str, Any] = {}
+        self.cache_expires_at: Dict[str, float] = {}
+        self.cache_lock = asyncio.Lock()
+
+    @staticmethod
+    def application_block(application_info: str) -> str:
+        return f"Application Information:\n{application_info}\n"
+
+    @staticmethod
+    def pack_block(applications: List[Tuple[str, str]]) -> str:
+        """User block reviewing several (id, application_info) pairs in one call."""
+        parts = [
+            "This request contains several applications. Review each one independently.\n"
+            "Instead of a single JSON object, respond with a JSON array containing exactly one object "
+            "per application, in this format:\n"
+            '[{"id": "<application id>", "rating": <integer between 1-10>, "comment": "<string>", "confidence": <number between 0 and 1>}]\n'
+        ]
+        for app_id, application_info in applications:
+            parts.append(f"Application ID: {app_id}\n{PositionPrompt.application_block(application_info)}")
+        return "\n".join(parts)
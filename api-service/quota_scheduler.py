@@ -0,0 +1,192 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Dict, Hashable, Optional
+
+from metrics import QUOTA_QUEUE_DEPTH, QUOTA_WAIT
+
+# Gemini quota for this process: requests and input tokens per minute (0 = unlimited)
+GEMINI_RPM = int(os.getenv("GEMINI_RPM", "0"))
+GEMINI_TPM = int(os.getenv("GEMINI_TPM", "0"))
+# Fraction of the quota to schedule against, leaving room for estimation error
+GEMINI_QUOTA_UTILIZATION = float(os.getenv("GEMINI_QUOTA_UTILIZATION", "0.9"))
+# Seconds of quota that may be spent in a single burst
+GEMINI_QUOTA_BURST_SECONDS = float(os.getenv("GEMINI_QUOTA_BURST_SECONDS", "5"))
+
+# Priority classes, highest first; a class is only served when every higher class is empty
+PRIORITIES = ('interactive', 'bulk')
+
+
+class TokenBucket:
+    """Refills at rate_per_minute up to capacity. The level may go negative after settling underestimates."""
+
+    def __init__(self, rate_per_minute: float, capacity: float):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(1.0, capacity)
+        self.level = self.capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until amount (capped at capacity) can be taken."""
+        self._refill()
+        missing = min(amount, self.capacity) - self.level
+        return max(0.0, missing / self.rate)
+
+    def take(self, amount: float) -> None:
+        self._refill()
+        self.level -= amount
+
+    def drain(self) -> None:
+        self._refill()
+        self.level = min(self.level, 0.0)
+
+
+class _Waiter:
+    def __init__(self, tokens: int, priority: str, flow: Hashable, future: "asyncio.Future"):
+        self.tokens = tokens
+        self.priority = priority
+        self.flow = flow
+        self.future = future
+        self.enqueued_at = time.monotonic()
+
+
+class QuotaScheduler:
+    """Process-wide admission control for Gemini calls.
+
+    Each call waits until both the requests-per-minute and the tokens-per-minute
+    buckets can cover it. Waiting calls are served strictly by priority class,
+    and within a class round-robin across flows (positions), so one large batch
+    can't starve the others. Costs are estimated from the prompt size up front
+    and corrected with the reported usage afterwards.
+    """
+
+    def __init__(self, rpm: int = GEMINI_RPM, tpm: int = GEMINI_TPM,
+                 utilization: float = GEMINI_QUOTA_UTILIZATION, burst_seconds: float = GEMINI_QUOTA_BURST_SECONDS):
+        burst = burst_seconds / 60.0
+        self.requests = TokenBucket(rpm * utilization, rpm * utilization * burst) if rpm > 0 else None
+        self.tokens = TokenBucket(tpm * utilization, tpm * utilization * burst) if tpm > 0 else None
+        # priority -> flow -> waiters; flows are served in insertion order and rotated after each grant
+        self._queues: Dict[str, "OrderedDict[Hashable, Deque[_Waiter]]"] = {
+            priority: OrderedDict() for priority in PRIORITIES
+        }
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.stats: Dict[str, int] = {'admitted': 0, 'queued': 0, 'throttled': 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.requests is not None or self.tokens is not None
+
+    async def acquire(self, tokens: int, priority: str = 'interactive', flow: Hashable = None) -> None:
+        """Wait until a call estimated at tokens input tokens fits in the quota."""
+        if not self.enabled:
+            return
+        if priority not in self._queues:
+            priority = PRIORITIES[-1]
+        waiter = _Waiter(tokens, priority, flow, asyncio.get_running_loop().create_future())
+        self._queues[priority].setdefault(flow, deque()).append(waiter)
+        QUOTA_QUEUE_DEPTH.inc(priority=priority)
+        self._dispatch()
+        if not waiter.future.done():
+            self.stats['queued'] += 1
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if not waiter.future.done() or waiter.future.cancelled():
+                self._remove(waiter)
+            raise
+        finally:
+            QUOTA_WAIT.observe(time.monotonic() - waiter.enqueued_at, priority=priority)
+
+    def try_acquire(self, tokens: int) -> bool:
+        """Admit a call only if the quota covers it right now and nothing is queued ahead of it."""
+        if not self.enabled:
+            return True
+        if self.queue_depth() > 0:
+            return False
+        if self.requests is not None and self.requests.wait_time(1) > 0:
+            return False
+        if self.tokens is not None and self.tokens.wait_time(tokens) > 0:
+            return False
+        if self.requests is not None:
+            self.requests.take(1)
+        if self.tokens is not None:
+            self.tokens.take(tokens)
+        self.stats['admitted'] += 1
+        return True
+
+    def settle(self, estimated_tokens: int, actual_tokens: int) -> None:
+        """Charge (or refund) the difference between a call's estimated and reported input tokens."""
+        if self.tokens is not None and actual_tokens:
+            self.tokens.take(actual_tokens - estimated_tokens)
+
+    def throttled(self) -> None:
+        """Gemini answered 429: hold new calls until the buckets refill instead of piling on."""
+        self.stats['throttled'] += 1
+        for bucket in (self.requests, self.tokens):
+            if bucket is not None:
+                bucket.drain()
+
+    def queue_depth(self) -> int:
+        return sum(len(waiters) for flows in self._queues.values() for waiters in flows.values())
+
+    def _next(self) -> Optional[_Waiter]:
+        for priority in PRIORITIES:
+            flows = self._queues[priority]
+            if flows:
+                return next(iter(flows.values()))[0]
+        return None
+
+    def _dispatch(self) -> None:
+        """Grant waiters in order while the buckets allow, then sleep until the next one fits."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while True:
+            waiter = self._next()
+            if waiter is None:
+                return
+            if waiter.future.done():
+                # Cancelled while queued; its task removes nothing once it's gone from here
+                self._pop(waiter)
+                continue
+            delay = max(
+                self.requests.wait_time(1) if self.requests is not None else 0.0,
+                self.tokens.wait_time(waiter.tokens) if self.tokens is not None else 0.0
+            )
+            if delay > 0:
+                self._timer = asyncio.get_running_loop().call_later(delay, self._dispatch)
+                return
+            if self.requests is not None:
+                self.requests.take(1)
+            if self.tokens is not None:
+                self.tokens.take(waiter.tokens)
+            self._pop(waiter)
+            self.stats['admitted'] += 1
+            waiter.future.set_result(None)
+
+    def _pop(self, waiter: _Waiter) -> None:
+        """Remove the granted head waiter and move its flow to the back of the round-robin."""
+        flows = self._queues[waiter.priority]
+        waiters = flows.pop(waiter.flow)
+        waiters.popleft()
+        if waiters:
+            flows[waiter.flow] = waiters
+        QUOTA_QUEUE_DEPTH.dec(priority=waiter.priority)
+
+    def _remove(self, waiter: _Waiter) -> None:
+        flows = self._queues[waiter.priority]
+        waiters = flows.get(waiter.flow)
+        if waiters is None or waiter not in waiters:
+            return
+        waiters.remove(waiter)
+        if not waiters:
+            del flows[waiter.flow]
+        QUOTA_QUEUE_DEPTH.dec(priority=waiter.priority)
+        # The removed waiter may have been the head blocking the others
+        self._dispatch()
@@ -0,0 +1,136 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of reviews kept in memory
+REVIEW_CACHE_SIZE = int(os.getenv("REVIEW_CACHE_SIZE", "2048"))
+# Seconds a cached review stays valid
+REVIEW_CACHE_TTL = float(os.getenv("REVIEW_CACHE_TTL", str(7 * 24 * 3600)))
+# Optional SQLite file that persists reviews across restarts
+REVIEW_CACHE_PATH = os.getenv("REVIEW_CACHE_PATH", "")
+
+
+def make_review_cache_key(system_prompt: str, model_name: str, job_name: str, job_description: str,
+                          tags: Optional[List[str]], application_info: str) -> str:
+    """Content hash of everything that determines the LLM's review."""
+    payload = json.dumps(
+        [system_prompt, model_name, job_name, job_description, list(tags or []), application_info],
+        ensure_ascii=False,
+        separators=(',', ':')
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ReviewCache:
+    """In-memory LRU cache of review results with TTL and an optional SQLite backend.
+
+    Memory hits are answered inline. SQLite reads and writes run on the cache's
+    own thread, so disk I/O never blocks the event loop; writes are queued
+    behind the in-memory store and not waited for.
+    """
+
+    def __init__(self, max_entries: int = REVIEW_CACHE_SIZE, ttl: float = REVIEW_CACHE_TTL,
+                 sqlite_path: str = REVIEW_CACHE_PATH):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        # A single thread serializes every use of the SQLite connection
+        self._executor: Optional[ThreadPoolExecutor] = None
+        if sqlite_path:
+            try:
+                self._db = sqlite3.connect(sqlite_path, check_same_thread=False)
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS reviews (key TEXT PRIMARY KEY, expires_at REAL, review TEXT)"
+                )
+                self._db.commit()
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="review-cache")
+            except sqlite3.Error as e:
+                logger.warning(f"Review cache SQLite backend disabled: {e}")
+                self._db = None
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the cached review for key, or None if absent or expired."""
+        review = self._get_memory(key)
+        if review is None and self._db is not None:
+            loop = asyncio.get_running_loop()
+            review = await loop.run_in_executor(self._executor, self._get_persisted, key)
+        with self._lock:
+            if review is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return review
+
+    def set(self, key: str, review: Dict[str, Any]) -> None:
+        """Cache a review under key; persisting it to SQLite happens in the background."""
+        if self.max_entries <= 0:
+            return
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._store(key, expires_at, dict(review))
+        if self._db is not None:
+            self._executor.submit(self._persist, key, expires_at, json.dumps(review))
+
+    def _get_memory(self, key: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, review = entry
+            if expires_at > now:
+                self._entries.move_to_end(key)
+                return dict(review)
+            del self._entries[key]
+            return None
+
+    def _get_persisted(self, key: str) -> Optional[Dict[str, Any]]:
+        """Read key from SQLite (on the cache thread) and keep a hit in memory."""
+        try:
+            row = self._db.execute(
+                "SELECT expires_at, review FROM reviews WHERE key = ?", (key,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Review cache read failed: {e}")
+            return None
+        if not row or row[0] <= time.time():
+            return None
+        review = json.loads(row[1])
+        with self._lock:
+            self._store(key, row[0], review)
+        return dict(review)
+
+    def _persist(self, key: str, expires_at: float, review: str) -> None:
+        try:
+            self._db.execute(
+                "INSERT OR REPLACE INTO reviews (key, expires_at, review) VALUES (?, ?, ?)",
+                (key, expires_at, review)
+            )
+            self._db.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"Review cache write failed: {e}")
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'size': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+    def _store(self, key: str, expires_at: float, review: Dict[str, Any]) -> None:
+        self._entries[key] = (expires_at, review)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
@@ -0,0 +1,307 @@
+import asyncio
+import datetime
+import heapq
+import logging
+import os
+import socket
+import uuid
+from collections import Counter
+from typing import Dict, Optional, Set
+
+from metrics import IN_FLIGHT
+from models import ReviewJobRequest, ReviewJobStatus
+
+logger = logging.getLogger(__name__)
+
+# Number of jobs processed at the same time
+REVIEW_JOB_WORKERS = max(1, int(os.getenv("REVIEW_JOB_WORKERS", "2")))
+# Applications fetched and reviewed per checkpoint
+REVIEW_JOB_PAGE_SIZE = max(1, int(os.getenv("REVIEW_JOB_PAGE_SIZE", "50")))
+# Seconds an instance's claim on a job lasts without a heartbeat before other instances may take it over
+REVIEW_JOB_LEASE_SECONDS = max(10.0, float(os.getenv("REVIEW_JOB_LEASE_SECONDS", "120")))
+
+FINISHED_STATUSES = ('completed', 'failed')
+
+
+class ReviewJobManager:
+    """In-process worker pool that reviews whole positions in the background.
+
+    Each job pages through the applications subcollection with a Firestore cursor
+    and checkpoints its cursor and counters to reviewJobs/{job_id}, and each
+    application's rating, error or shortlist score to the job's outcomes
+    subcollection, after every page. The job document and the memory held per
+    job stay the same size however large the position is. A restarted service resumes
+    unfinished jobs where they stopped. A top-K shortlist first scores the
+    whole position to turn K into a similarity cutoff, checkpointed with the
+    job.
+
+    Several service instances can share the jobs. A worker claims a job in a
+    Firestore transaction that records its owner and a lease expiry, and renews
+    the lease while it runs. Each instance periodically re-queues unfinished
+    jobs whose lease has expired, so jobs of a crashed or restarted instance
+    are picked up by whoever claims them first.
+    """
+
+    def __init__(self, firestore_service, pipeline, workers: int = REVIEW_JOB_WORKERS,
+                 page_size: int = REVIEW_JOB_PAGE_SIZE, lease_seconds: float = REVIEW_JOB_LEASE_SECONDS,
+                 owner: Optional[str] = None):
+        self.firestore_service = firestore_service
+        self.pipeline = pipeline
+        self.workers = workers
+        self.page_size = page_size
+        self.lease_seconds = lease_seconds
+        self.owner = owner or f"{socket.gethostname()}-{uuid.uuid4().hex[:8]}"
+        self._queue: "asyncio.Queue[str]" = asyncio.Queue()
+        self._jobs: Dict[str, Dict] = {}
+        # Jobs waiting in or taken from this instance's queue and not done yet
+        self._pending: Set[str] = set()
+        self._tasks = []
+
+    async def start(self) -> None:
+        """Start the workers and keep re-queueing unfinished jobs whose lease has expired."""
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._resume_expired()))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, request: ReviewJobRequest) -> str:
+        """Record a new job and queue it, returning its ID immediately."""
+        job = {
+            'positionId': request.position_id,
+            'statuses': request.statuses,
+            'bypassCache': request.bypass_cache,
+            'packed': request.packed,
+            'incremental': request.incremental,
+            'shortlistTopK': request.shortlist_top_k,
+            'shortlistMinScore': request.shortlist_min_score,
+            'status': 'queued',
+            'cursor': None,
+            'processed': 0,
+            'reviewed': 0,
+            'failed': 0,
+            'filteredOut': 0,
+            'error': None,
+            # Held until a local worker claims it; other instances take over if it runs out first
+            'leaseOwner': self.owner,
+            'leaseExpiresAt': self._lease_expiry()
+        }
+        job_id = await self.firestore_service.create_review_job(job)
+        job['id'] = job_id
+        self._jobs[job_id] = job
+        await self._enqueue(job_id)
+        logger.info(f"Queued review job {job_id} for position {request.position_id}")
+        return job_id
+
+    async def get_status(self, job_id: str, limit: int = 100,
+                         cursor: Optional[str] = None) -> Optional[ReviewJobStatus]:
+        """The job's progress with one page of its outcomes, starting after the cursor application ID."""
+        job = self._jobs.get(job_id)
+        if job is None:
+            job = await self.firestore_service.get_review_job(job_id)
+        if job is None:
+            return None
+        outcomes, next_cursor = await self.firestore_service.get_review_job_outcomes(job_id, limit, cursor)
+        results, failures, filtered = {}, {}, {}
+        for outcome in outcomes:
+            if outcome['status'] == 'reviewed':
+                results[outcome['applicationId']] = outcome['rating']
+            elif outcome['status'] == 'failed':
+                failures[outcome['applicationId']] = outcome['error']
+            else:
+                filtered[outcome['applicationId']] = outcome['score']
+        return ReviewJobStatus(
+            job_id=job_id,
+            position_id=job['positionId'],
+            status=job['status'],
+            statuses=job.get('statuses'),
+            processed=job.get('processed', 0),
+            reviewed=job.get('reviewed', 0),
+            failed=job.get('failed', 0),
+            filtered_out=job.get('filteredOut', 0),
+            results=results,
+            failures=failures,
+            filtered=filtered,
+            next_cursor=next_cursor,
+            error=job.get('error')
+        )
+
+    async def _enqueue(self, job_id: str) -> None:
+        self._pending.add(job_id)
+        await self._queue.put(job_id)
+
+    def _lease_expiry(self) -> datetime.datetime:
+        return datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=self.lease_seconds)
+
+    async def _resume_expired(self) -> None:
+        """Re-queue unfinished jobs nobody holds a live lease on, once per lease period."""
+        while True:
+            try:
+                now = datetime.datetime.now(datetime.timezone.utc)
+                for job in await self.firestore_service.get_unfinished_review_jobs():
+                    expires_at = job.get('leaseExpiresAt')
+                    if job['id'] in self._pending or (isinstance(expires_at, datetime.datetime) and expires_at > now):
+                        continue
+                    await self._enqueue(job['id'])
+                    logger.info(f"Resuming review job {job['id']} for position {job.get('positionId')}")
+            except Exception as e:
+                logger.error(f"Could not resume review jobs: {e}")
+            await asyncio.sleep(self.lease_seconds)
+
+    async def _worker(self, index: int) -> None:
+        while True:
+            job_id = await self._queue.get()
+            try:
+                with IN_FLIGHT.track_inprogress(kind='review_job'):
+                    await self._run_leased(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Review job {job_id} failed: {e}")
+                try:
+                    await self._checkpoint(job_id, status='failed', error=str(e))
+                except Exception as checkpoint_error:
+                    logger.error(f"Could not record failure of review job {job_id}: {checkpoint_error}")
+            finally:
+                self._pending.discard(job_id)
+                self._queue.task_done()
+
+    async def _run_leased(self, job_id: str) -> None:
+        """Claim the job and run it, renewing the lease until it ends; stop if the lease is lost."""
+        job = await self.firestore_service.claim_review_job(job_id, self.owner, self.lease_seconds)
+        if job is None:
+            # Finished or running elsewhere; status requests read it from Firestore from now on
+            self._jobs.pop(job_id, None)
+            logger.info(f"Skipping review job {job_id}: finished or leased by another instance")
+            return
+        self._jobs[job_id] = job
+
+        run = asyncio.create_task(self._run_job(job_id))
+        try:
+            while True:
+                done, _ = await asyncio.wait({run}, timeout=self.lease_seconds / 3)
+                if done:
+                    return run.result()
+                try:
+                    renewed = await self.firestore_service.renew_review_job_lease(job_id, self.owner, self.lease_seconds)
+                except Exception as e:
+                    # Keep going; the next heartbeat finds out whether the lease survived
+                    logger.warning(f"Could not renew lease on review job {job_id}: {e}")
+                    continue
+                if not renewed and not run.done():
+                    logger.warning(f"Lost lease on review job {job_id}; stopping it here")
+                    run.cancel()
+                    await asyncio.gather(run, return_exceptions=True)
+                    self._jobs.pop(job_id, None)
+                    return
+        finally:
+            if not run.done():
+                run.cancel()
+
+    async def _run_job(self, job_id: str) -> None:
+        job = self._jobs[job_id]
+        if job['status'] in FINISHED_STATUSES:
+            return
+        request = ReviewJobRequest(
+            position_id=job['positionId'],
+            statuses=job.get('statuses'),
+            bypass_cache=job.get('bypassCache', False),
+            packed=job.get('packed', False),
+            incremental=job.get('incremental', False),
+            shortlist_top_k=job.get('shortlistTopK'),
+            shortlist_min_score=job.get('shortlistMinScore')
+        )
+        await self._checkpoint(job_id, status='running')
+
+        # Pages only see part of the position, so a top-K shortlist becomes a score cutoff up front
+        if request.shortlist_top_k is not None and self.pipeline.ranker is not None:
+            if 'shortlistCutoff' not in job:
+                await self._checkpoint(job_id, shortlistCutoff=await self._shortlist_cutoff(request))
+            request = request.model_copy(update={
+                'shortlist_top_k': None,
+                'shortlist_min_score': job['shortlistCutoff']
+            })
+
+        while True:
+            # Re-check the (cached) position each page so closing it stops the job
+            position = await self.firestore_service.get_position(request.position_id)
+            if not position or position.status != 'active':
+                await self._checkpoint(job_id, status='failed', error="Position not found or not active")
+                return
+
+            applications, next_cursor, invalid_ids = await self.firestore_service.get_application_page(
+                request.position_id, self.page_size, start_after=job.get('cursor'), statuses=request.statuses
+            )
+
+            # Only this page's outcomes are held; earlier pages are already in the outcomes subcollection
+            outcomes = {app_id: {'status': 'failed', 'error': "Application failed validation"}
+                        for app_id in invalid_ids}
+            if applications:
+                batch = await self.pipeline.build_batch(request, position, applications, [], strict=False)
+                for result in await self.pipeline.run(batch):
+                    if result.name not in batch.failed:
+                        outcomes[result.name] = {'status': 'reviewed', 'rating': result.rating}
+                outcomes.update({app_id: {'status': 'failed', 'error': error}
+                                 for app_id, error in batch.failed.items()})
+                outcomes.update({app_id: {'status': 'filtered', 'score': score}
+                                 for app_id, score in batch.filtered.items()})
+
+            counts = Counter(outcome['status'] for outcome in outcomes.values())
+            await self._checkpoint(
+                job_id,
+                outcomes=outcomes,
+                cursor=next_cursor,
+                processed=job.get('processed', 0) + len(applications) + len(invalid_ids),
+                reviewed=job.get('reviewed', 0) + counts['reviewed'],
+                failed=job.get('failed', 0) + counts['failed'],
+                filteredOut=job.get('filteredOut', 0) + counts['filtered']
+            )
+            logger.info(f"Review job {job_id}: {job['processed']} applications processed")
+
+            if next_cursor is None:
+                await self._checkpoint(job_id, status='completed')
+                return
+
+    async def _shortlist_cutoff(self, request: ReviewJobRequest) -> Optional[float]:
+        """Score every application of the position and return the K-th best score.
+
+        Applications scoring at least the cutoff (and shortlist_min_score) are
+        reviewed. Returns shortlist_min_score when the position has K or fewer applications.
+        """
+        position = await self.firestore_service.get_position(request.position_id)
+        if not position:
+            return request.shortlist_min_score
+        # Min-heap of the K best scores so far
+        best = []
+        scored = 0
+        cursor = None
+        while True:
+            applications, cursor, _ = await self.firestore_service.get_application_page(
+                request.position_id, self.page_size, start_after=cursor, statuses=request.statuses
+            )
+            if applications:
+                batch = await self.pipeline.build_batch(request, position, applications, [], strict=False)
+                for score in (await self.pipeline.score(batch)).values():
+                    scored += 1
+                    if len(best) < request.shortlist_top_k:
+                        heapq.heappush(best, score)
+                    elif score > best[0]:
+                        heapq.heapreplace(best, score)
+            if cursor is None:
+                break
+        logger.info(f"Scored {scored} applications of position {request.position_id} for the shortlist")
+        if scored <= request.shortlist_top_k:
+            return request.shortlist_min_score
+        cutoff = best[0]
+        if request.shortlist_min_score is not None:
+            cutoff = max(cutoff, request.shortlist_min_score)
+        return cutoff
+
+    async def _checkpoint(self, job_id: str, outcomes: Optional[Dict[str, Dict]] = None, **changes) -> None:
+        """Apply changes to the in-memory job and persist them with the given outcomes."""
+        job = self._jobs.setdefault(job_id, {})
+        job.update(changes)
+        await self.firestore_service.update_review_job(job_id, changes, outcomes)
@@ -0,0 +1,180 @@
+import base64
+import datetime
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from models import ReviewPage, StoredReview
+
+# Seconds a rendered page of reviews is served without touching Firestore
+REVIEW_LIST_CACHE_TTL = float(os.getenv("REVIEW_LIST_CACHE_TTL", "10"))
+# Number of rendered pages kept in memory
+REVIEW_LIST_CACHE_SIZE = int(os.getenv("REVIEW_LIST_CACHE_SIZE", "256"))
+# Largest page size a client may request
+REVIEW_LIST_MAX_PAGE_SIZE = 200
+
+# API sort key -> Firestore field
+SORT_FIELDS = {'created': 'createdAt', 'rating': 'rating'}
+
+
+class InvalidCursorError(ValueError):
+    """Raised for a pagination cursor that this service did not issue."""
+
+
+def encode_cursor(cursor: Optional[Tuple[Any, str]]) -> Optional[str]:
+    """Opaque, URL-safe form of an (order value, document ID) cursor."""
+    if cursor is None:
+        return None
+    value, doc_id = cursor
+    if isinstance(value, datetime.datetime):
+        value = {'ts': value.isoformat()}
+    raw = json.dumps([value, doc_id], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Tuple[Any, str]]:
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        value, doc_id = json.loads(raw)
+        if isinstance(value, dict):
+            value = datetime.datetime.fromisoformat(value['ts'])
+        if not isinstance(doc_id, str):
+            raise ValueError("document ID must be a string")
+        return value, doc_id
+    except (ValueError, TypeError, KeyError) as e:
+        raise InvalidCursorError(f"Invalid cursor: {e}")
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against etag."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    opaque = etag.removeprefix('W/')
+    return any(candidate.strip().removeprefix('W/') == opaque for candidate in if_none_match.split(','))
+
+
+def _isoformat(value: Any) -> Optional[str]:
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    if isinstance(value, (int, float)):
+        return datetime.datetime.fromtimestamp(value, tz=datetime.timezone.utc).isoformat()
+    return None
+
+
+class RenderedPage:
+    """A page of reviews serialized once, with its gzip form built on first use."""
+
+    def __init__(self, etag: str, body: bytes):
+        self.etag = etag
+        self.body = body
+        self._gzipped: Optional[bytes] = None
+
+    @property
+    def gzipped(self) -> bytes:
+        if self._gzipped is None:
+            self._gzipped = gzip.compress(self.body, compresslevel=6)
+        return self._gzipped
+
+
+class ReviewListing:
+    """Serves pages of a position's stored reviews with ETags and a short-lived page cache.
+
+    The ETag is derived from the position's latest review timestamp and the
+    page parameters, so checking freshness costs one single-document read
+    and cached pages cost none. Overwritten reviews get a new createdAt and
+    change the ETag; deleted reviews only show up once the cache entry expires.
+    """
+
+    def __init__(self, firestore_service, ttl: float = REVIEW_LIST_CACHE_TTL,
+                 max_entries: int = REVIEW_LIST_CACHE_SIZE):
+        self.firestore_service = firestore_service
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.stats: Dict[str, int] = {'hits': 0, 'misses': 0, 'not_modified': 0}
+        self._pages: "OrderedDict[tuple, Tuple[float, RenderedPage]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def get_page(self, position_id: str, sort: str, descending: bool, limit: int,
+                       cursor: Optional[str], if_none_match: Optional[str] = None) -> Tuple[str, Optional[RenderedPage]]:
+        """Return (etag, page); page is None when the client's copy (if_none_match) is current.
+
+        Raises InvalidCursorError for a malformed cursor.
+        """
+        start_after = decode_cursor(cursor)
+        key = (position_id, sort, descending, limit, cursor)
+
+        cached = self._get_cached(key)
+        if cached is not None:
+            self.stats['hits'] += 1
+            if etag_matches(if_none_match, cached.etag):
+                self.stats['not_modified'] += 1
+                return cached.etag, None
+            return cached.etag, cached
+
+        self.stats['misses'] += 1
+        latest = await self.firestore_service.get_latest_review_time(position_id)
+        etag = self._etag(key, latest)
+        if etag_matches(if_none_match, etag):
+            self.stats['not_modified'] += 1
+            return etag, None
+
+        reviews, next_cursor = await self.firestore_service.get_review_page(
+            position_id, SORT_FIELDS[sort], descending, limit, start_after
+        )
+        page = ReviewPage(
+            reviews=[
+                StoredReview(
+                    application_id=review.get('applicationId') or review['id'],
+                    rating=review.get('rating', 0),
+                    comment=review.get('comment', ''),
+                    created_at=_isoformat(review.get('createdAt')),
+                    tier=review.get('tier')
+                )
+                for review in reviews
+            ],
+            next_cursor=encode_cursor(next_cursor)
+        )
+        rendered = RenderedPage(etag, page.model_dump_json().encode('utf-8'))
+        self._store(key, rendered)
+        return etag, rendered
+
+    @staticmethod
+    def _etag(key: tuple, latest: Any) -> str:
+        payload = json.dumps([list(key), _isoformat(latest) or latest], default=str, separators=(',', ':'))
+        return f'W/"{hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]}"'
+
+    def _get_cached(self, key: tuple) -> Optional[RenderedPage]:
+        with self._lock:
+            entry = self._pages.get(key)
+            if entry is None:
+                return None
+            expires_at, page = entry
+            if expires_at <= time.monotonic():
+                del self._pages[key]
+                return None
+            self._pages.move_to_end(key)
+            return page
+
+    def _store(self, key: tuple, page: RenderedPage) -> None:
+        if self.ttl <= 0 or self.max_entries <= 0:
+            return
+        with self._lock:
+            self._pages[key] = (time.monotonic() + self.ttl, page)
+            self._pages.move_to_end(key)
+            while len(self._pages) > self.max_entries:
+                self._pages.popitem(last=False)
+
+    def invalidate(self, position_id: str) -> None:
+        """Drop the cached pages of a position, e.g. after this process saved new reviews."""
+        with self._lock:
+            for key in [key for key in self._pages if key[0] == position_id]:
+                del self._pages[key]
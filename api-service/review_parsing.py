@@ -0,0 +1,100 @@
+import json
+import os
+import re
+from typing import Any, Dict, Optional
+
+# Longest comment kept from a review; the prompt asks the model to stay under it
+MAX_COMMENT_CHARS = int(os.getenv("MAX_COMMENT_CHARS", "600"))
+
+# JSON schema of a single review, in the OpenAPI subset Gemini accepts as response_schema
+REVIEW_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'rating': {'type': 'integer'},
+        'comment': {'type': 'string'},
+        'confidence': {'type': 'number'}
+    },
+    'required': ['rating', 'comment']
+}
+
+# JSON schema of a packed review response
+PACKED_REVIEW_SCHEMA = {
+    'type': 'array',
+    'items': {
+        'type': 'object',
+        'properties': {
+            'id': {'type': 'string'},
+            'rating': {'type': 'integer'},
+            'comment': {'type': 'string'},
+            'confidence': {'type': 'number'}
+        },
+        'required': ['id', 'rating', 'comment']
+    }
+}
+
+_RATING_PATTERN = re.compile(r'"rating"\s*:\s*"?(\d+)')
+_COMMENT_PATTERN = re.compile(r'"comment"\s*:\s*"((?:[^"\\]|\\.)*)', re.DOTALL)
+_JSON_START = re.compile(r'[{\[]')
+
+
+def parse_json_response(response_text: str) -> Any:
+    """Parse the model's JSON answer.
+
+    Tries strict parsing first, then decodes the JSON value starting at the first
+    brace or bracket, ignoring surrounding text such as markdown fences.
+    """
+    try:
+        return json.loads(response_text)
+    except json.JSONDecodeError:
+        pass
+    match = _JSON_START.search(response_text)
+    if match is None:
+        raise json.JSONDecodeError("No JSON value in response", response_text, 0)
+    return json.JSONDecoder().raw_decode(response_text, match.start())[0]
+
+
+def salvage_review(response_text: str) -> Optional[Dict[str, Any]]:
+    """Last-resort recovery of a rating and comment from malformed or truncated JSON."""
+    rating_match = _RATING_PATTERN.search(response_text)
+    comment_match = _COMMENT_PATTERN.search(response_text)
+    if not rating_match or not comment_match:
+        return None
+    try:
+        comment = json.loads(f'"{comment_match.group(1)}"')
+    except json.JSONDecodeError:
+        comment = comment_match.group(1)
+    try:
+        return validate_review({'rating': rating_match.group(1), 'comment': comment})
+    except ValueError:
+        return None
+
+
+def validate_review(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Check a parsed review has a 1-10 rating and a comment, capping the comment length.
+
+    An optional 0-1 confidence is kept when the model gave a usable one.
+    """
+    # Validate the response structure
+    if 'rating' not in result or 'comment' not in result:
+        raise ValueError("Invalid response structure")
+
+    # Ensure rating is within valid range
+    rating = int(result['rating'])
+    if rating < 1 or rating > 10:
+        raise ValueError("Rating must be between 1 and 10")
+
+    comment = str(result['comment']).strip()
+    if len(comment) > MAX_COMMENT_CHARS:
+        comment = comment[:MAX_COMMENT_CHARS].rstrip() + '...'
+
+    review = {
+        'rating': rating,
+        'comment': comment
+    }
+    try:
+        confidence = float(result['confidence'])
+        if 0.0 <= confidence <= 1.0:
+            review['confidence'] = confidence
+    except (KeyError, TypeError, ValueError):
+        pass
+    return review
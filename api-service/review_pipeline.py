@@ -0,0 +1,443 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple, Union
+
+from fastapi import HTTPException
+
+from models import PositionReviewRequest, ReviewJobRequest, Position, ReviewApplication, ReviewResult
+from metrics import STAGE_LATENCY, REVIEW_OUTCOMES, IN_FLIGHT
+from prompt_builder import PositionPrompt, truncate_answer, MAX_FILE_ANSWER_TOKENS, position_text
+from single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of concurrent LLM reviews within a single request
+REVIEW_CONCURRENCY = max(1, int(os.getenv("REVIEW_CONCURRENCY", "5")))
+
+
+class ReviewBatch:
+    """Everything needed to review one request's applications."""
+
+    def __init__(self, request: Union[PositionReviewRequest, ReviewJobRequest], position: Position,
+                 position_prompt: Optional[PositionPrompt], review_inputs: List[Tuple[str, str]],
+                 missing_ids: List[str]):
+        self.request = request
+        self.position = position
+        self.position_prompt = position_prompt
+        self.review_inputs = review_inputs
+        self.missing_ids = missing_ids
+        # Inputs that still need an LLM review; incremental mode drops unchanged ones
+        self.pending_inputs = list(review_inputs)
+        # Application ID -> content fingerprint stored with the review
+        self.fingerprints: Dict[str, str] = {
+            app_id: review_fingerprint(position, application_info) for app_id, application_info in review_inputs
+        }
+        # Application ID -> stored review reused because nothing changed since it was written
+        self.unchanged: Dict[str, ReviewResult] = {}
+        # Application ID -> reason, for applications skipped, rated 0 or not saved
+        self.failed: Dict[str, str] = {}
+        # Application ID -> similarity score, for applications the shortlist kept from the LLM
+        self.filtered: Dict[str, float] = {}
+
+
+class ReviewPipeline:
+    """Shared fetch -> convert -> extract -> shortlist -> review -> save pipeline behind the review endpoints.
+
+    Without a document extractor, file answers are left out of reviews.
+    Without a pre-ranker, shortlist options are ignored and everything is reviewed.
+    Concurrent requests that fetch, review or save the same applications share
+    one in-flight call through self.inflight instead of repeating it.
+    """
+
+    def __init__(self, firestore_service, gemini_service, concurrency: int = REVIEW_CONCURRENCY,
+                 extractor=None, on_saved: Optional[Callable[[str], None]] = None, ranker=None):
+        self.firestore_service = firestore_service
+        self.gemini_service = gemini_service
+        self.concurrency = concurrency
+        self.extractor = extractor
+        self.ranker = ranker
+        self.inflight = SingleFlight()
+        # Called with the position ID after reviews are written, e.g. to drop cached review pages
+        self.on_saved = on_saved
+
+    async def prepare(self, request: PositionReviewRequest) -> ReviewBatch:
+        """Load and validate the position and applications, raising HTTPException on bad input."""
+        logger.info(f"Processing applications for position: {request.position_id}")
+
+        # Validate application_ids if provided
+        if request.application_ids is not None:
+            if len(request.application_ids) > 10:
+                raise HTTPException(
+                    status_code=400,
+                    detail="Cannot review more than 10 applications at once"
+                )
+            logger.info(f"Filtering to specific applications: {request.application_ids}")
+
+        # Get position and applications from Firestore, fetching only the requested IDs when given
+        missing_ids = []
+        if request.application_ids is not None:
+            position, applications, missing_ids = await self.inflight.run(
+                ('fetch', request.position_id, tuple(request.application_ids)),
+                lambda: self.firestore_service.get_position_with_selected_applications(
+                    request.position_id, request.application_ids
+                )
+            )
+        else:
+            position, applications = await self.inflight.run(
+                ('fetch', request.position_id, None),
+                lambda: self.firestore_service.get_position_with_applications(request.position_id)
+            )
+        logger.info(f"Retrieved position: {position is not None}, applications count: {len(applications) if applications else 0}")
+
+        if not position:
+            raise HTTPException(status_code=404, detail="Position not found")
+
+        # Check if position is active
+        if position.status != 'active':
+            raise HTTPException(
+                status_code=400,
+                detail=f"Position is not active. Current status: {position.status}. Only active positions can be reviewed."
+            )
+
+        if request.application_ids is None and not applications:
+            logger.warning(f"No applications found for position {request.position_id}")
+            return ReviewBatch(request, position, None, [], [])
+
+        if missing_ids:
+            logger.warning(f"Some requested applications not found: {missing_ids}")
+        if request.application_ids is not None:
+            logger.info(f"Found {len(applications)} applications out of {len(request.application_ids)} requested")
+
+        if not applications:
+            raise HTTPException(status_code=400, detail="No valid applications found for review")
+
+        return await self.build_batch(request, position, applications, missing_ids)
+
+    async def build_batch(self, request: Union[PositionReviewRequest, ReviewJobRequest], position: Position,
+                    applications: List[ReviewApplication], missing_ids: List[str], strict: bool = True) -> ReviewBatch:
+        """Turn validated applications into review inputs.
+
+        In strict mode an application without reviewable answers fails the whole
+        request; otherwise it is recorded in batch.failed and skipped.
+        """
+        # Convert Firestore data to LLM format (without names)
+        with STAGE_LATENCY.time(stage='convert'):
+            llm_data = self.firestore_service.convert_firestore_to_llm_format(position, applications)
+
+        # Swap file answers (storage URLs) for the text of the files
+        if self.extractor is not None and any(question_type == 'file' for _, question_type in position.question_schema):
+            await self.extractor.resolve(llm_data['applications'])
+
+        # Build the review input for every application up front so an invalid
+        # application fails the request before any LLM calls are made
+        review_inputs = []
+        skipped = {}
+        for application in llm_data['applications']:
+            app_id = application['id']
+            application_info = build_application_info(application)
+
+            if not application_info.strip():
+                logger.error(f"No valid application info for application {app_id}")
+                if not strict:
+                    skipped[app_id] = "Application has no valid information for review"
+                    continue
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Application {app_id} has no valid information for review"
+                )
+
+            review_inputs.append((app_id, application_info))
+
+        # The job part of the prompt is identical for every application, so build it once
+        position_prompt = self.gemini_service.prepare_position(
+            job_name=llm_data['job_name'],
+            job_description=llm_data['job_description'],
+            tags=llm_data['tags']
+        )
+
+        batch = ReviewBatch(request, position, position_prompt, review_inputs, missing_ids)
+        batch.failed.update(skipped)
+        return batch
+
+    def _review_tasks(self, batch: ReviewBatch) -> List["asyncio.Task[List[ReviewResult]]"]:
+        """Start one task per application (or per pack), each returning its results in input order."""
+        # Review applications concurrently, capped at self.concurrency in-flight LLM calls
+        semaphore = asyncio.Semaphore(self.concurrency)
+        use_cache = not batch.request.bypass_cache
+        # Background jobs yield Gemini quota to requests someone is waiting on
+        priority = 'bulk' if isinstance(batch.request, ReviewJobRequest) else 'interactive'
+        flow = batch.request.position_id
+
+        def review_key(app_id: str) -> tuple:
+            return ('review', batch.request.position_id, app_id, batch.fingerprints[app_id], use_cache)
+
+        async def review_application(application_info: str) -> Dict:
+            async with semaphore:
+                # Send to LLM for review with job name, description, and tags (without applicant name)
+                return await self.gemini_service.review_application(
+                    position_prompt=batch.position_prompt,
+                    application_info=application_info,
+                    use_cache=use_cache,
+                    priority=priority,
+                    flow=flow,
+                    escalation=batch.position.escalation
+                )
+
+        async def review_one(app_id: str, application_info: str) -> List[ReviewResult]:
+            # A duplicate request reviewing the same content joins the review already in flight
+            review = await self.inflight.run(review_key(app_id), lambda: review_application(application_info))
+
+            logger.info(f"Review completed for application {app_id}: rating={review['rating']}")
+            REVIEW_OUTCOMES.inc(outcome='reviewed' if review['rating'] > 0 else 'failed')
+
+            return [ReviewResult(
+                name=app_id,  # Use application ID instead of name
+                rating=review['rating'],
+                comment=review['comment'],
+                tier=review.get('tier')
+            )]
+
+        async def review_pack(pack: List[Tuple[str, str]]) -> List[ReviewResult]:
+            inputs = {review_key(app_id): (app_id, application_info) for app_id, application_info in pack}
+
+            async def review_missing(keys: List[tuple]) -> Dict[tuple, Dict]:
+                # Only the applications no other request is already reviewing go into the packed call
+                async with semaphore:
+                    reviews = await self.gemini_service.review_pack(
+                        position_prompt=batch.position_prompt,
+                        pack=[inputs[key] for key in keys],
+                        use_cache=use_cache,
+                        priority=priority,
+                        flow=flow,
+                        escalation=batch.position.escalation
+                    )
+                return {key: reviews[inputs[key][0]] for key in keys}
+
+            reviews_by_key = await self.inflight.run_many(list(inputs), review_missing)
+
+            pack_results = []
+            for key, (app_id, _) in inputs.items():
+                review = reviews_by_key[key]
+                logger.info(f"Review completed for application {app_id}: rating={review['rating']}")
+                REVIEW_OUTCOMES.inc(outcome='reviewed' if review['rating'] > 0 else 'failed')
+                pack_results.append(ReviewResult(
+                    name=app_id, rating=review['rating'], comment=review['comment'], tier=review.get('tier')
+                ))
+            return pack_results
+
+        if batch.request.packed:
+            packs = self.gemini_service.plan_packs(batch.pending_inputs)
+            logger.info(f"Reviewing {len(batch.pending_inputs)} applications in {len(packs)} packed calls")
+            return [asyncio.create_task(review_pack(pack)) for pack in packs]
+        return [
+            asyncio.create_task(review_one(app_id, application_info))
+            for app_id, application_info in batch.pending_inputs
+        ]
+
+    async def shortlist(self, batch: ReviewBatch) -> None:
+        """Keep only the applications most similar to the position for LLM review.
+
+        Applications left out get no review and are reported in batch.filtered.
+        """
+        request = batch.request
+        if self.ranker is None or not batch.pending_inputs:
+            return
+        if request.shortlist_top_k is None and request.shortlist_min_score is None:
+            return
+        prompt = batch.position_prompt
+        batch.pending_inputs, batch.filtered = await self.ranker.shortlist(
+            request.position_id,
+            position_text(prompt.job_name, prompt.job_description, prompt.tags),
+            batch.pending_inputs,
+            top_k=request.shortlist_top_k,
+            min_score=request.shortlist_min_score
+        )
+        REVIEW_OUTCOMES.inc(len(batch.filtered), outcome='filtered')
+        logger.info(f"Shortlist: {len(batch.pending_inputs)} kept for review, {len(batch.filtered)} filtered out")
+
+    async def score(self, batch: ReviewBatch) -> Dict[str, float]:
+        """Similarity of each of the batch's applications to the position."""
+        prompt = batch.position_prompt
+        return await self.ranker.score(
+            batch.request.position_id,
+            position_text(prompt.job_name, prompt.job_description, prompt.tags),
+            batch.review_inputs
+        )
+
+    async def skip_unchanged(self, batch: ReviewBatch) -> None:
+        """In incremental mode, reuse stored reviews whose fingerprint still matches.
+
+        The fingerprint covers the application's answers and the position's
+        description, tags and questions, so any change to either forces a new review.
+        """
+        if not batch.request.incremental or not batch.pending_inputs:
+            return
+        app_ids = [app_id for app_id, _ in batch.pending_inputs]
+        stored = await self.firestore_service.get_reviews_by_ids(batch.request.position_id, app_ids)
+        for app_id in app_ids:
+            review = stored.get(app_id)
+            if review and review.get('fingerprint') == batch.fingerprints[app_id]:
+                batch.unchanged[app_id] = ReviewResult(
+                    name=app_id, rating=review['rating'], comment=review['comment'], tier=review.get('tier')
+                )
+        batch.pending_inputs = [item for item in batch.pending_inputs if item[0] not in batch.unchanged]
+        REVIEW_OUTCOMES.inc(len(batch.unchanged), outcome='unchanged')
+        logger.info(f"Incremental review: {len(batch.unchanged)} unchanged, {len(batch.pending_inputs)} to review")
+
+    async def save(self, batch: ReviewBatch, results: List[ReviewResult]) -> Dict[str, str]:
+        """Save every result with a rating greater than 0 in one batched write.
+
+        Returns application_id -> error for the reviews that could not be saved.
+        """
+        reviews_to_save = [
+            {
+                'application_id': result.name,
+                'rating': result.rating,
+                'comment': result.comment,
+                'fingerprint': batch.fingerprints.get(result.name),
+                'tier': result.tier
+            }
+            for result in results if result.rating > 0
+        ]
+        if not reviews_to_save:
+            return {}
+        # Identical reviews saved by concurrent requests are written once, by whichever request got there first
+        reviews_by_key = {
+            ('save', batch.request.position_id, review['application_id'], review['fingerprint'],
+             review['rating'], review['comment']): review
+            for review in reviews_to_save
+        }
+
+        async def save_missing(keys: List[tuple]) -> Dict[tuple, Optional[str]]:
+            reviews = [reviews_by_key[key] for key in keys]
+            try:
+                saved, failed = await self.firestore_service.save_application_reviews(
+                    position_id=batch.request.position_id,
+                    reviews=reviews,
+                    position=batch.position
+                )
+                logger.info(f"Reviews saved: {list(saved.values())}")
+            except Exception as e:
+                logger.error(f"Failed to save reviews for position {batch.request.position_id}: {e}")
+                failed = {review['application_id']: str(e) for review in reviews}
+            return {key: failed.get(reviews_by_key[key]['application_id']) for key in keys}
+
+        errors = await self.inflight.run_many(list(reviews_by_key), save_missing)
+        if self.on_saved is not None and any(error is None for error in errors.values()):
+            self.on_saved(batch.request.position_id)
+        failed = {}
+        for key, error in errors.items():
+            if error is not None:
+                app_id = reviews_by_key[key]['application_id']
+                logger.error(f"Failed to save review for application {app_id}: {error}")
+                failed[app_id] = error
+        return failed
+
+    async def run(self, batch: ReviewBatch) -> List[ReviewResult]:
+        """Review the whole batch, save it, and return results in input order."""
+        with IN_FLIGHT.track_inprogress(kind='review_batch'):
+            return await self._run(batch)
+
+    async def _run(self, batch: ReviewBatch) -> List[ReviewResult]:
+        await self.shortlist(batch)
+        await self.skip_unchanged(batch)
+        tasks = self._review_tasks(batch)
+        try:
+            task_results = await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+        results = [result for task_result in task_results for result in task_result]
+        for result in results:
+            if result.rating <= 0:
+                batch.failed[result.name] = result.comment
+        batch.failed.update(await self.save(batch, results))
+
+        # Merge fresh and reused reviews back into input order
+        by_id = {result.name: result for result in results}
+        by_id.update(batch.unchanged)
+        return [by_id[app_id] for app_id, _ in batch.review_inputs if app_id in by_id]
+
+    async def stream(self, batch: ReviewBatch) -> AsyncIterator[Dict]:
+        """Yield a result event as each review is done and saved, then a summary event."""
+        with IN_FLIGHT.track_inprogress(kind='review_stream'):
+            async for event in self._stream(batch):
+                yield event
+
+    async def _stream(self, batch: ReviewBatch) -> AsyncIterator[Dict]:
+        await self.shortlist(batch)
+        await self.skip_unchanged(batch)
+        # Reused reviews are ready immediately
+        for result in batch.unchanged.values():
+            yield {'type': 'result', 'unchanged': True, **result.model_dump()}
+        completed = len(batch.unchanged)
+
+        tasks = self._review_tasks(batch)
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                results = await next_done
+                batch.failed.update(await self.save(batch, results))
+                for result in results:
+                    completed += 1
+                    if result.rating <= 0:
+                        batch.failed[result.name] = result.comment
+                    yield {'type': 'result', 'unchanged': False, **result.model_dump()}
+        finally:
+            # Stop outstanding reviews if the client goes away mid-stream
+            for task in tasks:
+                task.cancel()
+
+        yield {
+            'type': 'summary',
+            'requested': len(batch.review_inputs) + len(batch.missing_ids),
+            'completed': completed,
+            'unchanged': len(batch.unchanged),
+            'failed': batch.failed,
+            'filtered': batch.filtered,
+            'missing_ids': batch.missing_ids
+        }
+
+
+def review_fingerprint(position: Position, application_info: str) -> str:
+    """Hash of everything a review depends on, stored with the review to detect changes."""
+    parts = [position.description, position.tags, position.questions, application_info]
+    if position.escalation is not None:
+        # The escalation policy decides which model's review is kept
+        parts.append(position.escalation.model_dump())
+    payload = json.dumps(
+        parts,
+        ensure_ascii=False,
+        sort_keys=True,
+        separators=(',', ':'),
+        default=str
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def build_application_info(application: Dict) -> str:
+    """Consolidate an application's answers into the text sent to the LLM."""
+    # Process all questions and extract text from answers
+    application_info_parts = []
+
+    for question in application['questions']:
+        if question['type'] == 'file':
+            # File answers are only usable once replaced by the file's extracted text
+            if not question.get('extracted'):
+                continue
+            file_text = question['answer']
+            if file_text.strip():
+                application_info_parts.append(
+                    f"{question['label']} (file contents):\n{truncate_answer(file_text.strip(), MAX_FILE_ANSWER_TOKENS)}"
+                )
+            continue
+
+        # For text questions, use the answer directly, capped at the per-answer token budget
+        answer_text = question['answer']
+        if answer_text.strip():
+            application_info_parts.append(f"{question['label']}: {truncate_answer(answer_text)}")
+
+    # Consolidate all information
+    return "\n\n".join(application_info_parts)
@@ -0,0 +1,108 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, List
+
+from metrics import COALESCED_CALLS
+
+
+class _Call:
+    def __init__(self, task: "asyncio.Task"):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Shares in-flight work among concurrent callers asking for the same keys.
+
+    The first caller for a key starts the work; later callers await the same
+    task instead of repeating it. Keys are forgotten as soon as their work
+    finishes, so this never serves stale results. The work is shielded from
+    any single caller's cancellation and is only cancelled once every caller
+    waiting on it has gone away.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self.stats: Dict[str, int] = {'started': 0, 'coalesced': 0}
+
+    async def run(self, key: Hashable, make_call: Callable[[], Awaitable[Any]]) -> Any:
+        """Result of make_call(), shared with concurrent callers using the same key."""
+        async def run_one(keys: List[Hashable]) -> Dict[Hashable, Any]:
+            return {key: await make_call()}
+
+        return (await self.run_many([key], run_one))[key]
+
+    async def run_many(self, keys: List[Hashable],
+                       make_call: Callable[[List[Hashable]], Awaitable[Dict[Hashable, Any]]]) -> Dict[Hashable, Any]:
+        """Results for keys, joining work already in flight and computing the rest together.
+
+        make_call receives the keys nobody is working on yet and must return a
+        result for each of them.
+        """
+        keys = list(dict.fromkeys(keys))
+        calls: Dict[Hashable, _Call] = {}
+        missing = []
+        for key in keys:
+            call = self._calls.get(key)
+            if call is not None:
+                calls[key] = call
+                self.stats['coalesced'] += 1
+                COALESCED_CALLS.inc(kind=_kind(key))
+            else:
+                missing.append(key)
+
+        if missing:
+            self.stats['started'] += 1
+            shared = asyncio.ensure_future(make_call(missing))
+            picks = []
+            for key in missing:
+                call = _Call(asyncio.ensure_future(_pick(shared, key)))
+                self._calls[key] = calls[key] = call
+                call.task.add_done_callback(lambda task, key=key, call=call: self._forget(key, call))
+                picks.append(call.task)
+            # Stop the shared work once nothing is interested in any of its keys
+            _cancel_when_abandoned(shared, picks)
+
+        results = await asyncio.gather(*(self._wait(calls[key]) for key in keys))
+        return dict(zip(keys, results))
+
+    async def _wait(self, call: _Call) -> Any:
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        except asyncio.CancelledError:
+            if call.waiters == 1 and not call.task.done():
+                call.task.cancel()
+            raise
+        finally:
+            call.waiters -= 1
+
+    def _forget(self, key: Hashable, call: _Call) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+
+async def _pick(shared: "asyncio.Future", key: Hashable) -> Any:
+    results = await asyncio.shield(shared)
+    return results[key]
+
+
+def _cancel_when_abandoned(shared: "asyncio.Future", picks: List["asyncio.Task"]) -> None:
+    remaining = {'count': len(picks)}
+
+    def on_pick_done(task: "asyncio.Task") -> None:
+        remaining['count'] -= 1
+        if remaining['count'] == 0 and not shared.done():
+            shared.cancel()
+
+    for pick in picks:
+        pick.add_done_callback(on_pick_done)
+
+
+def _kind(key: Hashable) -> str:
+    """Metric label for a key: its first element when it is a tuple like ('review', ...)."""
+    if isinstance(key, tuple) and key:
+        return str(key[0])
+    return 'other'
@@ -0,0 +1,58 @@
+import asyncio
+
+import document_extraction
+from document_extraction import DocumentExtractor
+
+URL = 'https://storage.googleapis.com/bucket/resume.txt?token=secret'
+
+
+class FakeResponse:
+    def __init__(self, status_code, body=b'', etag=None):
+        self.status_code = status_code
+        self.body = body
+        self.headers = {'ETag': etag} if etag else {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def iter_content(self, size):
+        yield self.body
+
+
+class FakeStorage:
+    """Serves one text file with an ETag and honours If-None-Match."""
+
+    def __init__(self, body, etag):
+        self.body = body
+        self.etag = etag
+        self.requests = []
+
+    def get(self, url, headers=None, **kwargs):
+        self.requests.append(dict(headers or {}))
+        if (headers or {}).get('If-None-Match') == self.etag:
+            return FakeResponse(304)
+        return FakeResponse(200, self.body, self.etag)
+
+
+def test_unchanged_files_are_not_downloaded_again(tmp_path, monkeypatch):
+    storage = FakeStorage(b'Ten years of Python', '"v1"')
+    monkeypatch.setattr(document_extraction.requests, 'get', storage.get)
+
+    async def scenario():
+        extractor = DocumentExtractor(cache_dir=str(tmp_path))
+        first = await extractor.extract_url(URL)
+        second = await extractor.extract_url(URL)
+        storage.body, storage.etag = b'Now with Rust', '"v2"'
+        third = await extractor.extract_url(URL)
+        return extractor, first, second, third
+
+    extractor, first, second, third = asyncio.run(scenario())
+    assert (first, second, third) == ('Ten years of Python', 'Ten years of Python', 'Now with Rust')
+    assert storage.requests == [{}, {'If-None-Match': '"v1"'}, {'If-None-Match': '"v1"'}]
+    assert extractor.stats['not_modified'] == 1
+    assert extractor.stats['extracted'] == 2
+    # The download token never reaches the disk
+    assert 'secret' not in ''.join(path.name for path in tmp_path.rglob('*'))
@@ -0,0 +1,83 @@
+import asyncio
+
+import pytest
+
+from llm_resilience import CircuitBreaker, CircuitOpenError, ResilientCaller
+
+
+def make_caller() -> ResilientCaller:
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.01)
+    return ResilientCaller(timeout=1, max_retries=0, hedge_percentile=0, breaker=breaker)
+
+
+async def fail():
+    raise ValueError("boom")
+
+
+async def succeed():
+    return 'ok'
+
+
+def test_cancelled_half_open_trial_releases_the_breaker():
+    async def scenario():
+        caller = make_caller()
+        with pytest.raises(ValueError):
+            await caller.call(fail)
+        assert caller.breaker.state == 'open'
+
+        await asyncio.sleep(0.02)
+        hang = asyncio.Event()
+        trial = asyncio.ensure_future(caller.call(hang.wait))
+        await asyncio.sleep(0.01)
+        assert caller.breaker.state == 'half_open'
+        trial.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await trial
+
+        # The next call becomes the trial instead of being rejected forever
+        assert await caller.call(succeed) == 'ok'
+        assert caller.breaker.state == 'closed'
+
+    asyncio.run(scenario())
+
+
+def test_calls_are_rejected_while_a_trial_is_in_flight():
+    async def scenario():
+        caller = make_caller()
+        with pytest.raises(ValueError):
+            await caller.call(fail)
+        await asyncio.sleep(0.02)
+
+        hang = asyncio.Event()
+        trial = asyncio.ensure_future(caller.call(hang.wait))
+        await asyncio.sleep(0)
+        with pytest.raises(CircuitOpenError):
+            await caller.call(succeed)
+        hang.set()
+        await trial
+        assert caller.breaker.state == 'closed'
+
+    asyncio.run(scenario())
+
+
+def test_hedge_is_skipped_when_quota_would_have_to_wait():
+    async def scenario():
+        caller = ResilientCaller(timeout=1, max_retries=0, hedge_percentile=50, hedge_min_samples=1)
+        caller.latencies.record(0.01)
+        sent = []
+
+        async def slow():
+            sent.append(1)
+            await asyncio.sleep(0.05)
+            return 'ok'
+
+        assert await caller.call(slow, admit_now=lambda: False) == 'ok'
+        assert len(sent) == 1
+        assert caller.stats['hedges_skipped'] == 1
+
+        sent.clear()
+        assert await caller.call(slow, admit_now=lambda: True) == 'ok'
+        assert len(sent) == 2
+        assert caller.stats['hedges'] == 1
+
+    asyncio.run(scenario())
@@ -0,0 +1,11 @@
+from metrics import Registry, stats_collector
+
+
+def test_registering_a_component_again_replaces_its_collector():
+    registry = Registry()
+    registry.register_collector(stats_collector('review_cache', 'LLM review cache', lambda: {'hits': 1}))
+    registry.register_collector(stats_collector('review_cache', 'LLM review cache', lambda: {'hits': 5}))
+
+    output = registry.render()
+    assert output.count('# TYPE review_cache_hits_total counter') == 1
+    assert 'review_cache_hits_total 5' in output
@@ -0,0 +1,73 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+os.environ.setdefault("GEMINI_API_KEY", "test")
+
+import llm_service
+from llm_service import GeminiService
+
+
+class FakeResponse:
+    def __init__(self, text: str):
+        self.text = text
+        self.usage_metadata = None
+
+
+class FakeModel:
+    """Answers single and packed prompts with a fixed rating, or raises."""
+
+    def __init__(self, rating: int = None, error: Exception = None):
+        self.rating = rating
+        self.error = error
+        self.calls = 0
+
+    async def generate_content_async(self, prompt, generation_config=None):
+        self.calls += 1
+        if self.error is not None:
+            raise self.error
+        ids = [line.split(': ', 1)[1] for line in prompt.splitlines() if line.startswith('Application ID: ')]
+        if ids:
+            return FakeResponse(json.dumps([{'id': i, 'rating': self.rating, 'comment': 'packed'} for i in ids]))
+        return FakeResponse(json.dumps({'rating': self.rating, 'comment': 'single'}))
+
+
+@pytest.fixture
+def service(monkeypatch):
+    monkeypatch.setattr(llm_service, 'GEMINI_MODEL_TIERS', ['cheap', 'strong'])
+    gemini = GeminiService()
+    for caller in gemini.callers.values():
+        caller.max_retries = 0
+    return gemini
+
+
+def test_failed_strong_tier_keeps_the_cheap_review(service):
+    cheap, strong = FakeModel(rating=6), FakeModel(error=ValueError("down"))
+    service.models = {'cheap': cheap, 'strong': strong}
+    prompt = service.prepare_position('Engineer', 'Builds things', [])
+
+    review = asyncio.run(service.review_application(prompt, 'Experience: some'))
+
+    assert (review['rating'], review['tier']) == (6, 'cheap')
+    assert strong.calls == 1
+    assert service.cascade_stats['kept_lower_tier'] == 1
+
+
+def test_failed_strong_tier_keeps_the_cheap_packed_reviews(service):
+    cheap, strong = FakeModel(rating=5), FakeModel(error=ValueError("down"))
+    service.models = {'cheap': cheap, 'strong': strong}
+    prompt = service.prepare_position('Engineer', 'Builds things', [])
+
+    reviews = asyncio.run(service.review_pack(prompt, [('a', 'Experience: a'), ('b', 'Experience: b')]))
+
+    assert {app_id: (review['rating'], review['tier']) for app_id, review in reviews.items()} == {
+        'a': (5, 'cheap'), 'b': (5, 'cheap')
+    }
+    assert cheap.calls == 1
+
+
+def test_each_tier_has_its_own_breaker(service):
+    assert service.callers['cheap'] is not service.callers['strong']
+    assert service.callers['cheap'].breaker is not service.callers['strong'].breaker
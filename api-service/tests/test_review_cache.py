@@ -0,0 +1,38 @@
+import asyncio
+import threading
+
+from review_cache import ReviewCache
+
+
+def test_sqlite_reads_and_writes_stay_off_the_event_loop(tmp_path):
+    path = str(tmp_path / 'reviews.db')
+    review = {'rating': 8, 'comment': 'Strong fit'}
+
+    writer = ReviewCache(sqlite_path=path)
+    writer.set('key', review)
+    # Writes are queued on the cache thread; wait for them before reopening the file
+    writer._executor.shutdown(wait=True)
+
+    async def scenario():
+        reader = ReviewCache(sqlite_path=path)
+        loop_thread = threading.current_thread()
+        read_threads = []
+        read = reader._get_persisted
+
+        def record_thread(key):
+            read_threads.append(threading.current_thread())
+            return read(key)
+        reader._get_persisted = record_thread
+
+        first = await reader.get('key')
+        second = await reader.get('key')
+        missing = await reader.get('other')
+        return reader, loop_thread, read_threads, first, second, missing
+
+    reader, loop_thread, read_threads, first, second, missing = asyncio.run(scenario())
+    assert first == second == review
+    assert missing is None
+    # The second lookup was a memory hit; the others went to SQLite on the cache thread
+    assert len(read_threads) == 2
+    assert loop_thread not in read_threads
+    assert reader.stats() == {'size': 1, 'hits': 2, 'misses': 1}
@@ -0,0 +1,176 @@
+import asyncio
+import datetime
+from types import SimpleNamespace
+
+from bench.fake_firestore import FakeFirestoreClient, seed_positions
+from firebase.async_firestore_service import AsyncFirestoreService
+from firebase.firestore_service import FirestoreService
+from models import ReviewJobRequest
+from review_jobs import ReviewJobManager
+
+
+def in_seconds(seconds: float) -> datetime.datetime:
+    return datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=seconds)
+
+
+def make_service(jobs) -> FirestoreService:
+    client = FakeFirestoreClient()
+    for job_id, job in jobs.items():
+        client.seed(f"reviewJobs/{job_id}", job)
+    return FirestoreService(client)
+
+
+def stored_job(service: FirestoreService, job_id: str):
+    return service.db.collection('reviewJobs').document(job_id).get().to_dict()
+
+
+def test_claim_respects_live_leases_of_other_owners():
+    service = make_service({
+        'live': {'status': 'running', 'leaseOwner': 'other', 'leaseExpiresAt': in_seconds(60)},
+        'expired': {'status': 'running', 'leaseOwner': 'other', 'leaseExpiresAt': in_seconds(-1)},
+        'mine': {'status': 'queued', 'leaseOwner': 'me', 'leaseExpiresAt': in_seconds(60)},
+        'done': {'status': 'completed'},
+    })
+
+    assert service.claim_review_job('live', 'me', 30) is None
+    assert service.claim_review_job('done', 'me', 30) is None
+    assert service.claim_review_job('missing', 'me', 30) is None
+    assert service.claim_review_job('expired', 'me', 30)['leaseOwner'] == 'me'
+    assert service.claim_review_job('mine', 'me', 30)['id'] == 'mine'
+
+    assert stored_job(service, 'live')['leaseOwner'] == 'other'
+    assert stored_job(service, 'expired')['leaseOwner'] == 'me'
+    assert stored_job(service, 'expired')['leaseExpiresAt'] > in_seconds(20)
+
+
+def test_renewal_fails_once_another_owner_took_over():
+    service = make_service({'job': {'status': 'running'}})
+    assert service.claim_review_job('job', 'me', 30) is not None
+    assert service.renew_review_job_lease('job', 'me', 30)
+
+    service.update_review_job('job', {'leaseOwner': 'other', 'leaseExpiresAt': in_seconds(60)})
+    assert not service.renew_review_job_lease('job', 'me', 30)
+    assert stored_job(service, 'job')['leaseOwner'] == 'other'
+
+
+def test_claim_retries_when_the_job_changes_mid_transaction():
+    service = make_service({'job': {'status': 'queued'}})
+    client = service.db
+    commit = type(client.transaction())._commit
+    attempts = []
+
+    def racing_commit(transaction):
+        attempts.append(transaction._id)
+        if len(attempts) == 1:
+            # Another instance takes the lease between our read and commit
+            client.collection('reviewJobs').document('job').set(
+                {'leaseOwner': 'other', 'leaseExpiresAt': in_seconds(60)}, merge=True
+            )
+        commit(transaction)
+
+    transaction = client.transaction()
+    transaction._commit = lambda: racing_commit(transaction)
+    client.transaction = lambda: transaction
+
+    assert service.claim_review_job('job', 'me', 30) is None
+    assert len(attempts) == 2
+    assert stored_job(service, 'job')['leaseOwner'] == 'other'
+
+
+def test_only_jobs_with_expired_leases_are_resumed():
+    async def scenario():
+        service = make_service({
+            'live': {'status': 'running', 'leaseOwner': 'other', 'leaseExpiresAt': in_seconds(60)},
+            'expired': {'status': 'running', 'leaseOwner': 'other', 'leaseExpiresAt': in_seconds(-1)},
+            'never-leased': {'status': 'queued'},
+            'done': {'status': 'completed'},
+        })
+        manager = ReviewJobManager(AsyncFirestoreService(service, pool_size=2), pipeline=None,
+                                   workers=1, lease_seconds=10, owner='me')
+        ran = []
+
+        async def run_job(job_id):
+            ran.append(job_id)
+        manager._run_job = run_job
+
+        await manager.start()
+        await asyncio.sleep(0.1)
+        await manager.stop()
+        return service, ran
+
+    service, ran = asyncio.run(scenario())
+    assert sorted(ran) == ['expired', 'never-leased']
+    assert stored_job(service, 'live')['leaseOwner'] == 'other'
+    assert stored_job(service, 'expired')['leaseOwner'] == 'me'
+
+
+def test_losing_the_lease_stops_the_job():
+    async def scenario():
+        service = make_service({'job': {'status': 'queued'}})
+        manager = ReviewJobManager(AsyncFirestoreService(service, pool_size=2), pipeline=None,
+                                   workers=1, lease_seconds=0.06, owner='me')
+        cancelled = asyncio.Event()
+
+        async def run_job(job_id):
+            service.update_review_job(job_id, {'leaseOwner': 'other', 'leaseExpiresAt': in_seconds(60)})
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+        manager._run_job = run_job
+
+        await asyncio.wait_for(manager._run_leased('job'), timeout=2)
+        return manager, cancelled
+
+    manager, cancelled = asyncio.run(scenario())
+    assert cancelled.is_set()
+    assert 'job' not in manager._jobs
+
+
+class StubPipeline:
+    """Rates every application 7, except that it fails one and shortlists another out."""
+
+    ranker = None
+
+    async def build_batch(self, request, position, applications, reviews, strict=True):
+        batch = SimpleNamespace(applications=applications, failed={}, filtered={})
+        for app in applications:
+            if app.id == 'app-00001':
+                batch.failed[app.id] = "LLM error"
+            elif app.id == 'app-00002':
+                batch.filtered[app.id] = 0.1
+        return batch
+
+    async def run(self, batch):
+        return [SimpleNamespace(name=app.id, rating=7) for app in batch.applications
+                if app.id not in batch.filtered]
+
+
+def test_outcomes_are_stored_per_application_and_paged():
+    async def scenario():
+        client = FakeFirestoreClient()
+        position_id = seed_positions(client, positions=1, applications_per_position=7)[0]
+        service = FirestoreService(client)
+        manager = ReviewJobManager(AsyncFirestoreService(service, pool_size=2), StubPipeline(),
+                                   workers=1, page_size=3, owner='me')
+        job_id = await manager.submit(ReviewJobRequest(position_id=position_id))
+        await manager.start()
+        await asyncio.wait_for(manager._queue.join(), timeout=2)
+        await manager.stop()
+
+        first = await manager.get_status(job_id, limit=4)
+        second = await manager.get_status(job_id, limit=4, cursor=first.next_cursor)
+        return stored_job(service, job_id), first, second
+
+    job, first, second = asyncio.run(scenario())
+    assert job['status'] == 'completed'
+    assert (job['processed'], job['reviewed'], job['failed'], job['filteredOut']) == (7, 5, 1, 1)
+    assert not {'results', 'failures', 'filtered'} & set(job)
+
+    assert first.failures == {'app-00001': "LLM error"}
+    assert first.filtered == {'app-00002': 0.1}
+    assert first.results == {'app-00000': 7, 'app-00003': 7}
+    assert first.next_cursor == 'app-00003'
+    assert second.results == {'app-00004': 7, 'app-00005': 7, 'app-00006': 7}
+    assert second.next_cursor is None